@@ -31,6 +31,7 @@ setup(
     entry_points={
         'console_scripts': [
             'numiac=vm.compiler.numiac:main',
+            'numiac-client=vm.compiler.client:main',
         ],
     },
 )
@@ -1,5 +1,6 @@
 #!/bin/bash
 # Quick test of compiler only (no build needed)
+set -e
 
 echo "Testing Python Compiler..."
 echo ""
@@ -23,5 +24,854 @@ for token in tokens[:5]:
     print(f"  {token.type.name}: {token.value}")
 EOF
 
+# Table-driven lexer must match the reference tokenizer
+python3 << 'EOF'
+from vm.compiler.lexer import Lexer
+
+code = """
+# comment
+env name << "a \\"quoted\\" \\n value"
+env ratio << 1.5 * (x + 0x1F) <= 3 && y != 2
+output('multi
+line')
+"""
+
+assert Lexer(code).tokenize() == Lexer(code).tokenize_chars()
+print("✓ Lexer: tokenize() matches tokenize_chars()")
+
+assert list(Lexer(code).iter_tokens()) == Lexer(code).tokenize()
+print("✓ Lexer: iter_tokens() matches tokenize()")
+
+lexer = Lexer(code)
+lexer.tokenize()
+lexer.relex(code.index("1.5"), 3, "(2.5\n  + 1)")
+assert lexer.tokens == Lexer(lexer.source).tokenize()
+print("✓ Lexer: relex() matches tokenize() after an edit")
+EOF
+
+# Optimizer: folding, unreachable code and dead stores
+python3 << 'EOF'
+from vm.compiler.compiler import Compiler
+from vm.compiler.opcodes import Opcode
+
+code = """
+env unused << 1
+area module main() open
+    env x << (2 + 3) * 4 - 20 / 3
+    if false do
+        output("never")
+    end
+    output(x + 0)
+    back
+    output("unreachable")
+close
+"""
+
+plain = Compiler(code).compile()
+optimized = Compiler(code, opt_level=1).compile()
+assert optimized.instruction_count() < plain.instruction_count()
+assert 14 in optimized.constants and "never" not in optimized.constants
+assert "unreachable" not in optimized.constants and "unused" not in optimized.variables
+assert Opcode.JMP_IFNOT not in optimized.code
+print(f"✓ Optimizer: {plain.instruction_count()} -> {optimized.instruction_count()} instructions at -O1")
+
+constants = Compiler("env a << 1 + 1.0 + 1 + 1.0\nenv b << true == true\n").compile().constants
+assert constants == [1, 1.0, True] and [type(c) for c in constants] == [int, float, bool]
+print("✓ Constant pool: duplicates shared, 1 / 1.0 / true kept apart")
+
+loop = """
+area module main() open
+    env i << 0
+    env total << 0
+    while (i < 100) do
+        env total << total + i
+        env i << i + 1
+    end
+    output(total)
+close
+"""
+plain = Compiler(loop).compile()
+fused = Compiler(loop, opt_level=1).compile()
+assert Opcode.INC_VAR in fused.code and Opcode.JMP_IFNOT_LT in fused.code
+assert fused.instruction_count() < plain.instruction_count() and fused.functions == {'main': 0}
+print(f"✓ Peephole: loop {plain.instruction_count()} -> {fused.instruction_count()} instructions with superinstructions")
+EOF
+
+# Multi-megabyte program: 32-bit jump targets, one byte per byte of code
+python3 << 'EOF'
+import sys
+from vm.compiler.compiler import Compiler
+from vm.compiler.bytecode import iter_instructions
+from vm.compiler.opcodes import Opcode
+
+chunk = """    env x << 0
+    while (x < 3) do
+        if x == 1 do
+            output("one")
+        else do
+            output(x * 2 + 1)
+        end
+        env x << x + 1
+    end
+"""
+source = "area module main() open\n" + chunk * 12000 + "close\n"
+bytecode = Compiler(source).compile()
+code = bytecode.code
+instructions = list(iter_instructions(code))
+previous = {offset: instructions[i - 1][1] for i, (offset, _, _) in enumerate(instructions) if i}
+targets = [(offset, op, args[-1]) for offset, op, args in instructions
+           if op in (Opcode.JMP, Opcode.JMP_IFNOT)]
+for offset, op, target in targets:
+    if op == Opcode.JMP_IFNOT:
+        assert target > offset and previous[target] == Opcode.JMP  # Else branch / loop exit
+    else:
+        assert code[target] == Opcode.LOAD_VAR  # Loop head / `env x << x + 1`
+assert max(target for _, _, target in targets) > 0xFFFF
+assert sys.getsizeof(code) < 2 * len(code)
+print(f"✓ Large program: {len(source) / 1e6:.1f} MB source, {len(code) / 1e6:.1f} MB code, "
+      f"{len(targets)} jumps resolved")
+EOF
+
+# .numbc v2 container: round trip, mmap reader, legacy conversion
+python3 << 'EOF'
+import json, os, tempfile
+from vm.compiler.compiler import Compiler
+from vm.compiler.bytecode import Bytecode
+from vm.compiler import numbc
+
+code = """
+area module main() open
+    env x << 1
+    env y << 2.5 + x
+    env ok << true
+    output("héllo $x")
+close
+"""
+bytecode = Compiler(code).compile()
+with tempfile.TemporaryDirectory() as tmp:
+    path = os.path.join(tmp, "prog.numbc")
+    bytecode.to_file(path)
+    assert not os.path.exists(os.path.join(tmp, "prog.meta.json"))
+    loaded = Bytecode.from_file(path)
+    assert (loaded.code, loaded.variables, loaded.functions) == (bytecode.code, bytecode.variables, bytecode.functions)
+    assert [(type(c), c) for c in loaded.constants] == [(type(c), c) for c in bytecode.constants]
+    with numbc.NumbcImage.open(path) as image:
+        assert image.code.tobytes() == bytecode.code and image.constant(0) == bytecode.constants[0]
+    
+    legacy = os.path.join(tmp, "old.numbc")
+    with open(legacy, "wb") as f:
+        f.write(bytes(bytecode.code))
+    with open(os.path.join(tmp, "old.meta.json"), "w") as f:
+        json.dump({"version": 1, "constants": bytecode.constants, "variables": bytecode.variables,
+                   "functions": bytecode.functions}, f)
+    assert Bytecode.from_file(legacy).constants == bytecode.constants
+    numbc.convert_legacy(legacy)
+    converted = Bytecode.from_file(legacy)
+    assert loaded.positions and not converted.positions  # Old files have no line table
+    loaded.positions = []
+    assert converted.to_bytes() == loaded.to_bytes()
+
+# int64 is all a constant entry holds; wider literals are rejected where they are written
+try:
+    Compiler("area module main() open\n    output(99999999999999999999)\nclose\n").compile()
+    raise AssertionError("expected SyntaxError")
+except SyntaxError as e:
+    assert "line 2, column 12" in str(e) and "64 bits" in str(e), e
+try:
+    numbc.encode(b"", [1 << 63], {}, {})
+    raise AssertionError("expected NumbcError")
+except numbc.NumbcError as e:
+    assert "64 bits" in str(e), e
+print("✓ .numbc v2: round trip, mmap sections and legacy conversion")
+EOF
+
+# Compile cache: hits for unchanged sources, misses on new flags, LRU bound
+python3 << 'EOF'
+import contextlib, io, os, tempfile
+from vm.compiler.compiler import compile_file
+from vm.compiler.cache import CompileCache
+
+with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+    source = os.path.join(tmp, "prog.num")
+    with open(source, "w") as f:
+        f.write("area module main() open\n    output(1 + 2)\nclose\n")
+    output = os.path.join(tmp, "prog.numbc")
+    cache = CompileCache(os.path.join(tmp, "cache"))
+    first = compile_file(source, output, cache=cache)
+    again = compile_file(source, output, cache=cache)
+    compile_file(source, output, opt_level=1, cache=cache)
+    assert (cache.hits, cache.misses) == (1, 2) and again.code == first.code
+    
+    small = CompileCache(os.path.join(tmp, "cache"), max_bytes=1)
+    small.evict()
+    assert not small.entries() and small.evictions == 2
+print("✓ Compile cache: reuse, per-flag keys and LRU eviction")
+EOF
+
+# Batch compile: directories, -j workers, input-ordered output and exit code
+python3 << 'EOF'
+import os, subprocess, sys, tempfile
+
+with tempfile.TemporaryDirectory() as tmp:
+    os.makedirs(os.path.join(tmp, "src", "lib"))
+    for n in range(6):
+        with open(os.path.join(tmp, "src", "lib" if n % 2 else "", f"f{n}.num"), "w") as f:
+            f.write(f"area module main() open\n    output({n} * 2)\nclose\n")
+    with open(os.path.join(tmp, "src", "bad.num"), "w") as f:
+        f.write("area module main() open\n    output(\nclose\n")
+    
+    def numiac(*args):
+        return subprocess.run([sys.executable, "vm/compiler/numiac.py", "--no-cache", *args],
+                              capture_output=True, text=True)
+    serial = numiac("-j", "1", os.path.join(tmp, "src"))
+    parallel = numiac("-j", "3", os.path.join(tmp, "src"))
+    assert serial.returncode == parallel.returncode == 1
+    assert serial.stdout == parallel.stdout and "6 of 7 files compiled, 1 failed" in serial.stdout
+    assert "bad.num" in parallel.stderr and os.path.exists(os.path.join(tmp, "src", "lib", "f5.numbc"))
+    assert numiac(os.path.join(tmp, "src", "f0.num")).returncode == 0
+print("✓ Batch compile: -j output matches serial, failures reported")
+EOF
+
+# Separate compilation: libraries built to .numo only when changed, then linked
+python3 << 'EOF'
+import contextlib, io, os, tempfile
+from vm.compiler.compiler import compile_file
+from vm.compiler.bytecode import iter_instructions
+from vm.compiler.linker import LinkError
+from vm.compiler.opcodes import Opcode
+
+with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+    def write(name, text):
+        with open(os.path.join(tmp, name), "w") as f:
+            f.write(text)
+    write("mathlib.num", "env base << 40\nmodule double() open\n    output(base + 2)\nclose\n")
+    write("main.num", "import mathlib\nimport numium_stdio\nenv x << 5\n"
+                      "area module main() open\n    output(x)\n    double()\nclose\n")
+    main, output = os.path.join(tmp, "main.num"), os.path.join(tmp, "main.numbc")
+    unit = os.path.join(tmp, "mathlib.numo")
+    
+    program = compile_file(main, output)
+    calls = [args[0] for _, op, args in iter_instructions(program.code) if op == Opcode.CALL]
+    assert calls == [program.functions["double"]] and not program.external_calls
+    assert set(program.variables) == {"base", "x"} and {40, 2, 5} <= set(program.constants)
+    assert program.code[program.functions["double"] - 5] == Opcode.JMP  # Library code skips its modules
+    
+    built = os.stat(unit).st_mtime_ns
+    compile_file(main, output)
+    assert os.stat(unit).st_mtime_ns == built
+    write("mathlib.num", "module double() open\n    output(84)\nclose\n")
+    assert 84 in compile_file(main, output).constants
+    
+    write("mathlib.num", "module triple() open\n    output(3)\nclose\n")
+    try:
+        compile_file(main, output)
+        raise AssertionError("undefined module linked")
+    except LinkError as e:
+        assert "double" in str(e)
+print("✓ Linker: imports built once, calls resolved, undefined modules rejected")
+EOF
+
+# Register backend: three-address code, same results as the stack form
+python3 << 'EOF'
+import os, tempfile
+from vm.compiler.compiler import Compiler
+from vm.compiler.regcodegen import RegisterBytecode, disassemble
+from tools.bench_register import PROGRAMS, run_stack, run_register
+
+assert list(disassemble(Compiler("env a << 1\nenv b << a + 2\n", target="reg").compile().code)) == [
+    "0x0000: MOVE         r0, k0", "0x0005: ADD          r1, r0, k1", "0x000C: HALT"]
+
+for name, template in PROGRAMS.items():
+    source = template.format(n=200)
+    stack = Compiler(source, opt_level=1).compile()
+    registers = Compiler(source, opt_level=1, target="reg").compile()
+    (expected, stack_steps), (actual, register_steps) = run_stack(stack), run_register(registers)
+    assert actual == expected and register_steps < 0.6 * stack_steps, (name, stack_steps, register_steps)
+
+with tempfile.TemporaryDirectory() as tmp:
+    path = os.path.join(tmp, "prog.numbc")
+    registers.to_file(path)
+    loaded = RegisterBytecode.from_file(path)
+    assert (loaded.code, loaded.register_count) == (registers.code, registers.register_count)
+print(f"✓ Register backend: {registers.instruction_count()} vs {stack.instruction_count()} instructions, "
+      f"{register_steps} vs {stack_steps} dispatched")
+EOF
+
+# Call frames: module locals in LOAD_LOCAL/STORE_LOCAL slots, recursion, frame sizes
+python3 << 'EOF'
+import os, tempfile
+from vm.compiler.compiler import Compiler
+from vm.compiler.bytecode import Bytecode
+from tools.bench_register import run_stack
+
+code = """
+env n << 3
+module down() open
+    env mine << n
+    if n > 0 do
+        env n << n - 1
+        down()
+    end
+    output(mine)
+close
+area module main() open
+    down()
+close
+"""
+bytecode = Compiler(code, opt_level=1).compile()
+assert run_stack(bytecode)[0] == [0, 1, 2, 3]
+assert bytecode.variables == {"n": 0} and bytecode.frame_sizes == {"down": 1}
+with tempfile.TemporaryDirectory() as tmp:
+    path = os.path.join(tmp, "prog.numbc")
+    bytecode.to_file(path)
+    assert Bytecode.from_file(path).frame_sizes == {"down": 1}
+
+modules = "".join(f"module m{i}() open\n    env a << {i}\n    env b{i % 7} << a * 2\n    output(b{i % 7})\nclose\n"
+                  for i in range(2000))
+large = Compiler(modules).compile()
+assert not large.variables and max(large.frame_sizes.values()) == 2
+print(f"✓ Call frames: recursion keeps locals apart, {len(large.functions)} modules need no globals")
+EOF
+
+# Typed opcodes: env declarations and literal types pick ADD_INT, LT_FLOAT, ...
+python3 << 'EOF'
+from vm.compiler.compiler import Compiler
+from vm.compiler.bytecode import iter_instructions
+from vm.compiler.opcodes import Opcode, GENERIC_OPCODES
+from tools.bench_register import run_stack
+
+code = """
+area module main() open
+    env i int = 0
+    env total float = 0
+    env label << "n"
+    while (i < 5) do
+        env total << total * 1.5 + 2.0
+        env label << label + "!"
+        env i << i + 1
+    end
+    output(total)
+    output(label)
+close
+"""
+compiler = Compiler(code, opt_level=1)
+bytecode = compiler.compile()
+ops = [op for _, op, _ in iter_instructions(bytecode.code)]
+assert Opcode.MUL_FLOAT in ops and Opcode.ADD_FLOAT in ops
+assert Opcode.JMP_IFNOT_LT in ops and Opcode.INC_VAR in ops  # Still fused
+assert compiler.typed_ops == (4, 5)
+assert run_stack(bytecode)[0] == run_stack(Compiler(code).compile())[0] == [26.375, "n!!!!!"]
+assert not any(op in GENERIC_OPCODES for _, op, _ in iter_instructions(Compiler(code).compile().code))
+
+try:
+    Compiler("env x int = 2.5\n").compile()
+    raise AssertionError("int declared with a float value")
+except SyntaxError as e:
+    assert "declared int but assigned float" in str(e)
+print(f"✓ Typed opcodes: {compiler.typed_ops[0]} of {compiler.typed_ops[1]} operators typed")
+EOF
+
+# Range loops: FOR_RANGE_INIT/NEXT bind the counter, stop and continue jump
+python3 << 'EOF'
+from vm.compiler.compiler import Compiler
+from tools.bench_register import run_stack, run_register
+
+code = """
+env n << 10
+module sum() open
+    env total << 0
+    for (k) on range(n) do
+        if k == 3 do
+            continue
+        end
+        if k == 7 do
+            stop
+        end
+        env total << total + k
+    end
+    output(total)
+    output(k)
+close
+area module main() open
+    for (i) on range(3) do
+        for (j) on range(i) do
+            output(i * 10 + j)
+        end
+    end
+    output(i)
+    sum()
+close
+"""
+expected = [10, 20, 21, 3, 18, 7]
+for level in (0, 1, 2):
+    assert run_stack(Compiler(code, opt_level=level).compile())[0] == expected
+    assert run_register(Compiler(code, opt_level=level, target="reg").compile())[0] == expected
+
+# Loop overhead is one dispatch per iteration
+loop = "area module main() open\n    for (i) on range(%d) do\n    end\nclose\n"
+for target, run in (("stack", run_stack), ("reg", run_register)):
+    steps = [run(Compiler(loop % count, opt_level=1, target=target).compile())[1] for count in (1, 1001)]
+    assert steps[1] - steps[0] == 1000, (target, steps)
+
+for keyword in ("stop", "continue"):
+    try:
+        Compiler(f"area module main() open\n    {keyword}\nclose\n").compile()
+        raise AssertionError(f"{keyword} outside a loop")
+    except SyntaxError as e:
+        assert "outside a loop" in str(e)
+print("✓ Range loops: counter bound, stop/continue jump, one dispatch per iteration")
+EOF
+
+# Switch: dense int keys use TABLESWITCH, sparse or string keys LOOKUPSWITCH
+python3 << 'EOF'
+from vm.compiler.compiler import Compiler
+from vm.compiler.bytecode import iter_instructions
+from vm.compiler.opcodes import Opcode
+from vm.compiler.peephole import optimize_bytecode
+from vm.compiler.linker import link
+from tools.bench_register import run_stack, run_register
+
+code = """
+area module main() open
+    env name << "go"
+    for (i) on range(8) do
+        switch i - 1 do
+            case -1 do
+                output("start")
+            case 0, 1 do
+                output(i)
+            case 3 do
+                continue
+            case 5 do
+                stop
+            else do
+                output("other")
+        end
+        switch i * 1000 do
+            case 2000 do
+                output("2k")
+            case 4000 do
+                output("4k")
+        end
+        switch name do
+            case "go" do
+                env name << "stay"
+            case "stay" do
+                env name << "go"
+        end
+        switch i / 2.0 do
+            case 1.5 do
+                output(1.5)
+            case true do
+                output("never")
+        end
+    end
+    output(name)
+close
+"""
+expected = ["start", 1, 2, "2k", "other", 1.5, "other", "stay"]
+for level in (0, 1, 2):
+    bytecode = Compiler(code, opt_level=level).compile()
+    assert run_stack(bytecode)[0] == expected, run_stack(bytecode)[0]
+    assert run_register(Compiler(code, opt_level=level, target="reg").compile())[0] == expected
+ops = [op for _, op, _ in iter_instructions(bytecode.code)]
+assert ops.count(Opcode.TABLESWITCH) == 1 and ops.count(Opcode.LOOKUPSWITCH) == 2
+assert ops.count(Opcode.DUP) == 2  # The float/bool switch is a compare chain
+
+# A 64-arm state machine dispatches in one instruction per switch
+arms = "".join(f"            case {k} do\n                env state << {(k * 7 + 1) % 64}\n" for k in range(64))
+machine = ("area module main() open\n    env state << 0\n    for (i) on range(%d) do\n"
+           "        switch state do\n" + arms + "        end\n    end\n    output(state)\nclose\n")
+# Per iteration: FOR_RANGE_NEXT, (LOAD_VAR,) the switch, the store and the JMP out of the arm
+for target, run, per_iteration in (("stack", run_stack, 5), ("reg", run_register, 4)):
+    steps = [run(Compiler(machine % count, opt_level=1, target=target).compile())[1] for count in (1, 101)]
+    assert steps[1] - steps[0] == 100 * per_iteration, (target, steps)
+
+# Tables survive the peephole pass and linking (constant keys remapped)
+library = Compiler(code, opt_level=1, library=True).compile()
+assert optimize_bytecode(library)
+prefix = Compiler('area module pre() open\n    output("x")\nclose\n', library=True).compile()
+assert run_stack(link([("prefix", prefix), ("lib", library)]))[0] == ["x"] + expected
+
+try:
+    Compiler("area module main() open\n    switch 1 do\n        case 2 do\n        case 2 do\n    end\nclose\n").compile()
+    raise AssertionError("duplicate case value")
+except SyntaxError as e:
+    assert "Duplicate case value" in str(e)
+print("✓ Switch: TABLESWITCH, LOOKUPSWITCH and compare chain agree across -O levels and targets")
+EOF
+
+# numiac --stats: phase timings and code statistics, as text or JSON
+python3 << 'EOF'
+import json, os, subprocess, sys, tempfile
+from vm.compiler.compiler import Compiler
+from vm.compiler.stats import code_stats, stats_report
+
+code = "module twice() open\n    output(2)\n    output(2)\nclose\narea module main() open\n    twice()\nclose\n"
+compiler = Compiler(code, opt_level=1)
+bytecode = compiler.compile()
+assert list(compiler.stats.phases) == ["lex", "parse", "optimize", "emit", "peephole"]
+report = stats_report(compiler.stats, bytecode)
+assert report["tokens"] == len(compiler.tokens)
+assert report["opcodes"]["OUTPUT"] == 2 and report["instructions"] == sum(report["opcodes"].values())
+assert sum(report["functions"].values()) == len(bytecode.code) and set(report["functions"]) == {"main", "twice"}
+assert report["constants"] == 1
+
+with tempfile.TemporaryDirectory() as tmp:
+    source = os.path.join(tmp, "twice.num")
+    with open(source, "w") as f:
+        f.write(code)
+    result = subprocess.run([sys.executable, "vm/compiler/numiac.py", "--no-cache", "-O1", "--stats=json",
+                             source, os.path.join(tmp, "missing.num")], capture_output=True, text=True)
+    document = json.loads(result.stdout)
+    assert result.returncode == 1
+    ok, missing = document["files"]
+    assert ok["ok"] and ok["opcodes"] == report["opcodes"] and ok["peak_memory_bytes"] > 0
+    assert {"read", "lex", "write"} <= set(ok["phases_ms"]) and not missing["ok"]
+print(f"✓ Compile stats: {len(report['opcodes'])} opcodes, phases {', '.join(report['phases_ms'])}")
+EOF
+
+# Benchmark corpus: deterministic, exact line counts, compiles; the harness compares runs
+python3 << 'EOF'
+import sys
+sys.path.insert(0, "tools")
+from gen_corpus import generate
+from bench_compile import measure, compare
+from vm.compiler.compiler import Compiler
+
+for lines, seed in ((3, 0), (40, 1), (2000, 7)):
+    source = generate(lines, seed)
+    assert source.count("\n") == lines and source == generate(lines, seed)
+    Compiler(source, opt_level=1).compile()
+    Compiler(source, opt_level=1, target="reg").compile()
+assert generate(2000, 1) != generate(2000, 2)
+corpus = generate(2000)
+assert all(word in corpus for word in ("module ", "while (", "for (", "if ", "else ", "switch "))
+
+size = measure(500, seed=0, repeat=1, opt_level=0, target="stack")
+assert size["lines"] == 500 and size["tokens"] > 0 and size["compile"]["lines_per_s"] > 0
+old = {"sizes": [size]}
+slower = dict(size, compile=dict(size["compile"], lines_per_s=size["compile"]["lines_per_s"] // 2))
+assert compare(old, old, 0.1) == 0 and compare(old, {"sizes": [slower]}, 0.1) == 1
+print(f"✓ Benchmark corpus: 500 lines compile at {size['compile']['lines_per_s']} lines/s")
+EOF
+
+# Python VM: same output at every -O level and target, file round trip, errors
+python3 << 'EOF'
+import io, os, subprocess, sys, tempfile
+sys.path.insert(0, "tools")
+from bench_register import PROGRAMS
+from vm.compiler.bytecode import Bytecode
+from vm.compiler.compiler import Compiler
+from vm.pyvm import VM, VMError, load_bytecode, run_file
+
+def run(source, opt_level=0, target="stack"):
+    output = io.StringIO()
+    VM(Compiler(source, opt_level=opt_level, target=target).compile(), output=output).run()
+    return output.getvalue()
+
+def same_everywhere(source):
+    outputs = {run(source, level, target) for level in (0, 1, 2) for target in ("stack", "reg")}
+    assert len(outputs) == 1, outputs
+    return outputs.pop()
+
+for template in PROGRAMS.values():
+    assert same_everywhere(template.format(n=300))
+
+# The callee's locals and loop limits must not share registers with the caller's
+windows = """module inner() open
+    env t << 5
+    for (k) on range(3) do
+        env t << t + k
+    end
+    output(t)
+close
+module outer() open
+    env n << 0
+    while (n < 3) do
+        for (j) on range(2) do
+            inner()
+            output(n * 10 + j)
+        end
+        env n << n + 1
+    end
+close
+area module main() open
+    outer()
+close
+"""
+assert same_everywhere(windows) == "".join(f"8{n * 10 + j}" for n in range(3) for j in range(2))
+
+# setter's t is its own local; reader's t is a global nobody stores, so -O2 must not fold one into the other
+scopes = """module setter() open
+    env t << 2.5
+    output(t)
+close
+module reader() open
+    env u << t * 2
+    output(u)
+    output(t == 2.5)
+close
+area module main() open
+    setter()
+    reader()
+close
+"""
+assert same_everywhere(scopes) == "2.500000nullfalse"
+
+switch = """area module main() open
+    for (i) on range(6) do
+        switch (i) do
+            case 0 do
+                output("a")
+            case 2 do
+                output(2.5 / 2)
+            case 40 do
+                output("far")
+        end
+        output(i == 3)
+    end
+close
+"""
+assert same_everywhere(switch) == "afalsefalse1.250000falsetruefalsefalse"
+assert run('area module main() open\n    output(7 / 0)\nclose\n') == "null"
+
+with tempfile.TemporaryDirectory() as tmp:
+    source = os.path.join(tmp, "switch.num")
+    with open(source, "w") as f:
+        f.write(switch)
+    output = io.StringIO()
+    vm = run_file(source, output=output, opt_level=2, target="reg")
+    assert output.getvalue() == same_everywhere(switch)
+    filename = os.path.join(tmp, "switch.numbc")
+    Compiler(switch, opt_level=1).compile().to_file(filename)
+    output = io.StringIO()
+    VM.from_file(filename, output=output).run()
+    assert output.getvalue() == same_everywhere(switch)
+    
+    # Imports link in memory: no .numo written, nothing printed but the program's output
+    with open(os.path.join(tmp, "mathlib.num"), "w") as f:
+        f.write("module square() open\n    output(n * n)\nclose\n")
+    with open(os.path.join(tmp, "uses.num"), "w") as f:
+        f.write("import mathlib\nenv n << 6\narea module main() open\n    square()\nclose\n")
+    with open(os.path.join(tmp, "bad.num"), "w") as f:
+        f.write("area module main() open\n    output(1 +)\nclose\n")
+    ran = subprocess.run([sys.executable, "-m", "vm.pyvm", os.path.join(tmp, "uses.num")],
+                         stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    assert (ran.returncode, ran.stdout, ran.stderr) == (0, "36", ""), ran
+    assert not [name for name in os.listdir(tmp) if name.endswith(".numo")]
+    ran = subprocess.run([sys.executable, "-m", "vm.pyvm", os.path.join(tmp, "bad.num")],
+                         stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    assert ran.returncode == 1 and ran.stderr.startswith("Error: Compiler error at line 2, column 15"), ran
+
+for bytecode, message in ((Compiler("area module main() open\n    helper()\nclose\n").compile(), "Unlinked call"),
+                          (Bytecode(), None)):
+    if message is None:
+        bytecode.code += bytes([0xEE])
+        message = "Unknown opcode 0xEE"
+    try:
+        VM(bytecode)
+        raise AssertionError("expected VMError")
+    except VMError as e:
+        assert message in str(e), e
+print(f"✓ Python VM: {len(PROGRAMS)} benchmark programs and call windows agree across -O levels and targets")
+EOF
+# In-memory compile: no files, no output, structured errors, full artifact as bytes
+python3 << 'EOF'
+import builtins, contextlib, gc, io
+from vm.compiler import Bytecode, CompileError, CompileOptions, compile_source
+from vm.compiler.regcodegen import RegisterBytecode
+from vm.pyvm import VM
+
+def no_files(*args, **kwargs):
+    raise AssertionError(f"open{args}")
+
+def no_gc_switch():
+    raise AssertionError("compile_source changed the process-wide gc state")
+
+program = "import mathlib\nenv n << 6\narea module main() open\n    square()\nclose\n"
+library = "module square() open\n    output(n * n)\nclose\n"
+printed = io.StringIO()
+real_open, builtins.open = builtins.open, no_files
+real_disable, gc.disable = gc.disable, no_gc_switch
+try:
+    with contextlib.redirect_stdout(printed):
+        bytecode = compile_source(program, CompileOptions(opt_level=1, libraries={"mathlib": library}))
+        register = compile_source("area module main() open\n    output(2 * 21)\nclose\n",
+                                  CompileOptions(target="reg"))
+        data = bytecode.to_bytes()
+        loaded = Bytecode.from_bytes(data)
+        errors = []
+        for source, options in (("area module main() open\n    output(1 +)\nclose\n", None),
+                                ("area module main() open\n    output(\"x)\nclose\n", None),
+                                ("area module main() open\n    stop\nclose\n", None),
+                                ('env x << "abc\\', None),
+                                ("area module main() open\n    nope()\nclose\n", CompileOptions(target="reg")),
+                                (program, CompileOptions()),
+                                (program, CompileOptions(libraries={"mathlib": "module square( open\n"}))):
+            try:
+                compile_source(source, options)
+            except CompileError as e:
+                errors.append((e.phase, e.unit, e.line, e.column))
+                assert not e.reason.startswith(("Lexer error", "Compiler error")), e.reason
+finally:
+    builtins.open = real_open
+    gc.disable = real_disable
+assert printed.getvalue() == ""
+assert errors == [("parse", None, 2, 15), ("lex", None, 4, 1), ("emit", None, 2, 5), ("lex", None, 1, 15),
+                  ("emit", None, 2, 5),
+                  ("link", None, None, None), ("parse", "mathlib", 1, 16)], errors
+
+assert loaded.to_bytes() == data and loaded.frame_sizes == bytecode.frame_sizes
+assert (loaded.variables, loaded.functions, loaded.constants) == (bytecode.variables, bytecode.functions, bytecode.constants)
+output = io.StringIO()
+VM(loaded, output=output).run()
+assert output.getvalue() == "36"
+again = RegisterBytecode.from_bytes(register.to_bytes())
+assert again.register_count == register.register_count and again.code == register.code
+for blob, kind in ((register.to_bytes(), Bytecode), (data, RegisterBytecode), (b"NUMB", Bytecode)):
+    try:
+        kind.from_bytes(blob)
+        raise AssertionError("expected NumbcError")
+    except ValueError:
+        pass
+print(f"✓ In-memory compile: {len(data)}-byte artifact round-trips, {len(errors)} structured errors, no I/O")
+EOF
+# numiac --serve: warm compile server, concurrent clients, restart on compiler change
+python3 << 'EOF'
+import contextlib, io, os, subprocess, sys, tempfile, time
+from concurrent.futures import ThreadPoolExecutor
+from vm.compiler.client import compile_request, request
+from vm.compiler.client import main as client_main
+
+def wait_for(path, present=True):
+    for _ in range(200):
+        if os.path.exists(path) == present:
+            return
+        time.sleep(0.05)
+    raise AssertionError(f"{path} {'never appeared' if present else 'was not removed'}")
+
+with tempfile.TemporaryDirectory() as tmp:
+    socket_path = os.path.join(tmp, "numiac.sock")
+    server = subprocess.Popen([sys.executable, "vm/compiler/numiac.py", "--serve", "--socket", socket_path],
+                              stderr=subprocess.PIPE, universal_newlines=True)
+    try:
+        wait_for(socket_path)
+        sources = []
+        for n in range(6):
+            sources.append(os.path.join(tmp, f"p{n}.num"))
+            with open(sources[-1], "w") as f:
+                f.write(f"area module main() open\n    output({n} * 7)\nclose\n")
+
+        def remote(n):
+            return request(compile_request(["--no-cache", f"-O{n % 3}", sources[n]]), socket_path)
+        with ThreadPoolExecutor(6) as pool:
+            replies = list(pool.map(remote, range(6)))
+        for n, reply in enumerate(replies):
+            assert reply["status"] == 0 and "Successfully compiled" in reply["stdout"], reply
+            direct = os.path.join(tmp, f"direct{n}.numbc")
+            subprocess.run([sys.executable, "vm/compiler/numiac.py", "--no-cache", f"-O{n % 3}", sources[n],
+                            "-o", direct], check=True, stdout=subprocess.DEVNULL)
+            with open(direct, "rb") as a, open(sources[n][:-4] + ".numbc", "rb") as b:
+                assert a.read() == b.read()
+
+        bad = request(compile_request(["--bogus"]), socket_path)
+        assert bad["status"] == 2 and "unrecognized arguments" in bad["stderr"]
+        missing = request(compile_request([os.path.join(tmp, "missing.num")]), socket_path)
+        assert missing["status"] == 1 and "Compilation failed" in missing["stderr"]
+
+        # Touching a compiler module makes the next request run in a re-executed server
+        module = "vm/compiler/opcodes.py"
+        before = os.stat(module)
+        os.utime(module, ns=(before.st_atime_ns, before.st_mtime_ns + 1_000_000_000))
+        try:
+            again = request(compile_request(["--no-cache", sources[0]]), socket_path)
+        finally:
+            os.utime(module, ns=(before.st_atime_ns, before.st_mtime_ns))
+        assert again["status"] == 0 and server.poll() is None
+
+        assert client_main(["--socket", socket_path, "--stop"]) == 0
+        wait_for(socket_path, present=False)
+        assert server.wait(10) == 0
+        log = server.stderr.read()
+        assert "listening on" in log and "compiler changed, restarting" in log, log
+        # No server: the client compiles in-process
+        with contextlib.redirect_stdout(io.StringIO()) as local:
+            assert client_main(["--socket", socket_path, "--no-cache", sources[1]]) == 0
+        assert "Successfully compiled" in local.getvalue()
+    finally:
+        if server.poll() is None:
+            server.kill()
+
+# The client must start without loading the compiler
+check = "import sys, vm.compiler.client; assert 'vm.compiler.compiler' not in sys.modules, sorted(sys.modules)"
+subprocess.run([sys.executable, "-c", check], check=True)
+print(f"✓ Compile server: {len(replies)} concurrent requests, restart on compiler change, local fallback")
+EOF
+# Line table and sampling profiler
+python3 - <<'EOF'
+import io
+import sys
+sys.path.insert(0, "tools")
+from vm.compiler import Bytecode, CompileOptions, compile_source
+from vm.compiler.compiler import Compiler
+from vm.compiler.regcodegen import RegisterBytecode
+from vm.pyvm import VM
+from numprof import Profiler, collapsed
+
+source = """module work() open
+    env j << 0
+    while (j < 300) do
+        env acc << (acc * 31 + j) % 1000003
+        env j << j + 1
+    end
+close
+
+area module main() open
+    env i << 0
+    env acc << 7
+    while (i < 300) do
+        work()
+        env i << i + 1
+    end
+    output(acc)
+close
+"""
+for opt_level in (0, 1, 2):
+    for target, kind in (("stack", Bytecode), ("reg", RegisterBytecode)):
+        bytecode = Compiler(source, opt_level=opt_level, target=target).compile()
+        offsets = [offset for offset, _, _ in bytecode.positions]
+        assert offsets == sorted(set(offsets)) and offsets[0] == 0, bytecode.positions
+        assert {line for _, line, _ in bytecode.positions} >= {2, 3, 4, 5, 10, 11, 12, 13, 14, 16}
+        assert bytecode.position(0) == (10, 5)  # main's first statement; work comes after it
+        assert kind.from_bytes(bytecode.to_bytes()).positions == bytecode.positions
+
+# Linked units keep their own lines, shifted to where they were placed
+program = "import mathlib\nenv n << 6\narea module main() open\n    square()\nclose\n"
+library = "module square() open\n    env m << 1\n    output(n * n)\nclose\n"
+linked = compile_source(program, CompileOptions(libraries={"mathlib": library}))
+assert linked.position(linked.functions["square"]) == (2, 5)
+assert linked.position(linked.functions["main"]) == (4, 5)
+
+bytecode = Compiler(source, opt_level=1).compile()
+# Runs share one bytecode, so their raw samples add up in one profiler; loaded machines give fewer ticks
+profiler = Profiler(VM(bytecode), interval=0.0005)
+for _ in range(100):
+    run = Profiler(VM(bytecode, output=io.StringIO()), interval=0.0005)
+    run.run()
+    profiler.samples.update(run.samples)
+    samples = sum(profiler.samples.values())
+    if samples >= 100:
+        break
+assert samples >= 100, samples
+lines = profiler.lines()
+assert set(lines) <= {("main", line) for line in range(10, 19)} | {("work", line) for line in range(2, 8)}, lines
+(hottest, _), = lines.most_common(1)
+assert hottest[0] == "work" and profiler.functions()["main"] == sum(profiler.samples.values())
+for line in collapsed(profiler):
+    stack, count = line.rsplit(" ", 1)
+    assert stack.startswith("main:") and int(count) > 0, line
+print(f"✓ Line table: offsets -> (line, column) through peephole, linking and .numbc; profiler sampled {samples}")
+EOF
 echo ""
 echo "✓ Compiler tests passed!"
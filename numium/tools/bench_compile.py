@@ -0,0 +1,194 @@
+"""
+Numium Compiler Throughput Benchmark
+Đo tốc độ lexer, parse + sinh mã và ghi file trên chương trình sinh sẵn; lưu JSON để so sánh
+
+Compiles gen_corpus programs of each size and reports three stages apart:
+lex, compile (parse, optimize, emit and peephole, from Compiler.stats) and
+write (Bytecode.to_file). Each size runs in its own child process, so the
+peak RSS belongs to that size alone. --output saves the results as JSON;
+--baseline compares a fresh run against saved results and --compare
+compares two saved files. Both exit with 1 when a stage got slower, or
+peak RSS grew, by more than --threshold.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+TOOLS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TOOLS, '..', 'vm', 'compiler'))
+
+from compiler import Compiler
+from gen_corpus import generate
+
+try:
+    import resource
+except ImportError:  # Windows: no getrusage
+    resource = None
+
+STAGES = ('lex', 'compile', 'write')
+# CompileStats phases that make up the compile stage
+COMPILE_PHASES = ('parse', 'optimize', 'emit', 'peephole')
+
+def peak_rss():
+    """Peak resident set size of this process in bytes, None if unknown"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024  # Linux reports KiB
+
+def rates(seconds: float, lines: int, tokens: int):
+    return {
+        'seconds': round(seconds, 6),
+        'lines_per_s': round(lines / seconds) if seconds else None,
+        'tokens_per_s': round(tokens / seconds) if seconds else None,
+    }
+
+def measure(lines: int, seed: int, repeat: int, opt_level: int, target: str):
+    """Best-of-repeat time of each stage for one generated program"""
+    source = generate(lines, seed)
+    best = dict.fromkeys(STAGES, float('inf'))
+    phases = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, 'bench.numbc')
+        for _ in range(repeat):
+            compiler = Compiler(source, opt_level=opt_level, target=target)
+            bytecode = compiler.compile()
+            start = time.perf_counter()
+            bytecode.to_file(output)
+            written = time.perf_counter() - start
+            
+            times = compiler.stats.phases
+            compiled = sum(times.get(name, 0.0) for name in COMPILE_PHASES)
+            if compiled < best['compile']:
+                phases = {name: round(seconds * 1000, 3) for name, seconds in times.items()}
+            best['lex'] = min(best['lex'], times['lex'])
+            best['compile'] = min(best['compile'], compiled)
+            best['write'] = min(best['write'], written)
+        output_bytes = os.path.getsize(output)
+    tokens = len(compiler.tokens)
+    
+    result = {
+        'lines': lines,
+        'chars': len(source),
+        'tokens': tokens,
+        'code_bytes': len(bytecode.code),
+        'output_bytes': output_bytes,
+        'phases_ms': phases,
+        'peak_rss_bytes': peak_rss(),
+    }
+    for stage in STAGES:
+        result[stage] = rates(best[stage], lines, tokens)
+    return result
+
+def measure_in_child(lines: int, args) -> dict:
+    """Run measure() in a fresh interpreter so peak RSS covers one size"""
+    command = [sys.executable, os.path.abspath(__file__), '--child', str(lines),
+               '--seed', str(args.seed), '--repeat', str(args.repeat),
+               '-O', str(args.opt_level), '--target', args.target]
+    done = subprocess.run(command, stdout=subprocess.PIPE, check=True, universal_newlines=True)
+    return json.loads(done.stdout)
+
+def git_commit():
+    """Short hash of the checked-out commit, None outside a git tree"""
+    try:
+        done = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=TOOLS, check=True,
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                              universal_newlines=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return done.stdout.strip()
+
+def compare(old: dict, new: dict, threshold: float) -> int:
+    """Print new/old per size and stage; returns how many got worse than threshold"""
+    print(f"Comparing {old.get('commit') or 'baseline'} -> {new.get('commit') or 'current'} "
+          f"(threshold {threshold:.0%})")
+    for key in ('seed', 'opt_level', 'target'):
+        if old.get(key) != new.get(key):
+            print(f"  Warning: {key} differs ({old.get(key)} vs {new.get(key)})")
+    previous = {size['lines']: size for size in old['sizes']}
+    regressions = 0
+    for size in new['sizes']:
+        before = previous.get(size['lines'])
+        if before is None:
+            continue
+        cells = []
+        for stage in STAGES:
+            ratio = size[stage]['lines_per_s'] / before[stage]['lines_per_s']
+            slower = ratio < 1 - threshold
+            regressions += slower
+            cells.append(f"{stage} {ratio:5.2f}x{' ✗' if slower else ''}")
+        if size['peak_rss_bytes'] and before['peak_rss_bytes']:
+            ratio = size['peak_rss_bytes'] / before['peak_rss_bytes']
+            grown = ratio > 1 + threshold
+            regressions += grown
+            cells.append(f"rss {ratio:5.2f}x{' ✗' if grown else ''}")
+        print(f"  {size['lines']:8} lines: " + '  '.join(cells))
+    return regressions
+
+def report(size: dict):
+    rss = size['peak_rss_bytes']
+    print(f"{size['lines']:8} lines, {size['tokens']:9} tokens"
+          + (f", peak RSS {rss / 2**20:.1f} MiB" if rss else ''))
+    for stage in STAGES:
+        rate = size[stage]
+        print(f"  {stage:8} {rate['seconds'] * 1000:10.1f} ms  {rate['lines_per_s']:10} lines/s  "
+              f"{rate['tokens_per_s']:11} tokens/s")
+
+def load(filename: str) -> dict:
+    with open(filename) as f:
+        return json.load(f)
+
+def main():
+    parser = argparse.ArgumentParser(description='Compiler throughput on generated programs')
+    parser.add_argument('--sizes', default='1000,10000,100000',
+                        help='Comma-separated line counts (default 1000,10000,100000)')
+    parser.add_argument('--seed', type=int, default=0, help='Generator seed (default 0)')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per size, best is kept (default 3)')
+    parser.add_argument('-O', dest='opt_level', type=int, default=0, choices=[0, 1, 2],
+                        help='Optimization level (default 0)')
+    parser.add_argument('--target', choices=['stack', 'reg'], default='stack')
+    parser.add_argument('--output', help='Save results as JSON')
+    parser.add_argument('--baseline', help='Compare this run against saved results')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                        help='Compare two saved results without running')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='Allowed slowdown or RSS growth before failing (default 0.1)')
+    parser.add_argument('--child', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.child is not None:
+        json.dump(measure(args.child, args.seed, args.repeat, args.opt_level, args.target), sys.stdout)
+        return 0
+    if args.compare:
+        return 1 if compare(load(args.compare[0]), load(args.compare[1]), args.threshold) else 0
+    
+    results = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'seed': args.seed,
+        'repeat': args.repeat,
+        'opt_level': args.opt_level,
+        'target': args.target,
+        'sizes': [],
+    }
+    for lines in (int(size) for size in args.sizes.split(',')):
+        size = measure_in_child(lines, args)
+        results['sizes'].append(size)
+        report(size)
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved {args.output}")
+    if args.baseline:
+        return 1 if compare(load(args.baseline), results, args.threshold) else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,76 @@
+"""
+Numium Lexer Benchmark
+So sánh tokenizer dựa trên bảng (regex) với tokenizer từng ký tự
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'vm', 'compiler'))
+
+from lexer import Lexer
+
+SNIPPET = '''# generated block {n}
+module worker_{n}() open
+    env counter_{n} << 0
+    env ratio_{n} << 3.25
+    env label_{n} << "worker {n}: \\"ready\\"\\n"
+    while (counter_{n} < 100 and ratio_{n} >= 0.5) do
+        env counter_{n} << counter_{n} + ({n} * 2 - 1) % 7
+        output(label_{n})
+    end
+    back with counter_{n} != 0x{n:04x}
+close
+'''
+
+def make_source(blocks: int) -> str:
+    """Build a synthetic program with the given number of module blocks"""
+    return ''.join(SNIPPET.format(n=n) for n in range(blocks))
+
+def best_of(func, source: str, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(Lexer(source))
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    blocks = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    source = make_source(blocks)
+    lines = source.count('\n')
+
+    fast_tokens = Lexer(source).tokenize()
+    slow_tokens = Lexer(source).tokenize_chars()
+    if fast_tokens != slow_tokens:
+        print("✗ Token streams differ")
+        return 1
+
+    slow = best_of(Lexer.tokenize_chars, source, repeat)
+    fast = best_of(Lexer.tokenize, source, repeat)
+    count = len(fast_tokens)
+
+    print(f"Source: {lines} lines, {len(source)} chars, {count} tokens")
+    print(f"tokenize_chars: {slow * 1000:8.1f} ms  {count / slow:12.0f} tokens/s  {lines / slow:10.0f} lines/s")
+    print(f"tokenize:       {fast * 1000:8.1f} ms  {count / fast:12.0f} tokens/s  {lines / fast:10.0f} lines/s")
+    print(f"Speedup: {slow / fast:.1f}x")
+
+    # Incremental re-lexing of single edits in the middle of the file
+    middle = source.index('\n', len(source) // 2) + 5
+    for label, inserted in (('same-line edit', 'abc'), ('line-adding edit', '\n')):
+        lexer = Lexer(source)
+        lexer.tokenize()
+        start = time.perf_counter()
+        lexer.relex(middle, 0, inserted)
+        elapsed = time.perf_counter() - start
+        if lexer.tokens != Lexer(lexer.source).tokenize():
+            print(f"✗ relex() differs from tokenize() for {label}")
+            return 1
+        print(f"relex ({label}): {elapsed * 1000:8.3f} ms")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
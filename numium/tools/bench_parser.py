@@ -0,0 +1,58 @@
+"""
+Numium Parser Benchmark
+Đo tốc độ phân tích cú pháp + sinh bytecode (không tính lexer)
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'vm', 'compiler'))
+
+from compiler import Compiler
+
+SNIPPET = '''module worker_{n}() open
+    env counter_{n} << 0
+    env ratio_{n} << 3.25 * counter_{n} - 1
+    env ready_{n} << counter_{n} < 10 and ratio_{n} >= 0.5 or counter_{n} == {n}
+    env label_{n} << "worker {n}"
+    output(label_{n})
+    pass
+    back with counter_{n} + ({n} * 2 - 1) % 7 != {n}
+close
+'''
+
+EXPRESSION_SNIPPET = '''env e{n} << ((a{n} + 1) * (b{n} - 2) / 3 % 4 - -c{n}) * (d{n} + (e{n} - (f{n} * (g{n} + 5))))
+env t{n} << a{n} < b{n} and b{n} <= c{n} or !(c{n} > d{n}) and d{n} >= e{n} or e{n} == f{n} and f{n} != {n}
+'''
+
+def make_source(blocks: int) -> str:
+    """Build a synthetic program with the given number of module blocks"""
+    return ''.join(SNIPPET.format(n=n) for n in range(blocks))
+
+def make_expression_source(blocks: int) -> str:
+    """Build a synthetic program made of long arithmetic and logic expressions"""
+    return ''.join(EXPRESSION_SNIPPET.format(n=n) for n in range(blocks))
+
+def bench(name: str, source: str, repeat: int):
+    best = float('inf')
+    for _ in range(repeat):
+        compiler = Compiler(source)
+        start = time.perf_counter()
+        bytecode = compiler.compile()
+        best = min(best, time.perf_counter() - start)
+    count = len(compiler.tokens)
+
+    print(f"{name}: {source.count(chr(10))} lines, {count} tokens, {len(bytecode.code)} bytes of bytecode")
+    print(f"  Parse + emit: {best * 1000:.1f} ms  {count / best:.0f} tokens/s")
+
+def main():
+    blocks = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    bench("Mixed", make_source(blocks), repeat)
+    bench("Expressions", make_expression_source(blocks * 4), repeat)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
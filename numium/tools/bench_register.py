@@ -0,0 +1,280 @@
+"""
+Numium Register Backend Benchmark
+So sánh số lệnh thực thi và thời gian: bytecode stack và bytecode thanh ghi
+
+Runs each program in two small Python dispatch loops: one for stack code
+(including the -O1 superinstructions), one for register code. Values are
+computed with the optimizer's folding rules, so the outputs must match. The
+loops are the same shape, so the dispatch count is the fair comparison.
+Wall time in Python mostly shows the per-dispatch overhead.
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'vm', 'compiler'))
+
+from compiler import Compiler
+from bytecode import iter_instructions
+from opcodes import Opcode, RegOpcode, COMPARE_BRANCHES, GENERIC_OPCODES, RK_CONSTANT
+from optimizer import fold_binary, fold_unary, truth
+from regcodegen import iter_register_instructions
+
+PROGRAMS = {
+    'arithmetic': '''area module main() open
+    env i << 0
+    env acc << 7
+    while (i < {n}) do
+        env acc << (acc * 31 + i * i - i / 3) % 1000003
+        env i << i + 1
+    end
+    output(acc)
+close
+''',
+    'branches': '''area module main() open
+    env i << 0
+    env odd << 0
+    env big << 0
+    while (i < {n}) do
+        if i % 2 == 1 do
+            env odd << odd + 1
+        end
+        if i * 3 > {n} and i != 5 do
+            env big << big + i
+        else do
+            env big << big - 1
+        end
+        env i << i + 1
+    end
+    output(odd)
+    output(big)
+close
+''',
+    'polynomial': '''area module main() open
+    env x << 0
+    env total << 0.0
+    while (x < {n}) do
+        env t << x * 0.001
+        env y << ((((3.0 * t + 2.0) * t - 5.0) * t + 1.5) * t - 0.25) * t + 4.0
+        env total << total + y * y - t
+        env x << x + 1
+    end
+    output(total)
+close
+''',
+}
+
+_BINARY = frozenset({Opcode.ADD, Opcode.SUB, Opcode.MUL, Opcode.DIV, Opcode.MOD, Opcode.EQ,
+                     Opcode.NE, Opcode.LT, Opcode.LE, Opcode.GT, Opcode.GE,
+                     Opcode.AND_OP, Opcode.OR_OP})
+# Binary opcode, typed ones included -> the operation fold_binary evaluates
+_OPERATIONS = {op: op for op in _BINARY}
+_OPERATIONS.update(GENERIC_OPCODES)
+_BRANCH_COMPARES = {branch: compare for compare, branch in COMPARE_BRANCHES.items()}
+
+def switch_target(op, table, subject, constants):
+    """Jump target of TABLESWITCH/LOOKUPSWITCH for subject; table is the operands after it"""
+    if op == Opcode.TABLESWITCH:
+        low, count, default = constants[table[0]], table[1], table[2]
+        if type(subject) is int and 0 <= subject - low < count:
+            return table[3 + subject - low]
+        return default
+    count, default = table[0], table[1]
+    if type(subject) is not type(constants[table[2]]):
+        return default
+    low, high = 0, count
+    while low < high:  # Binary search of the sorted keys
+        middle = (low + high) // 2
+        key = constants[table[2 + 2 * middle]]
+        if key == subject:
+            return table[3 + 2 * middle]
+        if key < subject:
+            low = middle + 1
+        else:
+            high = middle
+    return default
+
+def decode(instructions):
+    """offset -> (opcode, operands, next offset)"""
+    listing = list(instructions)
+    ends = [offset for offset, _, _ in listing[1:]] + [None]
+    return {offset: (opcode, operands, end) for (offset, opcode, operands), end in zip(listing, ends)}
+
+def run_stack(bytecode):
+    """Execute stack bytecode; returns (outputs, instructions executed)"""
+    program = decode(iter_instructions(bytecode.code))
+    constants = bytecode.constants
+    variables = [None] * len(bytecode.variables)
+    frame_sizes = {bytecode.functions[name]: size for name, size in bytecode.frame_sizes.items()}
+    local_slots = []
+    stack = []
+    calls = []
+    outputs = []
+    pc = 0
+    count = 0
+    while pc is not None:
+        op, args, pc = program[pc]
+        count += 1
+        if op in _OPERATIONS:
+            b = stack.pop()
+            stack[-1] = fold_binary(_OPERATIONS[op], stack[-1], b)
+        elif op == Opcode.PUSH:
+            stack.append(constants[args[0]])
+        elif op == Opcode.LOAD_VAR:
+            stack.append(variables[args[0]])
+        elif op == Opcode.STORE_VAR:
+            variables[args[0]] = stack.pop()
+        elif op == Opcode.LOAD_LOCAL:
+            stack.append(local_slots[args[0]])
+        elif op == Opcode.STORE_LOCAL:
+            local_slots[args[0]] = stack.pop()
+        elif op == Opcode.JMP:
+            pc = args[0]
+        elif op == Opcode.JMP_IFNOT:
+            if not truth(stack.pop()):
+                pc = args[0]
+        elif op == Opcode.JMP_IF:
+            if truth(stack.pop()):
+                pc = args[0]
+        elif op in _BRANCH_COMPARES:
+            if not truth(fold_binary(_BRANCH_COMPARES[op], variables[args[0]], constants[args[1]])):
+                pc = args[2]
+        elif op == Opcode.INC_VAR:
+            variables[args[0]] = fold_binary(Opcode.ADD, variables[args[0]], constants[args[1]])
+        elif op == Opcode.ADD_VAR_CONST:
+            stack.append(fold_binary(Opcode.ADD, variables[args[0]], constants[args[1]]))
+        elif op == Opcode.ADD_VARS:
+            stack.append(fold_binary(Opcode.ADD, variables[args[0]], variables[args[1]]))
+        elif op == Opcode.LOAD_VAR2:
+            stack += (variables[args[0]], variables[args[1]])
+        elif op == Opcode.STORE_CONST:
+            variables[args[0]] = constants[args[1]]
+        elif op == Opcode.NEG or op == Opcode.NOT_OP:
+            stack[-1] = fold_unary(op, stack[-1])
+        elif op == Opcode.OUTPUT:
+            outputs.append(stack.pop())
+        elif op == Opcode.FOR_RANGE_NEXT:
+            index = variables[args[0]] = fold_binary(Opcode.ADD, variables[args[0]], 1)
+            if truth(fold_binary(Opcode.LT, index, variables[args[1]])):
+                pc = args[2]
+        elif op == Opcode.FOR_LOCAL_NEXT:
+            index = local_slots[args[0]] = fold_binary(Opcode.ADD, local_slots[args[0]], 1)
+            if truth(fold_binary(Opcode.LT, index, local_slots[args[1]])):
+                pc = args[2]
+        elif op == Opcode.FOR_RANGE_INIT:
+            variables[args[0]] = 0
+            variables[args[1]] = stack.pop()
+            if not truth(fold_binary(Opcode.LT, 0, variables[args[1]])):
+                pc = args[2]
+        elif op == Opcode.FOR_LOCAL_INIT:
+            local_slots[args[0]] = 0
+            local_slots[args[1]] = stack.pop()
+            if not truth(fold_binary(Opcode.LT, 0, local_slots[args[1]])):
+                pc = args[2]
+        elif op == Opcode.TABLESWITCH or op == Opcode.LOOKUPSWITCH:
+            pc = switch_target(op, args, stack.pop(), constants)
+        elif op == Opcode.DUP:
+            stack.append(stack[-1])
+        elif op == Opcode.CALL:
+            calls.append((pc, local_slots))
+            pc = args[0]
+            local_slots = [None] * frame_sizes.get(pc, 0)
+        elif op == Opcode.RET:
+            pc, local_slots = calls.pop() if calls else (None, None)
+        elif op == Opcode.HALT:
+            break
+        elif op != Opcode.POP and op != Opcode.NOP:
+            raise RuntimeError(f"Opcode 0x{op:02X} is not supported by the benchmark")
+    return outputs, count
+
+def run_register(bytecode):
+    """Execute register bytecode; returns (outputs, instructions executed)"""
+    program = decode(iter_register_instructions(bytecode.code))
+    # RK operands index one list: registers, then the constant pool at RK_CONSTANT
+    values = [None] * bytecode.register_count
+    values += [None] * (RK_CONSTANT - len(values)) + list(bytecode.constants)
+    calls = []
+    outputs = []
+    pc = 0
+    count = 0
+    while pc is not None:
+        op, args, pc = program[pc]
+        count += 1
+        if op in _OPERATIONS:  # Same numbers as the stack opcodes
+            values[args[0]] = fold_binary(_OPERATIONS[op], values[args[1]], values[args[2]])
+        elif op in _BRANCH_COMPARES:
+            if not truth(fold_binary(_BRANCH_COMPARES[op], values[args[0]], values[args[1]])):
+                pc = args[2]
+        elif op == RegOpcode.MOVE:
+            values[args[0]] = values[args[1]]
+        elif op == RegOpcode.LOADK:
+            values[args[0]] = bytecode.constants[args[1]]
+        elif op == RegOpcode.JMP:
+            pc = args[0]
+        elif op == RegOpcode.JMP_IFNOT:
+            if not truth(values[args[0]]):
+                pc = args[1]
+        elif op == RegOpcode.JMP_IF:
+            if truth(values[args[0]]):
+                pc = args[1]
+        elif op == RegOpcode.NEG or op == RegOpcode.NOT_OP:
+            values[args[0]] = fold_unary(op, values[args[1]])
+        elif op == RegOpcode.OUTPUT:
+            outputs.append(values[args[0]])
+        elif op == RegOpcode.FOR_RANGE_NEXT:
+            values[args[0]] = fold_binary(Opcode.ADD, values[args[0]], 1)
+            if truth(fold_binary(Opcode.LT, values[args[0]], values[args[1]])):
+                pc = args[2]
+        elif op == RegOpcode.FOR_RANGE_INIT:
+            values[args[0]] = 0
+            if not truth(fold_binary(Opcode.LT, 0, values[args[1]])):
+                pc = args[2]
+        elif op == RegOpcode.TABLESWITCH or op == RegOpcode.LOOKUPSWITCH:
+            pc = switch_target(op, args[1:], values[args[0]], bytecode.constants)
+        elif op == RegOpcode.CALL:
+            calls.append(pc)
+            pc = args[0]
+        elif op == RegOpcode.RET:
+            pc = calls.pop() if calls else None
+        elif op == RegOpcode.HALT:
+            break
+        elif op != RegOpcode.NOP:
+            raise RuntimeError(f"Register opcode 0x{op:02X} is not supported by the benchmark")
+    return outputs, count
+
+def timed(run, bytecode, repeat: int):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        outputs, count = run(bytecode)
+        best = min(best, time.perf_counter() - start)
+    return outputs, count, best
+
+def bench(name: str, source: str, repeat: int):
+    forms = [
+        ('stack -O0', run_stack, Compiler(source).compile()),
+        ('stack -O1', run_stack, Compiler(source, opt_level=1).compile()),
+        ('reg -O1', run_register, Compiler(source, opt_level=1, target='reg').compile()),
+    ]
+    print(f"{name}:")
+    baseline = None
+    for label, run, bytecode in forms:
+        outputs, count, seconds = timed(run, bytecode, repeat)
+        if baseline is None:
+            baseline = (outputs, count, seconds)
+        elif outputs != baseline[0]:
+            raise AssertionError(f"{label} printed {outputs}, stack -O0 printed {baseline[0]}")
+        print(f"  {label:10} {bytecode.instruction_count():4} instructions  {count:9} dispatched "
+              f"({count / baseline[1]:.2f}x)  {seconds * 1000:8.1f} ms ({seconds / baseline[2]:.2f}x)")
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    
+    for name, template in PROGRAMS.items():
+        bench(name, template.format(n=n), repeat)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
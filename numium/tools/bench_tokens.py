@@ -0,0 +1,78 @@
+"""
+Numium Token Storage Benchmark
+So sánh bộ nhớ và tốc độ của List[Token] với TokenBuffer
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'vm', 'compiler'))
+
+from lexer import Lexer
+from tokenbuffer import TokenBuffer
+from compiler import Compiler
+
+SNIPPET = '''# generated block {n}
+module worker_{n}() open
+    env counter_{n} << 0
+    env ratio_{n} << 3.25 * counter_{n}
+    env label_{n} << "worker {n}: \\"ready\\"\\n"
+    output(label_{n})
+    back with counter_{n} + ({n} * 2 - 1) % 7 != {n}
+close
+'''
+
+def make_source(blocks: int) -> str:
+    """Build a synthetic program with the given number of module blocks"""
+    return ''.join(SNIPPET.format(n=n) for n in range(blocks))
+
+def measure(build):
+    """Return (seconds, retained bytes, peak bytes, result) for build()"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, current, peak, result
+
+def best_time(build, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        build()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    blocks = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    source = make_source(blocks)
+    _, list_bytes, list_peak, tokens = measure(lambda: Lexer(source).tokenize())
+    _, buffer_bytes, buffer_peak, buffer = measure(lambda: TokenBuffer.from_source(source))
+    if list(buffer) != tokens:
+        print("✗ Token streams differ")
+        return 1
+    count = len(tokens)
+    del tokens, buffer
+
+    print(f"Source: {source.count(chr(10))} lines, {count} tokens")
+    print(f"{'':14} {'bytes/token':>12} {'peak MiB':>10} {'lex ms':>10} {'compile ms':>12}")
+    rows = (
+        ('List[Token]', list_bytes, list_peak,
+         lambda: Lexer(source).tokenize(), lambda: Compiler(source).compile()),
+        ('TokenBuffer', buffer_bytes, buffer_peak,
+         lambda: TokenBuffer.from_source(source), lambda: Compiler(source, compact_tokens=True).compile()),
+    )
+    for name, retained, peak, lex, compile_ in rows:
+        lex_time = best_time(lex, repeat)
+        compile_time = best_time(compile_, repeat)
+        print(f"{name:14} {retained / count:12.1f} {peak / 2**20:10.1f} "
+              f"{lex_time * 1000:10.1f} {compile_time * 1000:12.1f}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
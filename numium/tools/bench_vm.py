@@ -0,0 +1,149 @@
+"""
+Numium VM Benchmark - Python VM (vm.pyvm) against the C runtime
+So sánh thời gian chạy giữa máy ảo Python và máy ảo C trên cùng một file .numbc
+
+The C VM has no variables or jumps yet, so the shared programs are
+straight-line: many output() lines of constant int and float arithmetic,
+compiled at -O0 so every operation stays in the code. Both VMs run the
+same .numbc and must print the same text. The C time is the process wall
+time minus that of an empty program (start-up and loading); the Python
+time covers load, decode and run. The loop programs from bench_register
+then run on the Python VM alone, as stack -O0, stack -O1 and reg -O1.
+"""
+
+import argparse
+import io
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+TOOLS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(TOOLS, '..')
+sys.path.insert(0, ROOT)
+
+from vm.compiler.compiler import Compiler
+from vm.pyvm import VM, load_bytecode
+from bench_register import PROGRAMS
+
+# Where a CMake build puts the C VM, relative to the numium directory
+C_VM_PATHS = ('install/bin/numium_vm', 'build/vm/runtime/numium_vm')
+
+# vm.c frames the program output with these lines
+C_OUTPUT_START = 'Starting VM execution...\n'
+C_OUTPUT_END = '\nVM execution completed'
+
+def straight_line(lines: int, seed: int = 0) -> str:
+    """Constant arithmetic printed line by line; no division by zero, no int overflow"""
+    rng = random.Random(seed)
+    
+    def operand():
+        if rng.random() < 0.7:
+            return str(rng.randint(1, 99))
+        return f"{rng.randint(1, 99)}.{rng.randint(0, 99):02d}"
+    
+    def expression(depth):
+        if depth == 0 or rng.random() < 0.2:
+            return operand()
+        op = rng.choice(('+', '-', '*', '/'))
+        right = operand() if op == '/' else expression(depth - 1)  # Literal divisors are never 0
+        return f"({expression(depth - 1)} {op} {right})"
+    
+    body = []
+    for _ in range(lines):
+        text = expression(3)
+        if rng.random() < 0.3:  # vm.c does no arithmetic on bools, so compare only at the top
+            text = f"{text} {rng.choice(('<', '==', '>='))} {expression(2)}"
+        body.append(f'    output({text})\n    output("\\n")')
+    return "area module main() open\n" + '\n'.join(body) + "\nclose\n"
+
+def find_c_vm(path=None):
+    candidates = [path] if path else [os.path.join(ROOT, candidate) for candidate in C_VM_PATHS]
+    for candidate in candidates:
+        if candidate and os.access(candidate, os.X_OK):
+            return candidate
+    return None
+
+def run_c(vm_path: str, filename: str, repeat: int):
+    """Best wall time of the C VM and the program output it printed"""
+    best, text = float('inf'), ''
+    for _ in range(repeat):
+        start = time.perf_counter()
+        done = subprocess.run([vm_path, filename], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                              check=True, universal_newlines=True)
+        best = min(best, time.perf_counter() - start)
+        text = done.stdout
+    begin = text.find(C_OUTPUT_START)
+    end = text.rfind(C_OUTPUT_END)
+    if begin < 0 or end < begin:
+        raise RuntimeError(f"Unexpected output from {vm_path}")
+    return best, text[begin + len(C_OUTPUT_START):end]
+
+def run_python(load, repeat: int):
+    """Best time of load + decode + run in the Python VM and its output"""
+    best, text = float('inf'), ''
+    for _ in range(repeat):
+        output = io.StringIO()
+        start = time.perf_counter()
+        VM(load(), output=output).run()
+        best = min(best, time.perf_counter() - start)
+        text = output.getvalue()
+    return best, text
+
+def compare_c(vm_path, lines: int, repeat: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        empty = os.path.join(tmp, 'empty.numbc')
+        Compiler("area module main() open\nclose\n").compile().to_file(empty)
+        filename = os.path.join(tmp, 'straight.numbc')
+        bytecode = Compiler(straight_line(lines)).compile()
+        bytecode.to_file(filename)
+        
+        python_time, python_text = run_python(lambda: load_bytecode(filename), repeat)
+        print(f"straight-line, {lines} outputs, {bytecode.instruction_count()} instructions:")
+        print(f"  python VM  {python_time * 1000:8.1f} ms")
+        if vm_path is None:
+            print("  C VM       not found (build it, or pass --vm PATH)")
+            return 0
+        startup, _ = run_c(vm_path, empty, repeat)
+        c_time, c_text = run_c(vm_path, filename, repeat)
+        c_time = max(c_time - startup, 1e-9)
+        print(f"  C VM       {c_time * 1000:8.1f} ms (+{startup * 1000:.1f} ms start-up)  "
+              f"python/C {python_time / c_time:.1f}x")
+        if c_text != python_text:
+            print("  Outputs differ!")
+            return 1
+        print("  Outputs match")
+    return 0
+
+def python_only(n: int, repeat: int):
+    forms = (('stack -O0', 0, 'stack'), ('stack -O1', 1, 'stack'), ('reg -O1', 1, 'reg'))
+    for name, template in PROGRAMS.items():
+        source = template.format(n=n)
+        print(f"{name} (python VM only):")
+        expected = None
+        for label, opt_level, target in forms:
+            bytecode = Compiler(source, opt_level=opt_level, target=target).compile()
+            seconds, text = run_python(lambda: bytecode, repeat)
+            if expected is None:
+                expected = text
+            elif text != expected:
+                raise AssertionError(f"{label} printed {text!r}, stack -O0 printed {expected!r}")
+            print(f"  {label:10} {seconds * 1000:8.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description='Python VM against the C VM')
+    parser.add_argument('--vm', help='C VM binary (default: install/bin or build/vm/runtime)')
+    parser.add_argument('--lines', type=int, default=20000,
+                        help='output() lines in the straight-line program (default 20000)')
+    parser.add_argument('-n', type=int, default=20000, help='Loop iterations (default 20000)')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per measurement, best is kept')
+    args = parser.parse_args()
+    
+    status = compare_c(find_c_vm(args.vm), args.lines, args.repeat)
+    python_only(args.n, args.repeat)
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,34 @@
+"""
+Numium Bytecode Converter
+Chuyển file .numbc + .meta.json cũ sang định dạng .numbc v2
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'vm', 'compiler'))
+
+from numbc import NumbcError, convert_legacy, legacy_metadata_file
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: convert_numbc.py <bytecode_file> [-o output_file] [--remove-meta]")
+        sys.exit(1)
+
+    bytecode_file = sys.argv[1]
+    output_file = sys.argv[sys.argv.index('-o') + 1] if '-o' in sys.argv else None
+
+    metadata_file = legacy_metadata_file(bytecode_file)
+    try:
+        output_file = convert_legacy(bytecode_file, output_file)
+    except (OSError, NumbcError) as e:
+        print(f"✗ {e}", file=sys.stderr)
+        return 1
+
+    if '--remove-meta' in sys.argv and os.path.exists(metadata_file):
+        os.remove(metadata_file)
+    print(f"✓ Converted {bytecode_file} -> {output_file} (.numbc v2)")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,48 +3,66 @@ Numium Virtual Machine - Bytecode Disassembler
 Công cụ để xem bytecode ở dạng readable
 """
 
-import struct
-import json
 import sys
-from vm.compiler.opcodes import OPCODE_NAMES
+from vm.compiler.opcodes import OPCODE_NAMES, OPERAND_COUNTS, SWITCH_ENTRY_KINDS
+from vm.compiler.bytecode import table_length
+from vm.compiler import numbc
+from vm.compiler.regcodegen import disassemble as disassemble_registers
 
 class Disassembler:
     def __init__(self, bytecode_file):
         self.bytecode_file = bytecode_file
-        self.metadata_file = bytecode_file.replace('.numbc', '.meta.json')
-        self.code = []
+        self.code = b''
         self.metadata = {}
+        self.register_count = None  # Set for register bytecode (--target=reg)
     
     def load(self):
-        """Load bytecode and metadata"""
+        """Load bytecode and metadata (.numbc v2, or code + .meta.json)"""
         with open(self.bytecode_file, 'rb') as f:
-            self.code = list(f.read())
+            is_container = numbc.is_container(f.read(len(numbc.MAGIC)))
+        if is_container:
+            with numbc.NumbcImage.open(self.bytecode_file) as image:
+                self.code = bytes(image.code)
+                if image.flags & numbc.FLAG_REGISTER:
+                    self.register_count = image.register_count()
+                self.metadata = {
+                    'version': numbc.FORMAT_VERSION,
+                    'constants': image.constants(),
+                    'variables': image.variables(),
+                    'functions': image.functions(),
+                }
+            return
         
-        try:
-            with open(self.metadata_file, 'r') as f:
-                self.metadata = json.load(f)
-        except FileNotFoundError:
-            pass
+        code, constants, variables, functions = numbc.load_legacy(self.bytecode_file)
+        self.code = code
+        if constants or variables or functions:
+            self.metadata = {'constants': constants, 'variables': variables, 'functions': functions}
     
     def disassemble(self):
         """Disassemble bytecode to assembly-like format"""
+        if self.register_count is not None:
+            print(f"; register bytecode, {self.register_count} registers")
+            for line in disassemble_registers(self.code):
+                print(line)
+            return
         pc = 0
         while pc < len(self.code):
             opcode = self.code[pc]
             opname = OPCODE_NAMES.get(opcode, f"UNKNOWN({opcode:02X})")
             
-            # Check if opcode has argument
-            if opcode in (0x01, 0x40, 0x41, 0x42, 0x50, 0x51, 0x52, 0x53):
-                if pc + 4 < len(self.code):
-                    arg = (self.code[pc+1] | 
-                           (self.code[pc+2] << 8) |
-                           (self.code[pc+3] << 16) |
-                           (self.code[pc+4] << 24))
-                    print(f"0x{pc:04X}: {opname:12} 0x{arg:08X}")
-                    pc += 5
-                else:
-                    print(f"0x{pc:04X}: {opname}")
-                    pc += 1
+            # Check if opcode has arguments (4 bytes each)
+            count = OPERAND_COUNTS.get(opcode, 0)
+            if opcode in SWITCH_ENTRY_KINDS and pc + 4 * count < len(self.code):
+                count += table_length(self.code, pc)  # The table follows
+            if count and pc + 4 * count < len(self.code):
+                args = []
+                for at in range(pc + 1, pc + 1 + 4 * count, 4):
+                    args.append(self.code[at] |
+                                (self.code[at+1] << 8) |
+                                (self.code[at+2] << 16) |
+                                (self.code[at+3] << 24))
+                print(f"0x{pc:04X}: {opname:12} " + ' '.join(f"0x{arg:08X}" for arg in args))
+                pc += 1 + 4 * count
             else:
                 print(f"0x{pc:04X}: {opname}")
                 pc += 1
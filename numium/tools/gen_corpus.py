@@ -0,0 +1,201 @@
+"""
+Numium Benchmark Corpus Generator
+Sinh chương trình .num tổng hợp, xác định theo seed, từ 1k đến 1M dòng
+
+generate(lines, seed) returns a program of exactly that many lines: modules
+mixing env declarations, if / else if / else, while and for loops, switch
+and long arithmetic and logic expressions, then an area module main that
+calls them. The same (lines, seed) always gives the same text, so
+benchmark runs on two commits compile identical input. Modules only call
+modules defined before them and loops only count their own counters, so
+the programs also terminate when run.
+"""
+
+import argparse
+import random
+import sys
+from typing import List
+
+# Module-level variables every generated module declares first
+VARIABLES = ('a', 'b', 'c', 'd', 'x', 'y')
+
+# Binary operators for arithmetic and for conditions
+ARITHMETIC = ('+', '-', '*', '/', '%')
+COMPARISONS = ('<', '<=', '>', '>=', '==', '!=')
+
+INDENT = '    '
+
+class CorpusGenerator:
+    """Builds one program; every choice comes from a seeded random.Random"""
+    
+    def __init__(self, seed: int = 0):
+        self.rng = random.Random(seed)
+        self.modules: List[str] = []  # Names of modules written so far
+        self.counter = 0  # Suffix for loop variables
+    
+    def fresh(self, prefix: str) -> str:
+        self.counter += 1
+        return f"{prefix}{self.counter}"
+    
+    def operand(self, names: List[str]) -> str:
+        rng = self.rng
+        roll = rng.random()
+        if roll < 0.6:
+            return rng.choice(names)
+        if roll < 0.9:
+            return str(rng.randint(1, 999))
+        return f"{rng.randint(0, 99)}.{rng.randint(0, 99):02d}"
+    
+    def expression(self, names: List[str], depth: int = 3) -> str:
+        """Arithmetic expression; divisors are never literal zero"""
+        if depth == 0 or self.rng.random() < 0.25:
+            return self.operand(names)
+        op = self.rng.choice(ARITHMETIC)
+        left = self.expression(names, depth - 1)
+        right = self.expression(names, depth - 1)
+        if self.rng.random() < 0.4:
+            return f"({left} {op} {right})"
+        return f"{left} {op} {right}"
+    
+    def condition(self, names: List[str]) -> str:
+        rng = self.rng
+        parts = []
+        for _ in range(rng.randint(1, 3)):
+            compare = f"{self.expression(names, 1)} {rng.choice(COMPARISONS)} {self.expression(names, 1)}"
+            parts.append(f"!({compare})" if rng.random() < 0.15 else compare)
+        text = parts[0]
+        for part in parts[1:]:
+            text += f" {rng.choice(('and', 'or'))} {part}"
+        return text
+    
+    def simple(self, indent: str, names: List[str]) -> str:
+        """One-line statement"""
+        rng = self.rng
+        roll = rng.random()
+        if roll < 0.55:
+            return f"{indent}env {rng.choice(VARIABLES)} << {self.expression(names)}"
+        if roll < 0.7:
+            return f"{indent}output({self.expression(names, 2)})"
+        if roll < 0.8 and self.modules:
+            return f"{indent}{rng.choice(self.modules)}()"
+        if roll < 0.9:
+            return f'{indent}output("line {rng.randint(0, 99999)}: \\"quoted\\"\\n")'
+        return f"{indent}# note {rng.randint(0, 99999)}"
+    
+    def block(self, lines: int, depth: int, names: List[str]) -> List[str]:
+        """Exactly the given number of lines of statements"""
+        indent = INDENT * depth
+        out: List[str] = []
+        while len(out) < lines:
+            left = lines - len(out)
+            kind = self.rng.random()
+            if depth > 4 or left < 3 or kind < 0.55:
+                out.append(self.simple(indent, names))
+            elif kind < 0.7:
+                out += self.if_statement(left, depth, names)
+            elif kind < 0.8 and left >= 5:
+                out += self.while_statement(left, depth, names)
+            elif kind < 0.9:
+                out += self.for_statement(left, depth, names)
+            elif left >= 4:
+                out += self.switch_statement(left, depth, names)
+            else:
+                out.append(self.simple(indent, names))
+        return out
+    
+    def body_size(self, left: int, overhead: int) -> int:
+        return self.rng.randint(1, max(1, min(12, left - overhead)))
+    
+    def if_statement(self, left: int, depth: int, names: List[str]) -> List[str]:
+        indent = INDENT * depth
+        out = [f"{indent}if {self.condition(names)} do"]
+        out += self.block(self.body_size(left, 2), depth + 1, names)
+        while left - len(out) >= 4 and self.rng.random() < 0.3:
+            out.append(f"{indent}else if {self.condition(names)} do")
+            out += self.block(self.body_size(left - len(out), 2), depth + 1, names)
+        if left - len(out) >= 3 and self.rng.random() < 0.5:
+            out.append(f"{indent}else do")
+            out += self.block(self.body_size(left - len(out), 2), depth + 1, names)
+        out.append(f"{indent}end")
+        return out
+    
+    def while_statement(self, left: int, depth: int, names: List[str]) -> List[str]:
+        indent = INDENT * depth
+        counter = self.fresh('w')
+        out = [f"{indent}env {counter} << 0",
+               f"{indent}while ({counter} < {self.rng.randint(2, 16)}) do"]
+        out += self.block(self.body_size(left, 4), depth + 1, names + [counter])
+        out += [f"{indent}{INDENT}env {counter} << {counter} + 1", f"{indent}end"]
+        return out
+    
+    def for_statement(self, left: int, depth: int, names: List[str]) -> List[str]:
+        indent = INDENT * depth
+        counter = self.fresh('i')
+        out = [f"{indent}for ({counter}) on range({self.rng.randint(2, 16)}) do"]
+        out += self.block(self.body_size(left, 2), depth + 1, names + [counter])
+        out.append(f"{indent}end")
+        return out
+    
+    def switch_statement(self, left: int, depth: int, names: List[str]) -> List[str]:
+        indent = INDENT * depth
+        arms = self.rng.randint(2, 8)
+        out = [f"{indent}switch ({self.expression(names, 1)}) % {arms} do"]
+        for arm in range(arms):
+            if left - len(out) < 3:
+                break
+            out.append(f"{indent}{INDENT}case {arm} do")
+            out += self.block(self.body_size(left - len(out), 2), depth + 2, names)
+        out.append(f"{indent}end")
+        return out
+    
+    def module(self, lines: int) -> List[str]:
+        """A module of exactly the given number of lines (at least 2 + len(VARIABLES))"""
+        name = f"worker_{len(self.modules)}"
+        names = list(VARIABLES)
+        out = [f"module {name}() open"]
+        out += [f"{INDENT}env {var} << {self.rng.randint(1, 999)}" for var in VARIABLES]
+        out += self.block(lines - len(out) - 1, 1, names)
+        out.append("close")
+        self.modules.append(name)
+        return out
+    
+    def program(self, lines: int) -> str:
+        module_min = len(VARIABLES) + 3
+        out: List[str] = [f"# Generated benchmark program: {lines} lines"]
+        left = lines - 1
+        while left - 3 >= module_min:  # Leave room for main and one call
+            size = min(self.rng.randint(module_min, 160), left - 3)
+            out += self.module(size)
+            left -= size
+        calls = left - 2
+        if calls < 0:
+            raise ValueError(f"A program needs at least {lines - calls} lines")
+        out.append("area module main() open")
+        modules = self.modules or [None]
+        for n in range(calls):
+            name = modules[n % len(modules)]
+            out.append(f"{INDENT}{name}()" if name else f"{INDENT}output({n})")
+        out.append("close")
+        return '\n'.join(out) + '\n'
+
+def generate(lines: int, seed: int = 0) -> str:
+    """Deterministic program of exactly `lines` lines (at least 3)"""
+    return CorpusGenerator(seed).program(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic Numium program')
+    parser.add_argument('lines', type=int, help='Number of lines, e.g. 1000 to 1000000')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed (default 0)')
+    parser.add_argument('-o', '--output', help='Output file (default: standard output)')
+    args = parser.parse_args()
+    
+    source = generate(args.lines, args.seed)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(source)
+    else:
+        sys.stdout.write(source)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,171 @@
+"""
+Numium Sampling Profiler - Where a Numium program spends its time, by source line
+Trình lấy mẫu hiệu năng: ánh xạ pc về dòng mã nguồn và hàm, in profile phẳng và collapsed stacks
+
+    python3 tools/numprof.py program.num [-O 1] [--target reg] [--interval 1]
+                             [--clock cpu|wall] [--collapsed out.folded] [--top 20]
+
+The program runs in the Python VM (vm.pyvm) with an interval timer. Each
+tick, the signal handler finds the VM's dispatch loop among the Python
+frames and copies its pc and call stack; nothing else is recorded, and the
+dispatch loop itself is not changed, so the cost is one short handler per
+interval (well under 1% at the default 1 ms). After the run, each pc is
+mapped to its code offset, the function that contains it (the nearest
+entry in the bytecode's function table) and the line in the LINE section.
+
+The flat profile goes to stderr: samples per line, then per function with
+the time spent in its callees included. --collapsed writes one line per
+distinct stack, "main:4;area_7:12 37", the input of flamegraph.pl and
+speedscope.
+"""
+
+import argparse
+import os
+import signal
+import sys
+from bisect import bisect_right
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+TOOLS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TOOLS, '..'))
+
+from vm.compiler.compiler import CompileError
+from vm.pyvm import VM, VMError, load_program
+from vm.pyvm.interpreter import CALL, RET
+
+# Dispatch loops whose locals hold pc (the next instruction) and frames (return pcs)
+DISPATCH_LOOPS = (VM._run_stack.__code__, VM._run_register.__code__)
+
+CLOCKS = {
+    'cpu': (signal.ITIMER_PROF, signal.SIGPROF),  # Process CPU time; a sleeping program gets no samples
+    'wall': (signal.ITIMER_REAL, signal.SIGALRM),
+}
+
+class Profiler:
+    """Samples a VM's call stack on a timer; samples maps raw stacks to counts"""
+    
+    def __init__(self, vm: VM, interval: float = 0.001, clock: str = 'cpu'):
+        self.vm = vm
+        self.interval = interval
+        self.timer, self.signal = CLOCKS[clock]
+        # (instruction index of each call site, ..., current instruction) -> samples
+        self.samples: Counter = Counter()
+        self.missed = 0  # Ticks outside the dispatch loop (decoding, output) or inside a RET
+        starts = sorted((offset, name) for name, offset in vm.bytecode.functions.items())
+        self.function_offsets = [offset for offset, _ in starts]
+        self.function_names = [name for _, name in starts]
+    
+    def sample(self, signum, frame):
+        while frame is not None and frame.f_code not in DISPATCH_LOOPS:
+            frame = frame.f_back
+        if frame is None:
+            self.missed += 1
+            return
+        local = frame.f_locals
+        pc = local['pc']
+        calls = [entry if type(entry) is int else entry[0] for entry in local['frames']]
+        # The tick may fall between the two steps of a CALL or RET
+        kind = self.vm.instructions[pc - 1][0] if pc else None
+        if kind == RET:  # Frame popped, pc not restored: the caller is unknown
+            self.missed += 1
+            return
+        if kind == CALL and calls and calls[-1] == pc:  # Frame pushed, callee not entered
+            calls.pop()
+        calls.append(pc)
+        self.samples[tuple(entry - 1 for entry in calls)] += 1  # Both point past the instruction
+    
+    def run(self) -> int:
+        previous = signal.signal(self.signal, self.sample)
+        signal.setitimer(self.timer, self.interval, self.interval)
+        try:
+            return self.vm.run()
+        finally:
+            signal.setitimer(self.timer, 0)
+            signal.signal(self.signal, previous)
+    
+    def location(self, index: int) -> Tuple[str, Optional[int]]:
+        """(function, line) of an instruction index; line is None without a line table"""
+        offset = self.vm.offsets[max(index, 0)]
+        entry = bisect_right(self.function_offsets, offset) - 1
+        function = self.function_names[entry] if entry >= 0 else '<top level>'
+        position = self.vm.bytecode.position(offset)
+        return function, position[0] if position else None
+    
+    def stacks(self) -> Dict[Tuple[Tuple[str, Optional[int]], ...], int]:
+        """Samples per stack of (function, line), outermost first"""
+        resolved: Counter = Counter()
+        for stack, count in self.samples.items():
+            resolved[tuple(self.location(index) for index in stack)] += count
+        return resolved
+    
+    def lines(self) -> Counter:
+        """Self samples per (function, line)"""
+        counts: Counter = Counter()
+        for stack, count in self.stacks().items():
+            counts[stack[-1]] += count
+        return counts
+    
+    def functions(self) -> Counter:
+        """Samples per function, callees included; recursion counts once"""
+        counts: Counter = Counter()
+        for stack, count in self.stacks().items():
+            for function in {function for function, _ in stack}:
+                counts[function] += count
+        return counts
+
+def frame_name(location: Tuple[str, Optional[int]]) -> str:
+    function, line = location
+    return function if line is None else f"{function}:{line}"
+
+def collapsed(profiler: Profiler) -> List[str]:
+    """One "outer;inner count" line per stack, in the folded format flamegraph tools read"""
+    return sorted(f"{';'.join(frame_name(location) for location in stack)} {count}"
+                  for stack, count in profiler.stacks().items())
+
+def report(profiler: Profiler, top: int = 20, out=sys.stderr):
+    total = sum(profiler.samples.values())
+    print(f"\n[numprof] {total} samples, {profiler.interval * 1000:g} ms interval"
+          + (f", {profiler.missed} outside the VM loop or in a return" if profiler.missed else ""), file=out)
+    if not total:
+        return
+    print(f"{'samples':>9} {'%':>6}  line", file=out)
+    for location, count in profiler.lines().most_common(top):
+        print(f"{count:9} {100 * count / total:6.1f}  {frame_name(location)}", file=out)
+    print(f"{'samples':>9} {'%':>6}  function (with callees)", file=out)
+    for function, count in profiler.functions().most_common(top):
+        print(f"{count:9} {100 * count / total:6.1f}  {function}", file=out)
+
+def main():
+    parser = argparse.ArgumentParser(description='Sample a Numium program and report time per source line')
+    parser.add_argument('program', help='Bytecode file (.numbc) or source file (.num)')
+    parser.add_argument('-O', dest='opt_level', type=int, choices=(0, 1, 2), default=0,
+                        help='Optimization level when compiling a .num source (default 0)')
+    parser.add_argument('--target', choices=('stack', 'reg'), default='stack',
+                        help='Bytecode kind when compiling a .num source (default stack)')
+    parser.add_argument('--interval', type=float, default=1.0, help='Sampling interval in ms (default 1)')
+    parser.add_argument('--clock', choices=tuple(CLOCKS), default='cpu',
+                        help='cpu: process CPU time (default); wall: also while waiting for input')
+    parser.add_argument('--collapsed', metavar='FILE', help='Write collapsed stacks for a flamegraph')
+    parser.add_argument('--top', type=int, default=20, help='Rows per table (default 20)')
+    args = parser.parse_args()
+    
+    try:
+        vm = VM(load_program(args.program, args.opt_level, args.target))
+        profiler = Profiler(vm, args.interval / 1000, args.clock)
+        profiler.run()
+    except (OSError, ValueError, CompileError, VMError) as e:
+        sys.stdout.flush()
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    sys.stdout.flush()
+    if not vm.bytecode.positions:
+        print("[numprof] no line table in this bytecode; recompile it for line numbers", file=sys.stderr)
+    report(profiler, args.top)
+    if args.collapsed:
+        with open(args.collapsed, 'w') as f:
+            f.writelines(line + '\n' for line in collapsed(profiler))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
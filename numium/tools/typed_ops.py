@@ -0,0 +1,51 @@
+"""
+Numium Typed Opcode Coverage
+Tỷ lệ phép toán được chọn opcode theo kiểu trên tập chương trình
+
+Compiles each program at -O1 and counts the arithmetic and comparison
+operators that got a typed opcode (ADD_INT, LT_FLOAT, ...; see
+vm/compiler/specialize.py). With no arguments it measures main.num,
+examples/ and the bench_register.py programs.
+"""
+
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'vm', 'compiler'))
+
+from compiler import Compiler
+from numiac import collect_inputs
+from bench_register import PROGRAMS
+
+def corpus(paths):
+    """(name, source) for each input; the default corpus without paths"""
+    if not paths:
+        paths = [os.path.join(HERE, '..', 'main.num'), os.path.join(HERE, '..', 'examples')]
+        for name, template in PROGRAMS.items():
+            yield f"bench_register:{name}", template.format(n=1000)
+    for path in collect_inputs(paths):
+        with open(path, 'r') as f:
+            yield os.path.relpath(path), f.read()
+
+def main():
+    total_typed = 0
+    total = 0
+    for name, source in corpus(sys.argv[1:]):
+        compiler = Compiler(source, opt_level=1)
+        try:
+            compiler.compile()
+        except Exception:
+            print(f"  {name:32} (does not compile)")
+            continue
+        typed, operators = compiler.typed_ops
+        total_typed += typed
+        total += operators
+        share = f"{typed / operators:.0%}" if operators else "-"
+        print(f"  {name:32} {typed:4} of {operators:4} typed  {share:>4}")
+    share = f"{total_typed / total:.1%}" if total else "-"
+    print(f"Total: {total_typed} of {total} arithmetic/comparison operators typed ({share})")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
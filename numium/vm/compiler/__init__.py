@@ -1,19 +1,38 @@
 """
 Initialize Numium compiler package
+
+The exports load their submodule on first use, so importing a light
+module such as vm.compiler.client does not load the compiler.
 """
 
-from .opcodes import Opcode, OPCODE_NAMES
-from .lexer import Lexer, Token, TokenType
-from .compiler import Compiler, Bytecode, compile_file
+import importlib
 
 __version__ = "0.1.0"
-__all__ = [
-    'Opcode',
-    'OPCODE_NAMES',
-    'Lexer',
-    'Token',
-    'TokenType',
-    'Compiler',
-    'Bytecode',
-    'compile_file',
-]
+
+# Exported name -> submodule that defines it
+_EXPORTS = {
+    'Opcode': 'opcodes',
+    'OPCODE_NAMES': 'opcodes',
+    'Lexer': 'lexer',
+    'Token': 'lexer',
+    'TokenType': 'lexer',
+    'Compiler': 'compiler',
+    'Bytecode': 'compiler',
+    'CompileError': 'compiler',
+    'CompileOptions': 'compiler',
+    'compile_file': 'compiler',
+    'compile_source': 'compiler',
+}
+
+__all__ = list(_EXPORTS)
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f'.{module}', __name__), name)
+    globals()[name] = value  # Later lookups skip __getattr__
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
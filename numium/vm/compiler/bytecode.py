@@ -0,0 +1,231 @@
+"""
+Numium Bytecode - Compiled program container
+Chứa bytecode, hằng số, biến và bảng hàm
+"""
+
+import struct
+from array import array
+from bisect import bisect_right
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+try:
+    from .opcodes import OPERAND_COUNTS, OPERAND_KINDS, SWITCH_ENTRY_KINDS, switch_kinds
+    from . import numbc
+except ImportError:  # run as a script from vm/compiler
+    from opcodes import OPERAND_COUNTS, OPERAND_KINDS, SWITCH_ENTRY_KINDS, switch_kinds
+    import numbc
+
+# Instruction layouts: opcode byte, then 4-byte little-endian operands
+INSTRUCTION_LAYOUTS = {count: struct.Struct('<B' + 'I' * count)
+                       for count in set(OPERAND_COUNTS.values()) | {0}}
+OPERAND = struct.Struct('<I')
+
+def constant_key(value: Any) -> Tuple[type, Any]:
+    """Constant pool key; equal values of different types (1, 1.0, true) stay distinct"""
+    if type(value) is float:
+        return float, value.hex()  # Also keeps -0.0 apart from 0.0
+    return type(value), value
+
+def table_length(code: bytes, pc: int) -> int:
+    """Operands in the table of the switch instruction at pc"""
+    opcode = code[pc]
+    count = OPERAND.unpack_from(code, pc + 1 + 4 * OPERAND_KINDS[opcode].index('n'))[0]
+    return count * len(SWITCH_ENTRY_KINDS[opcode])
+
+def iter_instructions(code: bytes) -> Iterator[Tuple[int, int, Tuple[int, ...]]]:
+    """Yield (offset, opcode, operands) for each instruction of a code stream
+    
+    A switch's operands include its whole table.
+    """
+    layouts = INSTRUCTION_LAYOUTS
+    operand_counts = OPERAND_COUNTS
+    switches = SWITCH_ENTRY_KINDS
+    pc = 0
+    end = len(code)
+    while pc < end:
+        opcode = code[pc]
+        layout = layouts[operand_counts.get(opcode, 0)]
+        operands = layout.unpack_from(code, pc)[1:]
+        size = layout.size
+        if opcode in switches:
+            length = table_length(code, pc)
+            operands += struct.unpack_from(f'<{length}I', code, pc + size)
+            size += 4 * length
+        yield pc, opcode, operands
+        pc += size
+
+class Bytecode:
+    """Bytecode output"""
+    
+    FLAGS = 0  # numbc header flags that mark this kind of code
+    # Operand kinds and their sizes in bytes, to find the jumps in a switch table
+    OPERAND_KINDS = OPERAND_KINDS
+    SWITCH_ENTRY_KINDS = SWITCH_ENTRY_KINDS
+    OPERAND_WIDTHS = dict.fromkeys('cvljn', 4)
+    
+    def __init__(self):
+        self.code = bytearray()
+        self.constants: List[Any] = []
+        self.variables: Dict[str, int] = {}
+        self.functions: Dict[str, int] = {}
+        self.frame_sizes: Dict[str, int] = {}  # Function -> local slots in its call frame
+        # (code offset, line, column) where the source position changes, by offset
+        self.positions: List[Tuple[int, int, int]] = []
+        self.constant_index: Dict[Tuple[type, Any], int] = {}
+        # Separate compilation: imported libraries, CALL operand offset -> function
+        # defined in another unit, and the cache key of the source (see linker.py)
+        self.imports: List[str] = []
+        self.external_calls: Dict[int, str] = {}
+        self.source_key = ''
+        # Flat typed arrays keep jump bookkeeping small on big programs
+        self.labels = array('q')  # Label -> code offset, -1 until bound
+        self.relocations = array('Q')  # Pairs of (operand offset, label)
+    
+    def emit(self, opcode: int, *args: int):
+        """Emit an opcode instruction"""
+        # Always emit every operand the opcode takes; missing ones are 0
+        count = OPERAND_COUNTS.get(opcode, 0)
+        if len(args) != count:
+            if opcode in SWITCH_ENTRY_KINDS:  # Table included
+                self.code += struct.pack(f'<B{len(args)}I', opcode, *args)
+                return
+            args = (args + (0,) * count)[:count]
+        self.code += INSTRUCTION_LAYOUTS[count].pack(opcode, *args)
+    
+    def mark(self, line: int, column: int = 0):
+        """Attribute the code emitted from here on to a source position"""
+        positions = self.positions
+        offset = len(self.code)
+        if positions and positions[-1][0] == offset:
+            positions.pop()  # Nothing was emitted for the previous position
+        if not positions or positions[-1][1] != line or positions[-1][2] != column:
+            positions.append((offset, line, column))
+    
+    def position(self, offset: int) -> Optional[Tuple[int, int]]:
+        """(line, column) of the instruction at offset, None when unknown"""
+        index = bisect_right(self.positions, (offset, float('inf'))) - 1
+        if index < 0:
+            return None
+        return self.positions[index][1:]
+    
+    def new_label(self) -> int:
+        """Create a jump label; bind it with bind_label()"""
+        self.labels.append(-1)
+        return len(self.labels) - 1
+    
+    def bind_label(self, label: int):
+        """Place label at the current end of code"""
+        self.labels[label] = len(self.code)
+    
+    def emit_jump(self, opcode: int, label: int, *args: int):
+        """Emit a jump to label; its target operand is filled in by resolve_labels()"""
+        self.emit(opcode, *args)
+        self.relocations.extend((len(self.code) - OPERAND.size, label))
+    
+    def emit_switch(self, opcode: int, *args: int):
+        """Emit a switch with its table; every jump operand ('j') is given as a label"""
+        at = len(self.code) + 1
+        self.emit(opcode, *args)
+        kinds = switch_kinds(opcode, args, self.OPERAND_KINDS, self.SWITCH_ENTRY_KINDS)
+        for kind, value in zip(kinds, args):
+            if kind == 'j':
+                self.relocations.extend((at, value))
+            at += self.OPERAND_WIDTHS[kind]
+    
+    def resolve_labels(self):
+        """Write the 32-bit offset of every bound label into the jumps that use it"""
+        code = self.code
+        labels = self.labels
+        pack_into = OPERAND.pack_into
+        relocations = self.relocations
+        for index in range(0, len(relocations), 2):
+            at = relocations[index]
+            target = labels[relocations[index + 1]]
+            if target < 0:
+                raise ValueError(f"Jump before offset {at} to a label that was never bound")
+            pack_into(code, at, target)
+        del relocations[:]
+    
+    def add_constant(self, value: Any) -> int:
+        """Add a constant, or find the pooled one of the same type and value, and return its index"""
+        key = constant_key(value)
+        index = self.constant_index.get(key)
+        if index is None:
+            index = len(self.constants)
+            self.constants.append(value)
+            self.constant_index[key] = index
+        return index
+    
+    def add_variable(self, name: str) -> int:
+        """Add a variable and return its index"""
+        if name not in self.variables:
+            self.variables[name] = len(self.variables)
+        return self.variables[name]
+    
+    def instruction_count(self) -> int:
+        """Number of instructions in the code stream"""
+        code = self.code
+        operands = OPERAND_COUNTS
+        count = 0
+        pc = 0
+        switches = SWITCH_ENTRY_KINDS
+        while pc < len(code):
+            opcode = code[pc]
+            if opcode in switches:
+                pc += 4 * table_length(code, pc)
+            pc += 1 + 4 * operands.get(opcode, 0)
+            count += 1
+        return count
+    
+    def to_bytes(self) -> bytes:
+        """The whole .numbc v2 file in memory: code, constants, names and link metadata"""
+        return numbc.encode(self.code, self.constants, self.variables, self.functions,
+                            self.imports, self.external_calls, self.source_key,
+                            frame_sizes=self.frame_sizes, positions=self.positions)
+    
+    def to_file(self, filename: str):
+        """Write bytecode to a .numbc v2 file"""
+        with open(filename, 'wb') as f:
+            f.write(self.to_bytes())
+    
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'Bytecode':
+        """Load what to_bytes() wrote; raises numbc.NumbcError on anything else"""
+        with numbc.NumbcImage(data) as image:
+            return cls.from_image(image)
+    
+    @classmethod
+    def from_image(cls, image: numbc.NumbcImage, name: str = 'data') -> 'Bytecode':
+        """Decode an open container; name is used in errors"""
+        if image.flags & numbc.FLAG_REGISTER != cls.FLAGS:
+            kind = 'register' if image.flags & numbc.FLAG_REGISTER else 'stack'
+            raise numbc.NumbcError(f"{name} holds {kind} bytecode")
+        bytecode = cls()
+        bytecode.imports = image.imports()
+        bytecode.external_calls = image.external_calls()
+        bytecode.source_key = image.source_key()
+        bytecode.frame_sizes = image.frame_sizes()
+        bytecode.positions = image.positions()
+        bytecode.fill(image.code.tobytes(), image.constants(), image.variables(), image.functions())
+        return bytecode
+    
+    @classmethod
+    def from_file(cls, filename: str) -> 'Bytecode':
+        """Load a .numbc file, v2 or the older code + .meta.json pair"""
+        with open(filename, 'rb') as f:
+            is_container = numbc.is_container(f.read(len(numbc.MAGIC)))
+        if is_container:
+            with numbc.NumbcImage.open(filename) as image:
+                return cls.from_image(image, filename)
+        bytecode = cls()
+        bytecode.fill(*numbc.load_legacy(filename))
+        return bytecode
+    
+    def fill(self, code: bytes, constants: List[Any], variables: Dict[str, int],
+             functions: Dict[str, int]):
+        """Set the code and tables of a freshly created container"""
+        self.code[:] = code
+        self.constants.extend(constants)
+        for index, value in enumerate(constants):
+            self.constant_index.setdefault(constant_key(value), index)
+        self.variables.update(variables)
+        self.functions.update(functions)
@@ -0,0 +1,139 @@
+"""
+Numium Compile Cache - Reuse .numbc output for unchanged sources
+Bộ nhớ đệm biên dịch theo hash nội dung, giống __pycache__
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+from typing import Dict, Optional
+try:
+    from . import numbc
+except ImportError:  # run as a script from vm/compiler
+    import numbc
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+_fingerprint: Optional[str] = None
+
+def default_cache_dir() -> str:
+    """$NUMIUM_CACHE_DIR, else $XDG_CACHE_HOME/numium, else ~/.cache/numium"""
+    directory = os.environ.get('NUMIUM_CACHE_DIR')
+    if directory:
+        return directory
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'numium')
+
+def compiler_fingerprint() -> str:
+    """Hash of the compiler's own modules; any compiler change gives new cache keys"""
+    global _fingerprint
+    if _fingerprint is None:
+        digest = hashlib.sha256(b'numbc %d' % numbc.FORMAT_VERSION)
+        here = os.path.dirname(os.path.abspath(__file__))
+        for name in sorted(os.listdir(here)):
+            if name.endswith('.py'):
+                digest.update(name.encode('utf-8'))
+                with open(os.path.join(here, name), 'rb') as f:
+                    digest.update(f.read())
+        _fingerprint = digest.hexdigest()
+    return _fingerprint
+
+def cache_key(source: bytes, opt_level: int, library: bool = False, target: str = 'stack') -> str:
+    """Key for a source text compiled with the given flags by this compiler"""
+    digest = hashlib.sha256(compiler_fingerprint().encode('ascii'))
+    flags = b'-O%d' % opt_level
+    if library:
+        flags += b' -c'
+    if target != 'stack':
+        flags += b' --target=' + target.encode('ascii')
+    digest.update(flags + b'\0')
+    digest.update(source)
+    return digest.hexdigest()
+
+class CompileCache:
+    """Directory of <key>.numbc files, bounded to max_bytes by least-recent use
+    
+    A hit refreshes the entry's mtime, so eviction removes the entries
+    that have gone longest without being used.
+    """
+    
+    SUFFIX = '.numbc'
+    
+    def __init__(self, directory: Optional[str] = None, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory or default_cache_dir()
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + self.SUFFIX)
+    
+    def fetch(self, key: str, output_filename: str) -> bool:
+        """Copy the cached output for key to output_filename; False on a miss"""
+        cached = self.path(key)
+        try:
+            shutil.copyfile(cached, output_filename)
+            os.utime(cached)
+        except FileNotFoundError:
+            self.misses += 1
+            return False
+        self.hits += 1
+        return True
+    
+    def store(self, key: str, output_filename: str):
+        """Add a freshly written output file, then evict down to max_bytes"""
+        os.makedirs(self.directory, exist_ok=True)
+        # Write under a temporary name so readers never see a partial entry
+        fd, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        os.close(fd)
+        try:
+            shutil.copyfile(output_filename, temporary)
+            os.replace(temporary, self.path(key))
+        except BaseException:
+            os.unlink(temporary)
+            raise
+        self.evict()
+    
+    def entries(self) -> Dict[str, os.stat_result]:
+        """Cached file path -> stat"""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return {}
+        entries = {}
+        for name in names:
+            if name.endswith(self.SUFFIX):
+                path = os.path.join(self.directory, name)
+                try:
+                    entries[path] = os.stat(path)
+                except FileNotFoundError:  # Evicted by another process
+                    pass
+        return entries
+    
+    def evict(self):
+        """Remove least recently used entries until the cache fits in max_bytes"""
+        entries = self.entries()
+        total = sum(stat.st_size for stat in entries.values())
+        for path, stat in sorted(entries.items(), key=lambda item: item[1].st_mtime):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= stat.st_size
+            self.evictions += 1
+    
+    def clear(self):
+        for path in self.entries():
+            os.unlink(path)
+    
+    def stats(self) -> str:
+        """One-line summary of this session's lookups and the directory's contents"""
+        entries = self.entries()
+        size = sum(stat.st_size for stat in entries.values())
+        return (f"Cache {self.directory}: {self.hits} hits, {self.misses} misses, "
+                f"{self.evictions} evicted; {len(entries)} entries, "
+                f"{size / 1024:.1f} KiB of {self.max_bytes / (1024 * 1024):.0f} MiB")
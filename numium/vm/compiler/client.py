@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Numium Compile Client - Send numiac commands to a running numiac --serve
+Gửi lệnh biên dịch tới tiến trình numiac --serve qua Unix socket
+
+    numiac-client [--socket PATH] <numiac arguments>
+    numiac-client [--socket PATH] --stop
+
+Only the standard library modules needed to talk to the socket are
+imported (vm.compiler's exports load lazily), so the client starts about
+as fast as the interpreter itself; the server already has the compiler
+loaded. The request is one JSON line with the arguments,
+the working directory and the NUMIUM_* / XDG_CACHE_HOME environment; the
+reply is one JSON line with numiac's exit status, stdout and stderr. When
+no server is listening, the client compiles in-process instead.
+"""
+
+import json
+import os
+import socket
+import sys
+from typing import Any, Dict, List, Optional
+
+# Environment the server applies per request (cache location)
+FORWARDED_PREFIXES = ('NUMIUM_', 'XDG_CACHE_HOME')
+
+def default_socket() -> str:
+    """$NUMIAC_SOCKET, else numiac-<uid>.sock in $TMPDIR or /tmp"""
+    path = os.environ.get('NUMIAC_SOCKET')
+    if path:
+        return path
+    user = os.getuid() if hasattr(os, 'getuid') else 0
+    return os.path.join(os.environ.get('TMPDIR') or '/tmp', f"numiac-{user}.sock")
+
+def send_message(connection: socket.socket, message: Dict[str, Any]):
+    connection.sendall(json.dumps(message).encode('utf-8') + b'\n')
+
+def read_message(stream) -> Optional[Dict[str, Any]]:
+    """Next JSON line from a binary file object; None at end of stream"""
+    line = stream.readline()
+    return json.loads(line) if line else None
+
+def request(message: Dict[str, Any], path: Optional[str] = None) -> Dict[str, Any]:
+    """Send one request and wait for its reply; OSError when no server listens"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(path or default_socket())
+        send_message(connection, message)
+        with connection.makefile('rb') as stream:
+            reply = read_message(stream)
+    if reply is None:
+        raise ConnectionError("numiac server closed the connection without a reply")
+    return reply
+
+def compile_request(argv: List[str]) -> Dict[str, Any]:
+    environment = {name: value for name, value in os.environ.items()
+                   if name.startswith(FORWARDED_PREFIXES)}
+    return {'argv': argv, 'cwd': os.getcwd(), 'env': environment}
+
+def run_locally(argv: List[str]) -> int:
+    try:
+        from .numiac import main as numiac_main
+    except ImportError:  # run as a script from vm/compiler
+        from numiac import main as numiac_main
+    return numiac_main(argv)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    argv = list(sys.argv[1:] if argv is None else argv)
+    path = None
+    stop = False
+    while argv and argv[0] in ('--socket', '--stop'):
+        option = argv.pop(0)
+        if option == '--stop':
+            stop = True
+        elif argv:
+            path = argv.pop(0)
+        else:
+            print("numiac-client: --socket needs a path", file=sys.stderr)
+            return 2
+    
+    try:
+        reply = request({'stop': True} if stop else compile_request(argv), path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        if stop:
+            print("numiac-client: no server is running", file=sys.stderr)
+            return 1
+        return run_locally(argv)
+    sys.stdout.write(reply.get('stdout', ''))
+    sys.stderr.write(reply.get('stderr', ''))
+    return reply.get('status', 1)
+
+if __name__ == '__main__':
+    sys.exit(main())
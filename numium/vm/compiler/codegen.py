@@ -0,0 +1,328 @@
+"""
+Numium Code Generator - Emit stack bytecode from the IR
+Sinh bytecode cho VM stack từ cây IR
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+try:
+    from .bytecode import Bytecode
+    from .lexer import SourceError
+    from .opcodes import Opcode
+    from .ir import (Node, Const, Var, Binary, EnvDecl, Call, ExprStmt, If, While, For, Switch, Try,
+                     Return, Stop, Continue, Pass, Halt, Function, Import, Init, ClassDef,
+                     Program, function_locals)
+except ImportError:  # run as a script from vm/compiler
+    from bytecode import Bytecode
+    from lexer import SourceError
+    from opcodes import Opcode
+    from ir import (Node, Const, Var, Binary, EnvDecl, Call, ExprStmt, If, While, For, Switch, Try,
+                    Return, Stop, Continue, Pass, Halt, Function, Import, Init, ClassDef,
+                    Program, function_locals)
+
+# Relative cost of a table and a binary-searched key list, in 4-byte words
+# plus 3 per probe (as javac weighs tableswitch against lookupswitch)
+_PROBE_COST = 3
+
+def plan_switch(node: Switch) -> Tuple[Optional[int], List[Tuple[Any, int]]]:
+    """Dispatch for a switch: (opcode, keys)
+    
+    keys are (case value, arm index). The opcode is TABLESWITCH for dense
+    int keys, LOOKUPSWITCH for other int keys or string keys, both with
+    the keys sorted, or None for a chain of EQ tests in source order.
+    """
+    keys = [(value.value, arm) for arm, (values, _) in enumerate(node.cases) for value in values]
+    types = {type(value) for value, _ in keys}
+    if types == {int}:
+        keys.sort()
+        span = keys[-1][0] - keys[0][0] + 1
+        table_cost = 4 + span + _PROBE_COST * 3
+        lookup_cost = 3 + 2 * len(keys) + _PROBE_COST * len(keys)
+        return (Opcode.TABLESWITCH if table_cost <= lookup_cost else Opcode.LOOKUPSWITCH), keys
+    if types == {str}:
+        keys.sort()  # Code point order is the order of the UTF-8 bytes the VM compares
+        return Opcode.LOOKUPSWITCH, keys
+    return None, keys
+
+class CodeGenerator:
+    """Walk a Program and emit its bytecode
+    
+    Top-level code comes first and `module` bodies after it, so execution
+    starting at offset 0 never falls into a function. A program ends its
+    top-level code with HALT; a library (library=True) jumps over its
+    functions instead, so linked units run their top-level code in turn.
+    CALLs to functions this unit does not define are left for the linker
+    in bytecode.external_calls. Names local to a module (see
+    ir.function_locals) live in its call frame: LOAD_LOCAL/STORE_LOCAL
+    slots, with the frame size in bytecode.frame_sizes.
+    
+    `for (i) on range(n)` keeps n in a hidden variable of the same kind as
+    i, named after its nesting depth (`for#0`, or `down.for#0` in a module
+    that loops over a global), and spends one FOR_RANGE_NEXT per iteration.
+    A switch dispatches with one TABLESWITCH or LOOKUPSWITCH where its case
+    values allow (see plan_switch).
+    """
+    
+    def __init__(self, library: bool = False):
+        self.bytecode = Bytecode()
+        self.library = library
+        self.function_labels: Dict[str, int] = {}
+        self.deferred: List[Function] = []
+        self.end_label = self.bytecode.new_label()
+        self.scopes: Dict[str, Dict[str, int]] = {}
+        self.locals: Dict[str, int] = {}  # Slots of the module being emitted
+        self.function = ''  # Module being emitted, '' for top-level code
+        self.loops: List[Tuple[int, int]] = []  # (continue label, stop label), innermost last
+    
+    def generate(self, program: Program) -> Bytecode:
+        bytecode = self.bytecode
+        for statement in program.body:
+            if type(statement) is Function:
+                self.function_labels[statement.name] = bytecode.new_label()
+        self.deferred = [statement for statement in program.body
+                         if type(statement) is Function and statement.kind == 'module']
+        self.scopes = function_locals(program)
+        
+        self.gen_block(program.body)
+        for function in self.deferred:
+            self.gen_function_body(function)
+        bytecode.bind_label(self.end_label)
+        bytecode.resolve_labels()
+        return bytecode
+    
+    def gen_block(self, body: List[Node]):
+        handlers = self.STATEMENT_HANDLERS
+        mark = self.bytecode.mark
+        for statement in body:
+            mark(statement.line, statement.column)
+            handlers[type(statement)](self, statement)
+    
+    def gen_expression(self, expr: Node):
+        """Emit an expression tree in postfix order
+        
+        Uses an explicit stack instead of recursion; an operator's opcode
+        is pushed below its operands and emitted when it comes back up.
+        """
+        bytecode = self.bytecode
+        code = bytecode.code
+        emit = bytecode.emit
+        add_constant = bytecode.add_constant
+        add_variable = bytecode.add_variable
+        local_slots = self.locals
+        stack = [expr]
+        while stack:
+            node = stack.pop()
+            kind = type(node)
+            if kind is int:
+                code.append(node)
+            elif kind is Binary:
+                stack += (node.op, node.right, node.left)
+            elif kind is Const:
+                emit(Opcode.PUSH, add_constant(node.value))
+            elif kind is Var:
+                slot = local_slots.get(node.name)
+                if slot is None:
+                    emit(Opcode.LOAD_VAR, add_variable(node.name))
+                else:
+                    emit(Opcode.LOAD_LOCAL, slot)
+            else:
+                stack += (node.op, node.operand)
+    
+    def gen_env(self, node: EnvDecl):
+        slot = self.locals.get(node.name)
+        if slot is not None:
+            self.gen_expression(node.value)
+            self.bytecode.emit(Opcode.STORE_LOCAL, slot)
+            return
+        var_idx = self.bytecode.add_variable(node.name)
+        self.gen_expression(node.value)
+        self.bytecode.emit(Opcode.STORE_VAR, var_idx)
+    
+    def gen_call(self, node: Call):
+        for arg in node.args:
+            self.gen_expression(arg)
+        
+        # Emit special handling for built-in functions
+        if node.name == 'output':
+            self.bytecode.emit(Opcode.OUTPUT)
+        elif node.name == 'input':
+            self.bytecode.emit(Opcode.INPUT)
+        else:
+            # User function call: CALL <entry offset>
+            label = self.function_labels.get(node.name)
+            if label is not None:
+                self.bytecode.emit_jump(Opcode.CALL, label)
+            else:
+                self.bytecode.emit(Opcode.CALL, 0)
+                self.bytecode.external_calls[len(self.bytecode.code) - 4] = node.name
+    
+    def gen_expr_stmt(self, node: ExprStmt):
+        self.gen_expression(node.expr)
+    
+    def gen_if(self, node: If):
+        bytecode = self.bytecode
+        self.gen_expression(node.cond)
+        else_label = bytecode.new_label()
+        bytecode.emit_jump(Opcode.JMP_IFNOT, else_label)
+        self.gen_block(node.body)
+        
+        if node.orelse is not None:
+            end_label = bytecode.new_label()
+            bytecode.emit_jump(Opcode.JMP, end_label)
+            bytecode.bind_label(else_label)
+            self.gen_block(node.orelse)
+            bytecode.bind_label(end_label)
+        else:
+            bytecode.bind_label(else_label)
+    
+    def gen_while(self, node: While):
+        bytecode = self.bytecode
+        loop_label = bytecode.new_label()
+        end_label = bytecode.new_label()
+        bytecode.bind_label(loop_label)
+        self.gen_expression(node.cond)
+        bytecode.emit_jump(Opcode.JMP_IFNOT, end_label)
+        self.loops.append((loop_label, end_label))
+        self.gen_block(node.body)
+        self.loops.pop()
+        bytecode.mark(node.line, node.column)  # The loop's own step and jump back
+        bytecode.emit_jump(Opcode.JMP, loop_label)
+        bytecode.bind_label(end_label)
+    
+    def gen_for(self, node: For):
+        """i = 0 .. n - 1; the count is evaluated once, i holds n (or where `stop` left it) after"""
+        bytecode = self.bytecode
+        limit = f"for#{len(self.loops)}"
+        counter = self.locals.get(node.var)
+        if counter is not None:
+            init, step = Opcode.FOR_LOCAL_INIT, Opcode.FOR_LOCAL_NEXT
+            bound = self.locals.setdefault(limit, len(self.locals))
+        else:
+            init, step = Opcode.FOR_RANGE_INIT, Opcode.FOR_RANGE_NEXT
+            counter = bytecode.add_variable(node.var)
+            bound = bytecode.add_variable(f"{self.function}.{limit}" if self.function else limit)
+        
+        body_label = bytecode.new_label()
+        next_label = bytecode.new_label()
+        end_label = bytecode.new_label()
+        self.gen_expression(node.count)
+        bytecode.emit_jump(init, end_label, counter, bound)
+        bytecode.bind_label(body_label)
+        self.loops.append((next_label, end_label))
+        self.gen_block(node.body)
+        self.loops.pop()
+        bytecode.mark(node.line, node.column)  # The loop's own step and jump back
+        bytecode.bind_label(next_label)
+        bytecode.emit_jump(step, body_label, counter, bound)
+        bytecode.bind_label(end_label)
+    
+    def gen_stop(self, node: Stop):
+        self.bytecode.emit_jump(Opcode.JMP, self.loop_labels(node, 'stop')[1])
+    
+    def gen_continue(self, node: Continue):
+        self.bytecode.emit_jump(Opcode.JMP, self.loop_labels(node, 'continue')[0])
+    
+    def loop_labels(self, node: Node, keyword: str) -> Tuple[int, int]:
+        if not self.loops:
+            raise SourceError(f"'{keyword}' outside a loop", node.line, node.column)
+        return self.loops[-1]
+    
+    def gen_switch(self, node: Switch):
+        """Dispatch, then the default arm, then the case arms, each jumping to the end"""
+        bytecode = self.bytecode
+        add_constant = bytecode.add_constant
+        arms = [bytecode.new_label() for _ in node.cases]
+        default_label = bytecode.new_label()
+        end_label = bytecode.new_label()
+        opcode, keys = plan_switch(node)
+        self.gen_expression(node.subject)
+        
+        if opcode == Opcode.TABLESWITCH:
+            low = keys[0][0]
+            targets = [default_label] * (keys[-1][0] - low + 1)
+            for value, arm in keys:
+                targets[value - low] = arms[arm]
+            bytecode.emit_switch(opcode, add_constant(low), len(targets), default_label, *targets)
+        elif opcode == Opcode.LOOKUPSWITCH:
+            table = []
+            for value, arm in keys:
+                table += (add_constant(value), arms[arm])
+            bytecode.emit_switch(opcode, len(keys), default_label, *table)
+        else:
+            # The subject stays on the stack until an arm (or the default) pops it
+            for value, arm in keys:
+                bytecode.emit(Opcode.DUP)
+                bytecode.emit(Opcode.PUSH, add_constant(value))
+                bytecode.emit(Opcode.EQ)
+                bytecode.emit_jump(Opcode.JMP_IF, arms[arm])
+            bytecode.emit(Opcode.POP)
+        
+        bytecode.bind_label(default_label)
+        self.gen_block(node.default or [])
+        for label, (_, body) in zip(arms, node.cases):
+            bytecode.emit_jump(Opcode.JMP, end_label)
+            bytecode.bind_label(label)
+            if opcode is None:
+                bytecode.emit(Opcode.POP)
+            self.gen_block(body)
+        bytecode.bind_label(end_label)
+    
+    def gen_try(self, node: Try):
+        self.gen_block(node.body)
+        self.gen_block(node.handler)
+    
+    def gen_return(self, node: Return):
+        if node.value is not None:
+            self.gen_expression(node.value)
+        self.bytecode.emit(Opcode.RET)
+    
+    def gen_halt(self, node: Halt):
+        if not self.library:
+            self.bytecode.emit(Opcode.HALT)
+        elif self.deferred:
+            self.bytecode.emit_jump(Opcode.JMP, self.end_label)
+    
+    def gen_function(self, node: Function):
+        if node.kind != 'module':  # Modules are emitted after the top-level code
+            self.gen_function_body(node)
+    
+    def gen_function_body(self, node: Function):
+        self.bytecode.bind_label(self.function_labels[node.name])
+        self.bytecode.functions[node.name] = len(self.bytecode.code)
+        if node.kind != 'module':  # `area` code runs without a frame
+            self.gen_block(node.body)
+            return
+        # Entered by CALL; loops may add slots for their counts
+        self.locals = dict(self.scopes[node.name])
+        self.function = node.name
+        self.gen_block(node.body)
+        self.bytecode.frame_sizes[node.name] = len(self.locals)
+        self.locals = {}
+        self.function = ''
+    
+    def gen_import(self, node: Import):
+        if node.name not in self.bytecode.imports:
+            self.bytecode.imports.append(node.name)
+    
+    def gen_nothing(self, node: Node):
+        pass
+    
+    # IR node type -> emit method
+    STATEMENT_HANDLERS = {
+        EnvDecl: gen_env,
+        Call: gen_call,
+        ExprStmt: gen_expr_stmt,
+        If: gen_if,
+        While: gen_while,
+        For: gen_for,
+        Switch: gen_switch,
+        Try: gen_try,
+        Return: gen_return,
+        Stop: gen_stop,
+        Continue: gen_continue,
+        Pass: gen_nothing,
+        Halt: gen_halt,
+        Function: gen_function,
+        Import: gen_import,
+        Init: gen_nothing,
+        ClassDef: gen_nothing,
+    }
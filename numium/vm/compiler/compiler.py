@@ -3,73 +3,143 @@ Numium Compiler - Convert Numium code to bytecode
 Biên dịch mã Numium thành bytecode
 """
 
-import struct
-import json
-from typing import List, Dict, Any, Optional
-from lexer import Lexer, Token, TokenType
-from opcodes import Opcode, OPCODE_NAMES
+import os
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Iterator, List, Deque, Dict, Mapping, Optional, Sequence
+try:
+    from .lexer import Lexer, SourceError, Token, TokenType, TokenKind
+    from .opcodes import Opcode, OPCODE_NAMES
+    from .tokenbuffer import TokenBuffer
+    from .bytecode import Bytecode, constant_key
+    from .ir import (Node, Const, Var, Unary, Binary, EnvDecl, Call, ExprStmt, If, While, For,
+                     Switch, Try, Return, Stop, Continue, Pass, Halt, Function, Import, Init,
+                     ClassDef, Program)
+    from .optimizer import INT64_MIN, INT64_MAX, optimize
+    from .specialize import specialize, type_table
+    from .codegen import CodeGenerator
+    from .regcodegen import RegisterBytecode, RegisterGenerator
+    from .peephole import optimize_bytecode
+    from .cache import CompileCache, cache_key
+    from .linker import (BUILTIN_LIBRARIES, LinkError, find_library, import_order, link,
+                         linked_imports, object_file)
+    from .numbc import NumbcImage
+    from .stats import CompileStats
+except ImportError:  # run as a script from vm/compiler
+    from lexer import Lexer, SourceError, Token, TokenType, TokenKind
+    from opcodes import Opcode, OPCODE_NAMES
+    from tokenbuffer import TokenBuffer
+    from bytecode import Bytecode, constant_key
+    from ir import (Node, Const, Var, Unary, Binary, EnvDecl, Call, ExprStmt, If, While, For,
+                    Switch, Try, Return, Stop, Continue, Pass, Halt, Function, Import, Init,
+                    ClassDef, Program)
+    from optimizer import INT64_MIN, INT64_MAX, optimize
+    from specialize import specialize, type_table
+    from codegen import CodeGenerator
+    from regcodegen import RegisterBytecode, RegisterGenerator
+    from peephole import optimize_bytecode
+    from cache import CompileCache, cache_key
+    from linker import (BUILTIN_LIBRARIES, LinkError, find_library, import_order, link,
+                        linked_imports, object_file)
+    from numbc import NumbcImage
+    from stats import CompileStats
 
-class Bytecode:
-    """Bytecode output"""
-    def __init__(self):
-        self.code: List[int] = []
-        self.constants: List[Any] = []
-        self.variables: Dict[str, int] = {}
-        self.functions: Dict[str, int] = {}
-        self.metadata: Dict[str, Any] = {
-            'version': 1,
-            'constants': self.constants,
-            'variables': self.variables,
-            'functions': self.functions,
-        }
-    
-    def emit(self, opcode: int, arg: int = 0):
-        """Emit an opcode instruction"""
-        self.code.append(opcode)
-        # Always emit argument for opcodes that take arguments
-        if opcode in (Opcode.PUSH, Opcode.LOAD_VAR, Opcode.STORE_VAR, Opcode.INIT_VAR, 
-                      Opcode.JMP, Opcode.JMP_IF, Opcode.JMP_IFNOT, Opcode.CALL):
-            # Emit argument as 4 bytes (little-endian)
-            self.code.extend([arg & 0xFF, (arg >> 8) & 0xFF, (arg >> 16) & 0xFF, (arg >> 24) & 0xFF])
-    
-    def add_constant(self, value: Any) -> int:
-        """Add a constant and return its index"""
-        self.constants.append(value)
-        return len(self.constants) - 1
-    
-    def add_variable(self, name: str) -> int:
-        """Add a variable and return its index"""
-        if name not in self.variables:
-            self.variables[name] = len(self.variables)
-        return self.variables[name]
-    
-    def to_bytes(self) -> bytes:
-        """Convert to bytecode bytes"""
-        return bytes(self.code)
-    
-    def to_file(self, filename: str):
-        """Write bytecode to file"""
-        with open(filename, 'wb') as f:
-            f.write(self.to_bytes())
-        
-        # Also write metadata as JSON
-        metadata_file = filename.replace('.numbc', '.meta.json')
-        with open(metadata_file, 'w') as f:
-            json.dump(self.metadata, f, indent=2)
+# Keywords that end a block; the enclosing construct consumes them
+BLOCK_TERMINATORS = frozenset({
+    TokenKind.KW_CLOSE, TokenKind.KW_END, TokenKind.KW_ELSE,
+    TokenKind.KW_CATCH, TokenKind.KW_CASE, TokenKind.EOF,
+})
+
+# Binary operators: token kind -> (precedence, opcode). Higher binds tighter.
+BINARY_OPERATORS = {
+    TokenKind.KW_OR: (1, Opcode.OR_OP),
+    TokenKind.KW_AND: (2, Opcode.AND_OP),
+    TokenKind.EQ: (3, Opcode.EQ),
+    TokenKind.NE: (3, Opcode.NE),
+    TokenKind.LT: (4, Opcode.LT),
+    TokenKind.LE: (4, Opcode.LE),
+    TokenKind.GT: (4, Opcode.GT),
+    TokenKind.GE: (4, Opcode.GE),
+    TokenKind.PLUS: (5, Opcode.ADD),
+    TokenKind.MINUS: (5, Opcode.SUB),
+    TokenKind.STAR: (6, Opcode.MUL),
+    TokenKind.SLASH: (6, Opcode.DIV),
+    TokenKind.PERCENT: (6, Opcode.MOD),
+}
+
+# Prefix operators: token kind -> opcode, all at UNARY_PRECEDENCE
+UNARY_OPERATORS = {
+    TokenKind.MINUS: Opcode.NEG,
+    TokenKind.NOT: Opcode.NOT_OP,
+}
+UNARY_PRECEDENCE = 7
+
+# Built-in type names, which the lexer returns as keywords
+TYPE_KEYWORDS = frozenset({
+    TokenKind.KW_INT, TokenKind.KW_FLOAT, TokenKind.KW_STRING, TokenKind.KW_UNDER_INT,
+    TokenKind.KW_HEX64, TokenKind.KW_CHAR, TokenKind.KW_BOOL, TokenKind.KW_LIST, TokenKind.KW_DICT,
+})
+
+_OPEN_PAREN = (0, None)
+
+@dataclass
+class CompileOptions:
+    """Settings for compile_source; the defaults match numiac with no flags"""
+    opt_level: int = 0
+    target: str = 'stack'  # 'stack', or 'reg' for register bytecode
+    library: bool = False  # Unlinked unit, as numiac -c
+    compact_tokens: bool = False
+    libraries: Mapping[str, str] = field(default_factory=dict)  # Imported library -> its source
+
+class CompileError(Exception):
+    """A source that does not compile, with where and why
+    
+    phase is the compile phase that failed (lex, parse, optimize, emit,
+    peephole or link), unit the library it happened in (None for the
+    program itself), line and column the position when known, reason the
+    message without the position.
+    """
+    
+    def __init__(self, message: str, phase: Optional[str] = None, unit: Optional[str] = None,
+                 line: Optional[int] = None, column: Optional[int] = None, reason: Optional[str] = None):
+        super().__init__(message)
+        self.phase = phase
+        self.unit = unit
+        self.line = line
+        self.column = column
+        self.reason = message if reason is None else reason
+    
+    @classmethod
+    def from_error(cls, error: Exception, phase: Optional[str], unit: Optional[str] = None) -> 'CompileError':
+        """Wrap a lexer, parser or code generator error; a SourceError gives the position"""
+        if isinstance(error, SourceError):
+            return cls(str(error), phase, unit, error.line, error.column, error.reason)
+        return cls(str(error), phase, unit)
 
 class Compiler:
-    def __init__(self, source: str):
+    def __init__(self, source: str, compact_tokens: bool = False, opt_level: int = 0,
+                 library: bool = False, target: str = 'stack', stats: Optional[CompileStats] = None):
         self.source = source
+        self.opt_level = opt_level
+        self.library = library  # Compile a unit for the linker (see linker.py)
+        self.target = target  # 'stack', or 'reg' for register bytecode (see regcodegen.py)
+        self.stats = stats or CompileStats()  # Phase timings (see stats.py)
         self.lexer = Lexer(source)
-        self.tokens = self.lexer.tokenize()
+        with self.stats.phase('lex'):
+            if compact_tokens:
+                self.tokens = TokenBuffer.from_source(source)
+            else:
+                self.tokens = self.lexer.tokenize()
+        self.stats.tokens = len(self.tokens)
         self.position = 0
-        self.bytecode = Bytecode()
+        self.bytecode: Optional[Bytecode] = None
+        self.typed_ops = (0, 0)  # (typed, all) arithmetic and comparison operators, -O1 and up
     
     def error(self, message: str):
         if self.position < len(self.tokens):
             token = self.tokens[self.position]
-            raise SyntaxError(f"Compiler error at line {token.line}, column {token.column}: {message}")
-        raise SyntaxError(f"Compiler error: {message}")
+            raise SourceError(message, token.line, token.column)
+        raise SourceError(message)
     
     def peek(self, offset: int = 0) -> Optional[Token]:
         pos = self.position + offset
@@ -85,94 +155,105 @@ class Compiler:
     
     def expect(self, token_type: TokenType) -> Token:
         token = self.peek()
-        if not token or token.type != token_type:
+        if not token or token.type is not token_type:
             self.error(f"Expected {token_type}, got {token.type if token else 'EOF'}")
         return self.advance()
     
     def skip_newlines(self):
-        while self.peek() and self.peek().type == TokenType.NEWLINE:
+        while self.peek() and self.peek().kind == TokenKind.NEWLINE:
             self.advance()
     
     def compile(self) -> Bytecode:
         """Main compilation entry point"""
-        try:
+        phase = self.stats.phase
+        with phase('parse'):
+            program = self.parse()
+        with phase('optimize'):
+            # Linked libraries share the program's variables
+            whole_program = not self.library and not any(
+                type(statement) is Import and statement.name not in BUILTIN_LIBRARIES
+                for statement in program.body)
+            type_table(program)  # Checks declarations at every level
+            program = optimize(program, self.opt_level, whole_program)
+            if self.opt_level >= 1:
+                self.typed_ops = specialize(program, type_table(program))
+        with phase('emit'):
+            if self.target == 'reg':
+                if self.library:
+                    raise ValueError("Library units need --target=stack")
+                self.bytecode = RegisterGenerator().generate(program)
+            else:
+                self.bytecode = CodeGenerator(self.library).generate(program)
+        if self.target != 'reg' and self.opt_level >= 1:
+            with phase('peephole'):
+                optimize_bytecode(self.bytecode)
+        
+        return self.bytecode
+    
+    def parse(self) -> Program:
+        """Parse the token stream into an IR Program"""
+        body = []
+        self.skip_newlines()
+        
+        # Parse top-level constructs
+        handlers = self.TOP_LEVEL_HANDLERS
+        while self.peek() and self.peek().kind != TokenKind.EOF:
             self.skip_newlines()
             
-            # Parse top-level constructs
-            while self.peek() and self.peek().type != TokenType.EOF:
-                self.skip_newlines()
-                
-                token = self.peek()
-                if not token or token.type == TokenType.EOF:
-                    break
-                
-                if token.type == TokenType.KEYWORD:
-                    if token.value == 'import':
-                        self.compile_import()
-                    elif token.value == 'INIT':
-                        self.compile_init()
-                    elif token.value == 'env':
-                        self.compile_env_declaration()
-                    elif token.value == 'area':
-                        self.compile_area()
-                    elif token.value == 'module':
-                        self.compile_module()
-                    elif token.value == 'class':
-                        self.compile_class()
-                    else:
-                        self.error(f"Unexpected keyword at top level: {token.value}")
-                else:
-                    self.error(f"Unexpected token at top level: {token.value}")
-                
-                self.skip_newlines()
+            token = self.peek()
+            if not token or token.kind == TokenKind.EOF:
+                break
             
-            # Emit HALT at end
-            self.bytecode.emit(Opcode.HALT)
+            handler = handlers.get(token.kind)
+            if handler is not None:
+                body.append(handler(self))
+            elif token.type is TokenType.KEYWORD:
+                self.error(f"Unexpected keyword at top level: {token.value}")
+            else:
+                self.error(f"Unexpected token at top level: {token.value}")
             
-        except Exception as e:
-            print(f"Compilation failed: {e}")
-            raise
+            self.skip_newlines()
         
-        return self.bytecode
+        # HALT at end
+        token = self.peek()
+        body.append(Halt(token.line if token else 0, token.column if token else 0))
+        return Program(body)
     
-    def compile_import(self):
-        """Compile: import <library_name>"""
-        self.expect(TokenType.KEYWORD)  # 'import'
+    def parse_import(self) -> Import:
+        """Parse: import <library_name>"""
+        start = self.expect(TokenType.KEYWORD)  # 'import'
         lib_name = self.expect(TokenType.IDENTIFIER).value
-        # TODO: Handle library imports
+        # Resolved at link time (linker.import_order)
+        return Import(lib_name, start.line, start.column)
     
-    def compile_init(self):
-        """Compile: INIT environment <env>"""
-        self.expect(TokenType.KEYWORD)  # 'INIT'
+    def parse_init(self) -> Init:
+        """Parse: INIT environment <env>"""
+        start = self.expect(TokenType.KEYWORD)  # 'INIT'
         self.expect(TokenType.KEYWORD)  # 'environment'
         env_name = self.expect(TokenType.IDENTIFIER).value
         # TODO: Initialize environment
+        return Init(env_name, start.line, start.column)
     
-    def compile_env_declaration(self):
-        """Compile: env <name> <type> = <value>"""
-        self.expect(TokenType.KEYWORD)  # 'env'
+    def parse_env_declaration(self) -> EnvDecl:
+        """Parse: env <name> <type> = <value>"""
+        start = self.expect(TokenType.KEYWORD)  # 'env'
         var_name = self.expect(TokenType.IDENTIFIER).value
         
-        # Variable initialization
-        var_idx = self.bytecode.add_variable(var_name)
-        
         # Type or direct assignment
         next_token = self.peek()
-        if next_token.type == TokenType.DOUBLE_ASSIGN:  # env name << value
+        if next_token.kind == TokenKind.DOUBLE_ASSIGN:  # env name << value
             self.advance()
-            self.compile_expression()
-            self.bytecode.emit(Opcode.STORE_VAR, var_idx)
-        elif next_token.type == TokenType.IDENTIFIER:  # Type specified
+            return EnvDecl(var_name, self.parse_expression(), None, start.line, start.column)
+        elif next_token.kind == TokenKind.IDENTIFIER or next_token.kind in TYPE_KEYWORDS:  # Type specified
             type_name = self.advance().value
             self.expect(TokenType.ASSIGN)
-            self.compile_expression()
-            self.bytecode.emit(Opcode.STORE_VAR, var_idx)
+            return EnvDecl(var_name, self.parse_expression(), type_name, start.line, start.column)
         else:
             self.error("Expected type or << in variable declaration")
     
-    def compile_area(self):
-        """Compile: area module main() open ... close"""
-        self.expect(TokenType.KEYWORD)  # 'area'
+    def parse_area(self) -> Function:
+        """Parse: area module main() open ... close"""
+        start = self.expect(TokenType.KEYWORD)  # 'area'
         self.expect(TokenType.KEYWORD)  # 'module'
         func_name = self.expect(TokenType.IDENTIFIER).value
         
@@ -180,17 +261,15 @@ class Compiler:
         self.expect(TokenType.RPAREN)
         self.expect(TokenType.KEYWORD)  # 'open'
         
-        func_start = len(self.bytecode.code)
-        self.bytecode.functions[func_name] = func_start
-        
         self.skip_newlines()
-        self.compile_block()
+        body = self.parse_block()
         
         self.expect(TokenType.KEYWORD)  # 'close'
+        return Function(func_name, body, 'area', line=start.line, column=start.column)
     
-    def compile_module(self):
-        """Compile: module <name>() open ... close"""
-        self.expect(TokenType.KEYWORD)  # 'module'
+    def parse_module(self) -> Function:
+        """Parse: module <name>() open ... close"""
+        start = self.expect(TokenType.KEYWORD)  # 'module'
         func_name = self.expect(TokenType.IDENTIFIER).value
         
         self.expect(TokenType.LPAREN)
@@ -198,18 +277,17 @@ class Compiler:
         self.expect(TokenType.RPAREN)
         self.expect(TokenType.KEYWORD)  # 'open'
         
-        func_start = len(self.bytecode.code)
-        self.bytecode.functions[func_name] = func_start
-        
         self.skip_newlines()
-        self.compile_block()
+        body = self.parse_block()
         
-        self.expect(TokenType.KEYWORD)  # 'close'
-        self.bytecode.emit(Opcode.RET)
+        # Falling off the end returns
+        close = self.expect(TokenType.KEYWORD)  # 'close'
+        body.append(Return(None, close.line, close.column))
+        return Function(func_name, body, 'module', line=start.line, column=start.column)
     
-    def compile_class(self):
-        """Compile: class <name> open ... close"""
-        self.expect(TokenType.KEYWORD)  # 'class'
+    def parse_class(self) -> ClassDef:
+        """Parse: class <name> open ... close"""
+        start = self.expect(TokenType.KEYWORD)  # 'class'
         class_name = self.expect(TokenType.IDENTIFIER).value
         self.expect(TokenType.KEYWORD)  # 'open'
         
@@ -217,108 +295,111 @@ class Compiler:
         # TODO: Parse class members
         
         self.expect(TokenType.KEYWORD)  # 'close'
+        return ClassDef(class_name, start.line, start.column)
     
-    def compile_block(self):
-        """Compile a block of statements"""
-        while self.peek() and self.peek().type != TokenType.EOF:
+    def parse_block(self) -> List[Node]:
+        """Parse a block of statements"""
+        body = []
+        handlers = self.BLOCK_HANDLERS
+        while self.peek() and self.peek().kind != TokenKind.EOF:
             self.skip_newlines()
             
             token = self.peek()
-            if not token:
+            if not token or token.kind in BLOCK_TERMINATORS:
                 break
             
-            if token.type == TokenType.KEYWORD and token.value == 'close':
-                break
-            elif token.type == TokenType.KEYWORD:
-                if token.value == 'if':
-                    self.compile_if()
-                elif token.value == 'for':
-                    self.compile_for()
-                elif token.value == 'while':
-                    self.compile_while()
-                elif token.value == 'switch':
-                    self.compile_switch()
-                elif token.value == 'try':
-                    self.compile_try()
-                elif token.value == 'back':
-                    self.compile_return()
-                elif token.value == 'stop':
-                    self.advance()
-                    # Convert to break
-                elif token.value == 'continue':
-                    self.advance()
-                    # TODO: Emit continue
-                elif token.value == 'env':
-                    self.compile_env_declaration()
-                elif token.value == 'pass':
-                    self.advance()  # No-op
+            handler = handlers.get(token.kind)
+            if handler is not None:
+                body.append(handler(self))
+            elif token.type is TokenType.KEYWORD:
+                self.error(f"Unexpected keyword in block: {token.value}")
             else:
                 # Try to parse as expression statement or function call
-                self.compile_expression_statement()
+                body.append(self.parse_expression_statement())
             
             self.skip_newlines()
+        return body
+    
+    def parse_stop(self) -> Stop:
+        """Parse: stop"""
+        token = self.advance()
+        return Stop(token.line, token.column)
     
-    def compile_expression_statement(self):
-        """Compile an expression as a statement (like function calls)"""
+    def parse_continue(self) -> Continue:
+        """Parse: continue"""
+        token = self.advance()
+        return Continue(token.line, token.column)
+    
+    def parse_pass(self) -> Pass:
+        """Parse: pass"""
+        token = self.advance()
+        return Pass(token.line, token.column)
+    
+    def parse_expression_statement(self) -> Node:
+        """Parse an expression as a statement (like function calls)"""
         # Check if this is a function call
         token = self.peek()
-        if token and token.type == TokenType.IDENTIFIER:
+        if token and token.kind == TokenKind.IDENTIFIER:
             name = self.advance().value
             
             # Check for function call
-            if self.peek() and self.peek().type == TokenType.LPAREN:
+            if self.peek() and self.peek().kind == TokenKind.LPAREN:
                 self.advance()  # consume (
                 
                 # Parse arguments
-                args_count = 0
-                while self.peek() and self.peek().type != TokenType.RPAREN:
-                    self.compile_expression()
-                    args_count += 1
+                args = []
+                while self.peek() and self.peek().kind != TokenKind.RPAREN:
+                    args.append(self.parse_expression())
                     
-                    if self.peek() and self.peek().type == TokenType.COMMA:
+                    if self.peek() and self.peek().kind == TokenKind.COMMA:
                         self.advance()
-                    elif self.peek() and self.peek().type != TokenType.RPAREN:
+                    elif self.peek() and self.peek().kind != TokenKind.RPAREN:
                         break
                 
                 self.expect(TokenType.RPAREN)
-                
-                # Emit special handling for built-in functions
-                if name == 'output':
-                    self.bytecode.emit(Opcode.OUTPUT)
-                elif name == 'input':
-                    self.bytecode.emit(Opcode.INPUT)
-                else:
-                    # User function call
-                    func_idx = len(self.bytecode.functions) if name in self.bytecode.functions else 0
-                    self.bytecode.emit(Opcode.CALL, func_idx)
-            else:
-                # Regular identifier - load as variable
-                var_idx = self.bytecode.add_variable(name)
-                self.bytecode.emit(Opcode.LOAD_VAR, var_idx)
-        else:
-            # Try as regular expression
-            self.compile_expression()
-    
-    def compile_if(self):
-        """Compile: if <condition> do ... end"""
-        self.expect(TokenType.KEYWORD)  # 'if'
-        self.compile_condition()
-        self.expect(TokenType.KEYWORD)  # 'do'
-        
-        jmp_if_false = len(self.bytecode.code)
-        self.bytecode.emit(Opcode.JMP_IFNOT, 0)  # Placeholder
-        
-        self.skip_newlines()
-        self.compile_block()
-        
-        # Patch jump address
-        self.bytecode.code[jmp_if_false + 1] = len(self.bytecode.code) & 0xFF
+                return Call(name, args, token.line, token.column)
+            
+            # Regular identifier - load as variable
+            return ExprStmt(Var(name), token.line, token.column)
+        
+        # Try as regular expression
+        return ExprStmt(self.parse_expression(), token.line, token.column)
+    
+    def parse_if(self) -> If:
+        """Parse: if <condition> do ... [else if <condition> do ...] [else do ...] end"""
+        start = self.expect(TokenType.KEYWORD)  # 'if'
+        branches = []
+        orelse = None
+        while True:
+            condition = self.parse_condition()
+            self.expect(TokenType.KEYWORD)  # 'do'
+            self.skip_newlines()
+            branches.append((condition, self.parse_block(), start))
+            
+            token = self.peek()
+            if not token or token.kind != TokenKind.KW_ELSE:
+                break
+            self.advance()
+            token = self.peek()
+            if token and token.kind == TokenKind.KW_IF:  # else if
+                start = self.advance()
+                continue
+            self.expect(TokenType.KEYWORD)  # 'do'
+            self.skip_newlines()
+            orelse = self.parse_block()
+            break
         
         self.expect(TokenType.KEYWORD)  # 'end'
+        
+        # else if chains nest as the else branch of the previous if
+        for condition, body, start in reversed(branches):
+            node = If(condition, body, orelse, start.line, start.column)
+            orelse = [node]
+        return node
     
-    def compile_for(self):
-        """Compile: for (var) on range(n) do ... end"""
-        self.expect(TokenType.KEYWORD)  # 'for'
+    def parse_for(self) -> For:
+        """Parse: for (var) on range(n) do ... end"""
+        start = self.expect(TokenType.KEYWORD)  # 'for'
         self.expect(TokenType.LPAREN)
         var_name = self.expect(TokenType.IDENTIFIER).value
         self.expect(TokenType.RPAREN)
@@ -326,198 +407,439 @@ class Compiler:
         self.expect(TokenType.KEYWORD)  # 'on'
         self.expect(TokenType.KEYWORD)  # 'range'
         self.expect(TokenType.LPAREN)
-        self.compile_expression()
+        count = self.parse_expression()
         self.expect(TokenType.RPAREN)
         
         self.expect(TokenType.KEYWORD)  # 'do'
         
-        loop_start = len(self.bytecode.code)
         self.skip_newlines()
-        self.compile_block()
+        body = self.parse_block()
         
-        self.bytecode.emit(Opcode.JMP, loop_start)
         self.expect(TokenType.KEYWORD)  # 'end'
+        return For(var_name, count, body, start.line, start.column)
     
-    def compile_while(self):
-        """Compile: while (condition) do ... end"""
-        self.expect(TokenType.KEYWORD)  # 'while'
+    def parse_while(self) -> While:
+        """Parse: while (condition) do ... end"""
+        start = self.expect(TokenType.KEYWORD)  # 'while'
         self.expect(TokenType.LPAREN)
         
-        loop_start = len(self.bytecode.code)
-        self.compile_condition()
+        condition = self.parse_condition()
         self.expect(TokenType.RPAREN)
         self.expect(TokenType.KEYWORD)  # 'do'
         
-        jmp_if_false = len(self.bytecode.code)
-        self.bytecode.emit(Opcode.JMP_IFNOT, 0)  # Placeholder
-        
         self.skip_newlines()
-        self.compile_block()
-        
-        self.bytecode.emit(Opcode.JMP, loop_start)
-        self.bytecode.code[jmp_if_false + 1] = len(self.bytecode.code) & 0xFF
+        body = self.parse_block()
         
         self.expect(TokenType.KEYWORD)  # 'end'
+        return While(condition, body, start.line, start.column)
     
-    def compile_switch(self):
-        """Compile: switch (expr) do ... end"""
-        self.expect(TokenType.KEYWORD)  # 'switch'
-        self.compile_expression()
+    def parse_switch(self) -> Switch:
+        """Parse: switch <expr> do case <value>[, <value>...] do ... [else do ...] end"""
+        start = self.expect(TokenType.KEYWORD)  # 'switch'
+        subject = self.parse_expression()
         self.expect(TokenType.KEYWORD)  # 'do'
-        # TODO: Implement switch compilation
+        self.skip_newlines()
+        
+        cases = []
+        seen = set()
+        while self.peek() and self.peek().kind == TokenKind.KW_CASE:
+            self.advance()
+            values = []
+            while True:
+                value = self.parse_case_value()
+                key = constant_key(value.value)
+                if key in seen:
+                    self.error(f"Duplicate case value {value.value!r}")
+                seen.add(key)
+                values.append(value)
+                if not (self.peek() and self.peek().kind == TokenKind.COMMA):
+                    break
+                self.advance()
+            self.expect(TokenType.KEYWORD)  # 'do'
+            self.skip_newlines()
+            cases.append((values, self.parse_block()))
+        
+        default = None
+        if self.peek() and self.peek().kind == TokenKind.KW_ELSE:
+            self.advance()
+            self.expect(TokenType.KEYWORD)  # 'do'
+            self.skip_newlines()
+            default = self.parse_block()
+        
         self.expect(TokenType.KEYWORD)  # 'end'
-    
-    def compile_try(self):
-        """Compile: try do ... catch error do ... end"""
-        self.expect(TokenType.KEYWORD)  # 'try'
+        return Switch(subject, cases, default, start.line, start.column)
+    
+    def parse_case_value(self) -> Const:
+        """A case value: a literal, or a negative number"""
+        value = self.parse_expression()
+        if (type(value) is Unary and value.op == Opcode.NEG and type(value.operand) is Const and
+                type(value.operand.value) in (int, float)):
+            value = Const(-value.operand.value)
+        if type(value) is not Const:
+            self.error("Case value must be a constant")
+        return value
+    
+    def parse_try(self) -> Try:
+        """Parse: try do ... catch [error] do ... end"""
+        start = self.expect(TokenType.KEYWORD)  # 'try'
         self.expect(TokenType.KEYWORD)  # 'do'
         self.skip_newlines()
-        self.compile_block()
+        body = self.parse_block()
         self.expect(TokenType.KEYWORD)  # 'catch'
-        # TODO: Handle error variable
+        
+        error_name = None
+        if self.peek() and self.peek().kind == TokenKind.IDENTIFIER:
+            error_name = self.advance().value
         self.expect(TokenType.KEYWORD)  # 'do'
         self.skip_newlines()
-        self.compile_block()
+        handler = self.parse_block()
         self.expect(TokenType.KEYWORD)  # 'end'
+        return Try(body, handler, error_name, start.line, start.column)
     
-    def compile_return(self):
-        """Compile: back or back with <value>"""
-        self.expect(TokenType.KEYWORD)  # 'back'
+    def parse_return(self) -> Return:
+        """Parse: back or back with <value>"""
+        start = self.expect(TokenType.KEYWORD)  # 'back'
         next_token = self.peek()
         
-        if next_token and next_token.type == TokenType.KEYWORD and next_token.value == 'with':
+        if next_token and next_token.kind == TokenKind.KW_WITH:
             self.advance()
-            self.compile_expression()
-        
-        self.bytecode.emit(Opcode.RET)
-    
-    def compile_condition(self):
-        """Compile a condition expression"""
-        self.compile_expression()
-    
-    def compile_expression(self):
-        """Compile an expression"""
-        self.compile_or_expr()
-    
-    def compile_or_expr(self):
-        self.compile_and_expr()
-        while self.peek() and self.peek().value == 'or':
-            self.advance()
-            self.compile_and_expr()
-            self.bytecode.emit(Opcode.OR_OP)
-    
-    def compile_and_expr(self):
-        self.compile_equality()
-        while self.peek() and self.peek().value == 'and':
+            return Return(self.parse_expression(), start.line, start.column)
+        return Return(None, start.line, start.column)
+    
+    def parse_condition(self) -> Node:
+        """Parse a condition expression"""
+        return self.parse_expression()
+    
+    def parse_expression(self) -> Node:
+        """Parse an expression with a table-driven operator-precedence parser
+        
+        Operators come from BINARY_OPERATORS and UNARY_OPERATORS. Pending
+        operators and open parentheses are kept on an explicit stack, so
+        nesting depth is not limited by Python recursion.
+        """
+        binary = BINARY_OPERATORS
+        unary = UNARY_OPERATORS
+        operands = []
+        pending = []  # (precedence, opcode); _OPEN_PAREN marks a '('
+        depth = 0
+        
+        while True:
+            # Operand: prefix operators and '(' followed by a primary
+            token = self.peek()
+            while token:
+                kind = token.kind
+                if kind in unary:
+                    pending.append((UNARY_PRECEDENCE, unary[kind]))
+                elif kind == TokenKind.LPAREN:
+                    pending.append(_OPEN_PAREN)
+                    depth += 1
+                else:
+                    break
+                self.advance()
+                token = self.peek()
+            operands.append(self.parse_primary())
+            
+            # Close parentheses, then either a binary operator or the end
+            token = self.peek()
+            while depth and token and token.kind == TokenKind.RPAREN:
+                while pending[-1] is not _OPEN_PAREN:
+                    self.reduce(operands, pending.pop())
+                pending.pop()
+                depth -= 1
+                self.advance()
+                token = self.peek()
+            
+            operator = binary.get(token.kind) if token else None
+            if operator is None:
+                break
+            # Left-associative: reduce operators that bind at least as tightly
+            precedence = operator[0]
+            while pending and pending[-1][0] >= precedence:
+                self.reduce(operands, pending.pop())
+            pending.append(operator)
             self.advance()
-            self.compile_equality()
-            self.bytecode.emit(Opcode.AND_OP)
-    
-    def compile_equality(self):
-        self.compile_comparison()
-        while self.peek() and self.peek().type in (TokenType.EQ, TokenType.NE):
-            op_type = self.advance().type
-            self.compile_comparison()
-            if op_type == TokenType.EQ:
-                self.bytecode.emit(Opcode.EQ)
-            else:
-                self.bytecode.emit(Opcode.NE)
-    
-    def compile_comparison(self):
-        self.compile_additive()
-        while self.peek() and self.peek().type in (TokenType.LT, TokenType.LE, TokenType.GT, TokenType.GE):
-            op_type = self.advance().type
-            self.compile_additive()
-            if op_type == TokenType.LT:
-                self.bytecode.emit(Opcode.LT)
-            elif op_type == TokenType.LE:
-                self.bytecode.emit(Opcode.LE)
-            elif op_type == TokenType.GT:
-                self.bytecode.emit(Opcode.GT)
-            elif op_type == TokenType.GE:
-                self.bytecode.emit(Opcode.GE)
-    
-    def compile_additive(self):
-        self.compile_multiplicative()
-        while self.peek() and self.peek().type in (TokenType.PLUS, TokenType.MINUS):
-            op_type = self.advance().type
-            self.compile_multiplicative()
-            if op_type == TokenType.PLUS:
-                self.bytecode.emit(Opcode.ADD)
-            else:
-                self.bytecode.emit(Opcode.SUB)
-    
-    def compile_multiplicative(self):
-        self.compile_unary()
-        while self.peek() and self.peek().type in (TokenType.STAR, TokenType.SLASH, TokenType.PERCENT):
-            op_type = self.advance().type
-            self.compile_unary()
-            if op_type == TokenType.STAR:
-                self.bytecode.emit(Opcode.MUL)
-            elif op_type == TokenType.SLASH:
-                self.bytecode.emit(Opcode.DIV)
-            elif op_type == TokenType.PERCENT:
-                self.bytecode.emit(Opcode.MOD)
-    
-    def compile_unary(self):
-        token = self.peek()
-        if token and token.type in (TokenType.MINUS, TokenType.NOT):
-            op_type = self.advance().type
-            self.compile_unary()
-            if op_type == TokenType.MINUS:
-                self.bytecode.emit(Opcode.NEG)
-            elif op_type == TokenType.NOT:
-                self.bytecode.emit(Opcode.NOT_OP)
+        
+        if depth:
+            self.expect(TokenType.RPAREN)
+        while pending:
+            self.reduce(operands, pending.pop())
+        return operands[0]
+    
+    @staticmethod
+    def reduce(operands: List[Node], operator):
+        """Apply a pending (precedence, opcode) to the operand stack"""
+        precedence, opcode = operator
+        if precedence == UNARY_PRECEDENCE:
+            operands[-1] = Unary(opcode, operands[-1])
         else:
-            self.compile_primary()
+            right = operands.pop()
+            operands[-1] = Binary(opcode, operands[-1], right)
     
-    def compile_primary(self):
+    def parse_primary(self) -> Node:
         token = self.peek()
         
         if not token:
             self.error("Unexpected end of input")
         
-        if token.type == TokenType.INTEGER:
+        kind = token.kind
+        if kind == TokenKind.INTEGER:
+            value = int(token.value)
+            if not INT64_MIN <= value <= INT64_MAX:
+                self.error(f"Integer literal {token.value} does not fit in 64 bits")
             self.advance()
-            const_idx = self.bytecode.add_constant(int(token.value))
-            self.bytecode.emit(Opcode.PUSH, const_idx)
+            return Const(value)
         
-        elif token.type == TokenType.FLOAT:
+        elif kind == TokenKind.FLOAT:
             self.advance()
-            const_idx = self.bytecode.add_constant(float(token.value))
-            self.bytecode.emit(Opcode.PUSH, const_idx)
+            return Const(float(token.value))
         
-        elif token.type == TokenType.STRING:
+        elif kind == TokenKind.STRING:
             self.advance()
-            const_idx = self.bytecode.add_constant(token.value)
-            self.bytecode.emit(Opcode.PUSH, const_idx)
+            return Const(token.value)
         
-        elif token.type == TokenType.BOOL:
+        elif kind == TokenKind.BOOL:
             self.advance()
-            const_idx = self.bytecode.add_constant(token.value == 'true')
-            self.bytecode.emit(Opcode.PUSH, const_idx)
+            return Const(token.value == 'true')
         
-        elif token.type == TokenType.IDENTIFIER:
-            name = self.advance().value
-            var_idx = self.bytecode.add_variable(name)
-            self.bytecode.emit(Opcode.LOAD_VAR, var_idx)
-        
-        elif token.type == TokenType.LPAREN:
+        elif kind == TokenKind.KW_TRUE or kind == TokenKind.KW_FALSE:
             self.advance()
-            self.compile_expression()
-            self.expect(TokenType.RPAREN)
+            return Const(kind == TokenKind.KW_TRUE)
+        
+        elif kind == TokenKind.IDENTIFIER:
+            return Var(self.advance().value)
         
         else:
             self.error(f"Unexpected token in expression: {token.value}")
+    
+    # Keyword dispatch tables: token kind -> parse method
+    TOP_LEVEL_HANDLERS = {
+        TokenKind.KW_IMPORT: parse_import,
+        TokenKind.KW_INIT: parse_init,
+        TokenKind.KW_ENV: parse_env_declaration,
+        TokenKind.KW_AREA: parse_area,
+        TokenKind.KW_MODULE: parse_module,
+        TokenKind.KW_CLASS: parse_class,
+    }
+    
+    BLOCK_HANDLERS = {
+        TokenKind.KW_IF: parse_if,
+        TokenKind.KW_FOR: parse_for,
+        TokenKind.KW_WHILE: parse_while,
+        TokenKind.KW_SWITCH: parse_switch,
+        TokenKind.KW_TRY: parse_try,
+        TokenKind.KW_BACK: parse_return,
+        TokenKind.KW_STOP: parse_stop,
+        TokenKind.KW_CONTINUE: parse_continue,
+        TokenKind.KW_ENV: parse_env_declaration,
+        TokenKind.KW_PASS: parse_pass,
+    }
 
-def compile_file(filename: str, output_filename: str):
-    """Compile a Numium source file to bytecode"""
-    with open(filename, 'r') as f:
-        source = f.read()
+class StreamCompiler(Compiler):
+    """Compiler that pulls tokens lazily from Lexer.iter_tokens()
+    
+    Only a bounded lookahead window of tokens is kept in memory, so the
+    token phase runs in roughly constant memory whatever the source size.
+    """
+    LOOKAHEAD = 4
+    
+    def __init__(self, stream, opt_level: int = 0, library: bool = False, target: str = 'stack',
+                 stats: Optional[CompileStats] = None):
+        self.source = None
+        self.opt_level = opt_level
+        self.library = library
+        self.target = target
+        self.stats = stats or CompileStats()  # Lexing is timed as part of parse
+        self.lexer = Lexer('')
+        self.token_stream = self.lexer.iter_tokens(stream)
+        self.window: Deque[Token] = deque()
+        self.position = 0
+        self.bytecode: Optional[Bytecode] = None
+    
+    def error(self, message: str):
+        token = self.peek()
+        if token:
+            raise SourceError(message, token.line, token.column)
+        raise SourceError(message)
+    
+    def peek(self, offset: int = 0) -> Optional[Token]:
+        if offset >= self.LOOKAHEAD:
+            raise ValueError(f"Lookahead {offset} exceeds window of {self.LOOKAHEAD} tokens")
+        window = self.window
+        while len(window) <= offset:
+            token = next(self.token_stream, None)
+            if token is None:
+                return None
+            window.append(token)
+        return window[offset]
+    
+    def advance(self) -> Optional[Token]:
+        token = self.peek()
+        if token:
+            self.window.popleft()
+            self.position += 1
+        return token
+    
+    def parse(self) -> Program:
+        program = super().parse()
+        self.stats.tokens = self.position
+        return program
+
+def compile_library(filename: str, opt_level: int = 0) -> Bytecode:
+    """Compile a library to <name>.numo, unless that file is from the same source and flags"""
+    with open(filename, 'rb') as f:
+        key = cache_key(f.read(), opt_level, library=True)
+    unit_filename = object_file(filename)
+    try:
+        with NumbcImage.open(unit_filename) as image:
+            fresh = image.source_key() == key
+    except (OSError, ValueError):
+        fresh = False
+    if fresh:
+        return Bytecode.from_file(unit_filename)
     
-    compiler = Compiler(source)
-    bytecode = compiler.compile()
-    bytecode.to_file(output_filename)
+    with open(filename, 'r') as f:
+        unit = Compiler(f.read(), opt_level=opt_level, library=True).compile()
+    unit.source_key = key
+    # Parallel builds may share a library; never let one read a partial file
+    temporary = f"{unit_filename}.{os.getpid()}.tmp"
+    unit.to_file(temporary)
+    os.replace(temporary, unit_filename)
+    print(f"Compiled {filename} -> {unit_filename}")
+    return unit
+
+def link_program(program: Bytecode, filename: str, opt_level: int = 0,
+                 search_path: Sequence[str] = ()) -> Bytecode:
+    """Link a compiled program with the libraries it imports, rebuilding stale ones
+    
+    Libraries are looked up as <name>.num next to the program, then in
+    search_path.
+    """
+    directories = [os.path.dirname(os.path.abspath(filename))] + list(search_path)
+    load = lambda name: compile_library(find_library(name, directories), opt_level)
+    return link(import_order(program, load, filename))
+
+class LibrarySources(Mapping):
+    """CompileOptions.libraries read from disk: <name>.num in the first search directory that has it"""
+    
+    def __init__(self, search_path: Sequence[str]):
+        self.search_path = list(search_path)
+    
+    def __contains__(self, name) -> bool:
+        return any(os.path.isfile(os.path.join(directory, f"{name}.num")) for directory in self.search_path)
+    
+    def __getitem__(self, name: str) -> str:
+        if name not in self:
+            raise KeyError(name)
+        with open(find_library(name, self.search_path), 'r') as f:
+            return f.read()
+    
+    def __iter__(self) -> Iterator[str]:
+        names = set()
+        for directory in self.search_path:
+            if os.path.isdir(directory):
+                names.update(entry[:-4] for entry in os.listdir(directory) if entry.endswith('.num'))
+        return iter(sorted(names))
+    
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+def compile_source(source: str, options: Optional[CompileOptions] = None,
+                   stats: Optional[CompileStats] = None) -> Bytecode:
+    """Compile source text in memory: no files, no output, CompileError on failure
+    
+    Imports of libraries are compiled from options.libraries and linked in,
+    as compile_file does from disk; LibrarySources reads them from
+    directories without writing .numo files. Bytecode.to_bytes() gives the .numbc
+    file contents.
+    """
+    options = options or CompileOptions()
+    stats = stats or CompileStats()
+    try:
+        bytecode = Compiler(source, compact_tokens=options.compact_tokens, opt_level=options.opt_level,
+                            library=options.library, target=options.target, stats=stats).compile()
+    except (SyntaxError, ValueError) as e:
+        raise CompileError.from_error(e, stats.failed) from e
+    if options.library or not (linked_imports(bytecode) or bytecode.external_calls):
+        return bytecode
+    
+    def load(name: str) -> Bytecode:
+        if isinstance(options.libraries, LibrarySources):
+            find_library(name, options.libraries.search_path)  # LinkError naming the directories
+        if name not in options.libraries:
+            raise LinkError(f"Cannot find library '{name}' (not in CompileOptions.libraries)")
+        library_stats = CompileStats()
+        try:
+            return Compiler(options.libraries[name], opt_level=options.opt_level, library=True,
+                            stats=library_stats).compile()
+        except (SyntaxError, ValueError) as e:
+            raise CompileError.from_error(e, library_stats.failed, name) from e
+    
+    try:
+        with stats.phase('link'):
+            return link(import_order(bytecode, load))
+    except LinkError as e:
+        raise CompileError(str(e), 'link') from e
+
+def compile_file(filename: str, output_filename: str, stream: bool = False,
+                 compact_tokens: bool = False, opt_level: int = 0,
+                 cache: Optional[CompileCache] = None, library: bool = False,
+                 search_path: Sequence[str] = (), target: str = 'stack',
+                 stats: Optional[CompileStats] = None):
+    """Compile a Numium source file to bytecode
+    
+    With a cache, an unchanged source (same text, flags and compiler)
+    reuses the previous output instead of being compiled again. Imported
+    libraries are linked in (see link_program); library=True writes an
+    unlinked unit instead. target='reg' writes register bytecode. Phase
+    timings go to stats when given.
+    """
+    stats = stats or CompileStats()
+    key = None
+    if cache is not None:
+        with stats.phase('read'):
+            with open(filename, 'rb') as f:
+                key = cache_key(f.read(), opt_level, library, target)
+            hit = cache.fetch(key, output_filename)
+        if hit:
+            print(f"Compiled {filename} -> {output_filename} (cached)")
+            loader = RegisterBytecode if target == 'reg' else Bytecode
+            with stats.phase('read'):
+                bytecode = loader.from_file(output_filename)
+            return finish_unit(bytecode, filename, output_filename, opt_level, library, search_path, stats)
+    
+    if stream:
+        with open(filename, 'r') as f:
+            bytecode = StreamCompiler(f, opt_level=opt_level, library=library,
+                                      target=target, stats=stats).compile()
+    else:
+        with stats.phase('read'):
+            with open(filename, 'r') as f:
+                source = f.read()
+        
+        compiler = Compiler(source, compact_tokens=compact_tokens, opt_level=opt_level,
+                            library=library, target=target, stats=stats)
+        bytecode = compiler.compile()
+    with stats.phase('write'):
+        if library:
+            with open(filename, 'rb') as f:
+                bytecode.source_key = cache_key(f.read(), opt_level, library=True)
+        bytecode.to_file(output_filename)
+        if key is not None:
+            cache.store(key, output_filename)
     
     print(f"Compiled {filename} -> {output_filename}")
+    return finish_unit(bytecode, filename, output_filename, opt_level, library, search_path, stats)
+
+def finish_unit(bytecode: Bytecode, filename: str, output_filename: str, opt_level: int,
+                library: bool, search_path: Sequence[str],
+                stats: Optional[CompileStats] = None) -> Bytecode:
+    """Link a program that imports libraries or calls undefined modules, and rewrite its output"""
+    if library or not (linked_imports(bytecode) or bytecode.external_calls):
+        return bytecode
+    stats = stats or CompileStats()
+    with stats.phase('link'):
+        bytecode = link_program(bytecode, filename, opt_level, search_path)
+    with stats.phase('write'):
+        bytecode.to_file(output_filename)
+    print(f"Linked {filename} -> {output_filename}")
     return bytecode
@@ -0,0 +1,298 @@
+"""
+Numium IR - Syntax tree between the parser and code generation
+Cây cú pháp trung gian giữa parser và bộ sinh bytecode
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+class Node:
+    """Base class of all IR nodes"""
+    __slots__ = ()
+    
+    def blocks(self) -> Sequence[List['Node']]:
+        """Nested statement lists"""
+        return ()
+    
+    def expressions(self) -> Sequence['Node']:
+        """Expressions evaluated directly by this statement"""
+        return ()
+
+# Expressions (slotted: there is one per operand and operator)
+
+@dataclass
+class Const(Node):
+    __slots__ = ('value',)
+    value: Any
+
+@dataclass
+class Var(Node):
+    __slots__ = ('name',)
+    name: str
+
+@dataclass
+class Unary(Node):
+    __slots__ = ('op', 'operand')
+    op: int              # Opcode.NEG or Opcode.NOT_OP
+    operand: Node
+
+@dataclass
+class Binary(Node):
+    __slots__ = ('op', 'left', 'right')
+    op: int              # Arithmetic, comparison or logic opcode
+    left: Node
+    right: Node
+
+# Statements
+
+@dataclass
+class EnvDecl(Node):
+    """env <name> << <value> / env <name> <type> = <value>"""
+    name: str
+    value: Node
+    type_name: Optional[str] = None
+    line: int = 0
+    column: int = 0
+    
+    def expressions(self):
+        return (self.value,)
+
+@dataclass
+class Call(Node):
+    """<name>(<args>) as a statement"""
+    name: str
+    args: List[Node]
+    line: int = 0
+    column: int = 0
+    
+    def expressions(self):
+        return self.args
+
+@dataclass
+class ExprStmt(Node):
+    expr: Node
+    line: int = 0
+    column: int = 0
+    
+    def expressions(self):
+        return (self.expr,)
+
+@dataclass
+class If(Node):
+    """if <cond> do ... [else ...] end; else if chains nest in orelse"""
+    cond: Node
+    body: List[Node]
+    orelse: Optional[List[Node]] = None
+    line: int = 0
+    column: int = 0
+    
+    def blocks(self):
+        return (self.body,) if self.orelse is None else (self.body, self.orelse)
+    
+    def expressions(self):
+        return (self.cond,)
+
+@dataclass
+class While(Node):
+    cond: Node
+    body: List[Node]
+    line: int = 0
+    column: int = 0
+    
+    def blocks(self):
+        return (self.body,)
+    
+    def expressions(self):
+        return (self.cond,)
+
+@dataclass
+class For(Node):
+    """for (<var>) on range(<count>) do ... end"""
+    var: str
+    count: Node
+    body: List[Node]
+    line: int = 0
+    column: int = 0
+    
+    def blocks(self):
+        return (self.body,)
+    
+    def expressions(self):
+        return (self.count,)
+
+@dataclass
+class Switch(Node):
+    """switch <subject> do case <value>[, <value>] do ... [else do ...] end
+    
+    The arm whose constant equals the subject runs, or else the default;
+    arms do not fall through.
+    """
+    subject: Node
+    cases: List[Tuple[List[Const], List[Node]]] = field(default_factory=list)
+    default: Optional[List[Node]] = None
+    line: int = 0
+    column: int = 0
+    
+    def blocks(self):
+        arms = tuple(body for _, body in self.cases)
+        return arms if self.default is None else arms + (self.default,)
+    
+    def expressions(self):
+        return (self.subject,)
+
+@dataclass
+class Try(Node):
+    body: List[Node]
+    handler: List[Node]
+    error_name: Optional[str] = None
+    line: int = 0
+    column: int = 0
+    
+    def blocks(self):
+        return (self.body, self.handler)
+
+@dataclass
+class Return(Node):
+    """back / back with <value>"""
+    value: Optional[Node] = None
+    line: int = 0
+    column: int = 0
+    
+    def expressions(self):
+        return () if self.value is None else (self.value,)
+
+@dataclass
+class Stop(Node):
+    line: int = 0
+    column: int = 0
+
+@dataclass
+class Continue(Node):
+    line: int = 0
+    column: int = 0
+
+@dataclass
+class Pass(Node):
+    line: int = 0
+    column: int = 0
+
+@dataclass
+class Halt(Node):
+    """End of the program"""
+    line: int = 0
+    column: int = 0
+
+# Top-level declarations
+
+@dataclass
+class Function(Node):
+    """area module <name>() / module <name>() open ... close"""
+    name: str
+    body: List[Node]
+    kind: str = 'module'  # 'area' or 'module'
+    params: List[str] = field(default_factory=list)
+    line: int = 0
+    column: int = 0
+    
+    def blocks(self):
+        return (self.body,)
+
+@dataclass
+class Import(Node):
+    name: str
+    line: int = 0
+    column: int = 0
+
+@dataclass
+class Init(Node):
+    """INIT environment <env>"""
+    env_name: str
+    line: int = 0
+    column: int = 0
+
+@dataclass
+class ClassDef(Node):
+    name: str
+    line: int = 0
+    column: int = 0
+
+@dataclass
+class Program(Node):
+    body: List[Node]
+    
+    def blocks(self):
+        return (self.body,)
+
+# Statements that never fall through to the next one
+TERMINATORS = (Return, Stop, Continue, Halt)
+
+def postorder(expr: Node) -> Iterator[Node]:
+    """Yield an expression tree children-first, without recursion"""
+    stack = [(expr, False)]
+    while stack:
+        node, expanded = stack.pop()
+        kind = type(node)
+        if expanded or (kind is not Binary and kind is not Unary):
+            yield node
+        elif kind is Binary:
+            stack.append((node, True))
+            stack.append((node.right, False))
+            stack.append((node.left, False))
+        else:
+            stack.append((node, True))
+            stack.append((node.operand, False))
+
+def walk(body: List[Node]) -> Iterator[Node]:
+    """Yield every statement in body, including nested blocks"""
+    stack = [iter(body)]
+    while stack:
+        statement = next(stack[-1], None)
+        if statement is None:
+            stack.pop()
+            continue
+        yield statement
+        for block in reversed(statement.blocks()):
+            stack.append(iter(block))
+
+def function_locals(program: Program) -> Dict[str, Dict[str, int]]:
+    """Local slots of each `module`: the names it assigns that top-level code never uses
+    
+    Top-level code, `area` bodies included, runs without a call frame, so
+    every name it stores or reads is global, and a module that uses one of
+    those names shares it. Any other name a module assigns is local to the
+    module. Slots are numbered from 0 in order of first assignment.
+    """
+    top_level = set()
+    modules = []
+    for statement in program.body:
+        if type(statement) is Function and statement.kind == 'module':
+            modules.append(statement)
+            continue
+        for node in walk([statement]):
+            if type(node) is EnvDecl:
+                top_level.add(node.name)
+            elif type(node) is For:
+                top_level.add(node.var)
+            for expr in node.expressions():
+                top_level.update(leaf.name for leaf in postorder(expr) if type(leaf) is Var)
+    
+    scopes = {}
+    for function in modules:
+        slots: Dict[str, int] = {}
+        for node in walk(function.body):
+            kind = type(node)
+            name = node.name if kind is EnvDecl else node.var if kind is For else None
+            if name is not None and name not in top_level and name not in slots:
+                slots[name] = len(slots)
+        scopes[function.name] = slots
+    return scopes
+
+def scoped_walk(program: Program) -> Iterator[Tuple[Optional[str], Node]]:
+    """Every statement with the `module` whose frame it runs in, None outside modules"""
+    for statement in program.body:
+        if type(statement) is Function and statement.kind == 'module':
+            for node in walk(statement.body):
+                yield statement.name, node
+        else:
+            for node in walk([statement]):
+                yield None, node
@@ -4,9 +4,26 @@ Phân tích từ vựng cho ngôn ngữ Numium
 """
 
 import re
+from sys import intern
 from enum import Enum, auto
 from dataclasses import dataclass
-from typing import List, Optional
+from typing import Iterator, List, Optional
+
+class SourceError(SyntaxError):
+    """A compile error at a source position
+    
+    str() is the full message ("Compiler error at line 3, column 5: ...");
+    line, column (None when unknown) and reason carry its parts.
+    """
+    
+    def __init__(self, reason: str, line: Optional[int] = None, column: Optional[int] = None,
+                 stage: str = 'Compiler'):
+        where = '' if line is None else f" at line {line}" if column is None else \
+            f" at line {line}, column {column}"
+        super().__init__(f"{stage} error{where}: {reason}")
+        self.reason = reason
+        self.line = line
+        self.column = column
 
 class TokenType(Enum):
     # Literals
@@ -63,6 +80,195 @@ class Token:
     value: str
     line: int
     column: int
+    kind: int
+
+class TokenKind:
+    """Integer token kinds: the TokenType value for ordinary tokens, one kind per keyword"""
+    
+    # Token types
+    INTEGER = TokenType.INTEGER.value
+    FLOAT = TokenType.FLOAT.value
+    STRING = TokenType.STRING.value
+    BOOL = TokenType.BOOL.value
+    HEX64 = TokenType.HEX64.value
+    CHAR = TokenType.CHAR.value
+    KEYWORD = TokenType.KEYWORD.value
+    IDENTIFIER = TokenType.IDENTIFIER.value
+    ASSIGN = TokenType.ASSIGN.value
+    DOUBLE_ASSIGN = TokenType.DOUBLE_ASSIGN.value
+    PLUS = TokenType.PLUS.value
+    MINUS = TokenType.MINUS.value
+    STAR = TokenType.STAR.value
+    SLASH = TokenType.SLASH.value
+    PERCENT = TokenType.PERCENT.value
+    EQ = TokenType.EQ.value
+    NE = TokenType.NE.value
+    LT = TokenType.LT.value
+    LE = TokenType.LE.value
+    GT = TokenType.GT.value
+    GE = TokenType.GE.value
+    AND = TokenType.AND.value
+    OR = TokenType.OR.value
+    NOT = TokenType.NOT.value
+    LPAREN = TokenType.LPAREN.value
+    RPAREN = TokenType.RPAREN.value
+    LBRACKET = TokenType.LBRACKET.value
+    RBRACKET = TokenType.RBRACKET.value
+    COMMA = TokenType.COMMA.value
+    COLON = TokenType.COLON.value
+    DOT = TokenType.DOT.value
+    DOLLAR = TokenType.DOLLAR.value
+    DOUBLE_COLON = TokenType.DOUBLE_COLON.value
+    NEWLINE = TokenType.NEWLINE.value
+    EOF = TokenType.EOF.value
+    COMMENT = TokenType.COMMENT.value
+    
+    # Keywords
+    KW_OPEN = 0x40          # open
+    KW_CLOSE = 0x41         # close
+    KW_DO = 0x42            # do
+    KW_END = 0x43           # end
+    KW_IF = 0x44            # if
+    KW_ELSE = 0x45          # else
+    KW_FOR = 0x46           # for
+    KW_WHILE = 0x47         # while
+    KW_SWITCH = 0x48        # switch
+    KW_CASE = 0x49          # case
+    KW_TRY = 0x4A           # try
+    KW_CATCH = 0x4B         # catch
+    KW_AREA = 0x4C          # area
+    KW_MODULE = 0x4D        # module
+    KW_CLASS = 0x4E         # class
+    KW_REGION = 0x4F        # region
+    KW_DATABASE = 0x50      # database
+    KW_EVENT = 0x51         # event
+    KW_PRIVATE = 0x52       # private
+    KW_PUBLIC = 0x53        # public
+    KW_IMPORT = 0x54        # import
+    KW_INIT = 0x55          # INIT
+    KW_START = 0x56         # START
+    KW_ENVIRONMENT = 0x57   # environment
+    KW_ENV = 0x58           # env
+    KW_BACK = 0x59          # back
+    KW_WITH = 0x5A          # with
+    KW_PASS = 0x5B          # pass
+    KW_STOP = 0x5C          # stop
+    KW_CONTINUE = 0x5D      # continue
+    KW_AND = 0x5E           # and
+    KW_OR = 0x5F            # or
+    KW_NOT = 0x60           # not
+    KW_ON = 0x61            # on
+    KW_IN = 0x62            # in
+    KW_RANGE = 0x63         # range
+    KW_LOCAL = 0x64         # local
+    KW_CALL = 0x65          # call
+    KW_TRUE = 0x66          # true
+    KW_FALSE = 0x67         # false
+    KW_INT = 0x68           # int
+    KW_FLOAT = 0x69         # float
+    KW_STRING = 0x6A        # string
+    KW_UNDER_INT = 0x6B     # under_int
+    KW_HEX64 = 0x6C         # hex64
+    KW_CHAR = 0x6D          # char
+    KW_BOOL = 0x6E          # bool
+    KW_LIST = 0x6F          # list
+    KW_DICT = 0x70          # dict
+    KW_ACTIVATE = 0x71      # activate
+
+_OPERATOR_TYPES = {
+    '==': TokenType.EQ,
+    '!=': TokenType.NE,
+    '<=': TokenType.LE,
+    '<<': TokenType.DOUBLE_ASSIGN,
+    '>=': TokenType.GE,
+    '&&': TokenType.AND,
+    '||': TokenType.OR,
+    '::': TokenType.DOUBLE_COLON,
+    '=': TokenType.ASSIGN,
+    '<': TokenType.LT,
+    '>': TokenType.GT,
+    '+': TokenType.PLUS,
+    '-': TokenType.MINUS,
+    '*': TokenType.STAR,
+    '/': TokenType.SLASH,
+    '%': TokenType.PERCENT,
+    '!': TokenType.NOT,
+    '(': TokenType.LPAREN,
+    ')': TokenType.RPAREN,
+    '[': TokenType.LBRACKET,
+    ']': TokenType.RBRACKET,
+    ',': TokenType.COMMA,
+    ':': TokenType.COLON,
+    '.': TokenType.DOT,
+    '$': TokenType.DOLLAR,
+}
+
+# Operator text -> (type, kind, canonical text)
+_OPERATOR_TOKENS = {
+    text: (token_type, token_type.value, text) for text, token_type in _OPERATOR_TYPES.items()
+}
+
+# Master pattern for the table-driven scanner. Outside strings and comments
+# only ASCII classes are used: anything else (Unicode identifiers, stray
+# characters, unterminated strings) stops the fast path and the source is
+# re-scanned by Lexer.tokenize_chars(), which owns error reporting.
+_TOKEN_PATTERN = re.compile(
+    r'(?P<ws>[ \t\r]+)'
+    r'|(?P<comment>#[^\n]*)'
+    r'|(?P<newline>\n)'
+    r'|(?P<string>"[^"\\]*(?:\\.[^"\\]*)*"' r"|'[^'\\]*(?:\\.[^'\\]*)*')"
+    r'|(?P<hex>0x[0-9a-fA-F]*)'
+    r'|(?P<number>[0-9][0-9.]*)'
+    r'|(?P<name>[A-Za-z_][A-Za-z0-9_]*)'
+    r'|(?P<op>==|!=|<=|<<|>=|&&|\|\||::|[=<>+\-*/%!()\[\],:.$])',
+    re.DOTALL,
+)
+
+# Token types whose text a non-ASCII character may extend
+_WORD_TYPES = (
+    TokenType.IDENTIFIER,
+    TokenType.KEYWORD,
+    TokenType.INTEGER,
+    TokenType.FLOAT,
+    TokenType.HEX64,
+)
+
+_ESCAPE_PATTERN = re.compile(r'\\(.)', re.DOTALL)
+_ESCAPES = {'n': '\n', 't': '\t'}
+
+def _unescape(match) -> str:
+    char = match.group(1)
+    return _ESCAPES.get(char, char)
+
+class _SourceReader:
+    """readline()/read() over a string from a start offset, without copying it"""
+    
+    def __init__(self, text: str, position: int = 0):
+        self.text = text
+        self.position = position
+    
+    def readline(self) -> str:
+        start = self.position
+        end = self.text.find('\n', start) + 1 or len(self.text)
+        self.position = end
+        return self.text[start:end]
+    
+    def read(self) -> str:
+        start = self.position
+        self.position = len(self.text)
+        return self.text[start:]
+
+def _bisect_position(tokens: List[Token], line: int, column: int, low: int = 0) -> int:
+    """Index of the first token at or after (line, column)"""
+    high = len(tokens)
+    while low < high:
+        mid = (low + high) // 2
+        token = tokens[mid]
+        if token.line < line or (token.line == line and token.column < column):
+            low = mid + 1
+        else:
+            high = mid
+    return low
 
 class Lexer:
     KEYWORDS = {
@@ -87,7 +293,7 @@ class Lexer:
         self.tokens: List[Token] = []
     
     def error(self, message: str):
-        raise SyntaxError(f"Lexer error at line {self.line}, column {self.column}: {message}")
+        raise SourceError(message, self.line, self.column, 'Lexer')
     
     def peek(self, offset: int = 0) -> Optional[str]:
         pos = self.position + offset
@@ -122,7 +328,7 @@ class Lexer:
             while self.peek() and self.peek() in '0123456789abcdefABCDEF':
                 num_str += self.peek()
                 self.advance()
-            return Token(TokenType.HEX64, '0x' + num_str, start_line, start_col)
+            return Token(TokenType.HEX64, '0x' + num_str, start_line, start_col, TokenKind.HEX64)
         
         # Regular number
         while self.peek() and (self.peek().isdigit() or self.peek() == '.'):
@@ -130,8 +336,8 @@ class Lexer:
             self.advance()
         
         if '.' in num_str:
-            return Token(TokenType.FLOAT, num_str, start_line, start_col)
-        return Token(TokenType.INTEGER, num_str, start_line, start_col)
+            return Token(TokenType.FLOAT, num_str, start_line, start_col, TokenKind.FLOAT)
+        return Token(TokenType.INTEGER, num_str, start_line, start_col, TokenKind.INTEGER)
     
     def read_string(self, quote: str) -> Token:
         start_line, start_col = self.line, self.column
@@ -142,6 +348,8 @@ class Lexer:
             if self.peek() == '\\':
                 self.advance()
                 escaped = self.peek()
+                if escaped is None:
+                    self.error(f"Unterminated escape in string starting at line {start_line}")
                 if escaped == 'n':
                     string_val += '\n'
                 elif escaped == 't':
@@ -161,7 +369,7 @@ class Lexer:
             self.error(f"Unterminated string starting at line {start_line}")
         
         self.advance()  # Skip closing quote
-        return Token(TokenType.STRING, string_val, start_line, start_col)
+        return Token(TokenType.STRING, string_val, start_line, start_col, TokenKind.STRING)
     
     def read_identifier(self) -> Token:
         start_line, start_col = self.line, self.column
@@ -171,14 +379,263 @@ class Lexer:
             ident += self.peek()
             self.advance()
         
+        ident = intern(ident)
         if ident in self.KEYWORDS:
-            return Token(TokenType.KEYWORD, ident, start_line, start_col)
+            return Token(TokenType.KEYWORD, ident, start_line, start_col, KEYWORD_KINDS[ident])
         if ident in ('true', 'false'):
-            return Token(TokenType.BOOL, ident, start_line, start_col)
+            return Token(TokenType.BOOL, ident, start_line, start_col, TokenKind.BOOL)
         
-        return Token(TokenType.IDENTIFIER, ident, start_line, start_col)
+        return Token(TokenType.IDENTIFIER, ident, start_line, start_col, TokenKind.IDENTIFIER)
     
     def tokenize(self) -> List[Token]:
+        """Tokenize the source with the table-driven scanner.
+        
+        Falls back to tokenize_chars() whenever the master pattern cannot
+        continue, so errors and edge cases stay identical.
+        """
+        tokens = self._scan()
+        if tokens is None:
+            self.tokens = []
+            self.position = 0
+            self.line = 1
+            self.column = 1
+            return self.tokenize_chars()
+        self.tokens = tokens
+        return self.tokens
+    
+    def _scan(self) -> Optional[List[Token]]:
+        """Single pass over the whole source using _TOKEN_PATTERN.
+        
+        Returns None if some character is not covered by the pattern.
+        """
+        tokens: List[Token] = []
+        pos, line, line_start = self._scan_chunk(self.source, tokens, 1, 0)
+        if pos != len(self.source):
+            return None
+        
+        self.position = pos
+        self.line = line
+        self.column = pos - line_start + 1
+        tokens.append(Token(TokenType.EOF, '', self.line, self.column, TokenKind.EOF))
+        return tokens
+    
+    def _scan_chunk(self, text: str, out: List[Token], line: int, line_start: int):
+        """Append tokens for the longest prefix of text the pattern covers.
+        
+        line_start is the index in text where the current line begins (it may
+        be negative when the line started in an earlier chunk). Returns the
+        end of the scanned prefix and the updated (line, line_start).
+        """
+        append = out.append
+        keyword_kinds = KEYWORD_KINDS
+        operators = _OPERATOR_TOKENS
+        pos = 0
+        
+        for match in _TOKEN_PATTERN.finditer(text):
+            start = match.start()
+            if start != pos:
+                break
+            pos = match.end()
+            kind = match.lastgroup
+            
+            if kind == 'ws' or kind == 'comment':
+                continue
+            
+            column = start - line_start + 1
+            if kind == 'name':
+                value = intern(match.group())
+                keyword = keyword_kinds.get(value)
+                if keyword is None:
+                    append(Token(TokenType.IDENTIFIER, value, line, column, TokenKind.IDENTIFIER))
+                else:
+                    append(Token(TokenType.KEYWORD, value, line, column, keyword))
+            elif kind == 'op':
+                token_type, token_kind, value = operators[match.group()]
+                append(Token(token_type, value, line, column, token_kind))
+            elif kind == 'newline':
+                append(Token(TokenType.NEWLINE, '\\n', line, column, TokenKind.NEWLINE))
+                line += 1
+                line_start = pos
+            elif kind == 'number':
+                value = match.group()
+                if '.' in value:
+                    append(Token(TokenType.FLOAT, value, line, column, TokenKind.FLOAT))
+                else:
+                    append(Token(TokenType.INTEGER, value, line, column, TokenKind.INTEGER))
+            elif kind == 'hex':
+                append(Token(TokenType.HEX64, match.group(), line, column, TokenKind.HEX64))
+            else:  # string
+                value = match.group()
+                body = value[1:-1]
+                if '\\' in body:
+                    body = _ESCAPE_PATTERN.sub(_unescape, body)
+                append(Token(TokenType.STRING, body, line, column, TokenKind.STRING))
+                newlines = value.count('\n')
+                if newlines:
+                    line += newlines
+                    line_start = start + value.rfind('\n') + 1
+        
+        return pos, line, line_start
+    
+    def iter_tokens(self, stream=None, line: int = 1, column: int = 1) -> Iterator[Token]:
+        """Yield tokens lazily, reading the source line by line.
+        
+        stream may be a text file, a binary file or an mmap (decoded as
+        UTF-8); without it self.source is used. line and column give the
+        position of the stream's first character. Only the current line is
+        buffered, plus the rest of a string literal that spans lines. If the
+        reference tokenizer is needed (non-ASCII identifiers, lexical
+        errors), the remaining input is read at that point and handed to
+        tokenize_chars(), so the stream matches tokenize() exactly.
+        """
+        if stream is None:
+            stream = _SourceReader(self.source)
+        readline = stream.readline
+        buffer = ''
+        line_start = 1 - column
+        chunk_tokens: List[Token] = []
+        
+        while True:
+            chunk = readline()
+            if isinstance(chunk, bytes):
+                chunk = chunk.decode('utf-8')
+            at_eof = not chunk
+            if not at_eof:
+                buffer += chunk
+                if not chunk.endswith('\n'):
+                    continue
+            
+            pos, line, line_start = self._scan_chunk(buffer, chunk_tokens, line, line_start)
+            
+            if pos < len(buffer):
+                if not at_eof and buffer[pos] in '"\'':
+                    # String literal continues on the next line
+                    yield from chunk_tokens
+                    chunk_tokens.clear()
+                    buffer = buffer[pos:]
+                    line_start -= pos
+                    continue
+                
+                # A name or number right before the stop may continue with
+                # characters only the reference tokenizer accepts
+                if chunk_tokens and chunk_tokens[-1].type in _WORD_TYPES:
+                    last = chunk_tokens[-1]
+                    last_start = line_start + last.column - 1
+                    if last_start + len(last.value) == pos:
+                        chunk_tokens.pop()
+                        pos = last_start
+                yield from chunk_tokens
+                
+                rest = stream.read()
+                if isinstance(rest, bytes):
+                    rest = rest.decode('utf-8')
+                reference = Lexer(buffer[pos:] + rest)
+                reference.line = line
+                reference.column = pos - line_start + 1
+                yield from reference.tokenize_chars()
+                return
+            
+            yield from chunk_tokens
+            chunk_tokens.clear()
+            
+            if at_eof:
+                self.position = pos
+                self.line = line
+                self.column = pos - line_start + 1
+                yield Token(TokenType.EOF, '', self.line, self.column, TokenKind.EOF)
+                return
+            
+            buffer = ''
+            line_start -= pos
+    
+    def relex(self, offset: int, removed: int, inserted: str,
+              tokens: Optional[List[Token]] = None) -> List[Token]:
+        """Update the token stream after an edit of self.source.
+        
+        The edit replaces source[offset:offset + removed] with inserted.
+        tokens is the stream for the current source (self.tokens by
+        default) and is updated in place. Lexing restarts at the beginning
+        of the edited line and stops at the first newline after the edit
+        where the old stream also has a newline token, i.e. both lexers are
+        back in the same state. Tokens before the restart are kept as is;
+        tokens after the resync point keep their column and have their line
+        shifted (the resync point is a line boundary). The edited text and
+        the updated stream become the lexer's source and tokens.
+        """
+        old_source = self.source
+        old_tokens = self.tokens if tokens is None else tokens
+        if offset < 0 or removed < 0 or offset + removed > len(old_source):
+            raise ValueError(f"Edit [{offset}, {offset + removed}) outside source of length {len(old_source)}")
+        
+        source = old_source[:offset] + inserted + old_source[offset + removed:]
+        edit_end = offset + len(inserted)
+        delta = len(inserted) - removed
+        
+        # Restart at the start of the edited line, or at the string literal
+        # that runs into it
+        restart = old_source.rfind('\n', 0, offset) + 1
+        restart_line = old_source.count('\n', 0, restart) + 1
+        first = _bisect_position(old_tokens, restart_line, 1)
+        restart_column = 1
+        if first > 0 and old_tokens[first - 1].type == TokenType.STRING:
+            first -= 1
+            string = old_tokens[first]
+            while restart_line > string.line:
+                restart = old_source.rfind('\n', 0, restart - 1) + 1
+                restart_line -= 1
+            restart += string.column - 1
+            restart_column = string.column
+        
+        relexed: List[Token] = []
+        append = relexed.append
+        resync = len(old_tokens)
+        shift = 0
+        line_offset = restart - restart_column + 1  # source offset of restart_line
+        line_number = restart_line
+        
+        fresh = Lexer(source).iter_tokens(_SourceReader(source, restart), restart_line, restart_column)
+        for token in fresh:
+            append(token)
+            if token.type != TokenType.NEWLINE:
+                continue
+            
+            while line_number < token.line:
+                line_offset = source.index('\n', line_offset) + 1
+                line_number += 1
+            newline_at = line_offset + token.column - 1
+            if newline_at < edit_end:
+                continue
+            
+            # Same newline character in the old source; resync if the old
+            # stream has a newline token there too
+            old_at = newline_at - delta
+            old_line_offset = old_source.rfind('\n', 0, old_at) + 1
+            old_line = restart_line + old_source.count('\n', restart, old_line_offset)
+            old_column = old_at - old_line_offset + 1
+            index = _bisect_position(old_tokens, old_line, old_column, first)
+            if index < len(old_tokens):
+                match = old_tokens[index]
+                if (match.type == TokenType.NEWLINE and match.line == old_line
+                        and match.column == old_column):
+                    resync = index + 1
+                    shift = token.line - old_line
+                    break
+        
+        if shift:
+            for index in range(resync, len(old_tokens)):
+                old_tokens[index].line += shift
+        old_tokens[first:resync] = relexed
+        
+        self.source = source
+        self.tokens = old_tokens
+        last = old_tokens[-1]
+        self.position = len(source)
+        self.line = last.line
+        self.column = last.column
+        return old_tokens
+    
+    def tokenize_chars(self) -> List[Token]:
+        """Character-at-a-time reference tokenizer"""
         while self.position < len(self.source):
             self.skip_whitespace()
             
@@ -196,7 +653,7 @@ class Lexer:
             
             # Newline
             if current == '\n':
-                self.tokens.append(Token(TokenType.NEWLINE, '\\n', start_line, start_col))
+                self.tokens.append(Token(TokenType.NEWLINE, '\\n', start_line, start_col, TokenKind.NEWLINE))
                 self.advance()
                 continue
             
@@ -217,90 +674,93 @@ class Lexer:
             
             # Operators and delimiters
             if current == '=' and self.peek(1) == '=':
-                self.tokens.append(Token(TokenType.EQ, '==', start_line, start_col))
+                self.tokens.append(Token(TokenType.EQ, '==', start_line, start_col, TokenKind.EQ))
                 self.advance()
                 self.advance()
             elif current == '!' and self.peek(1) == '=':
-                self.tokens.append(Token(TokenType.NE, '!=', start_line, start_col))
+                self.tokens.append(Token(TokenType.NE, '!=', start_line, start_col, TokenKind.NE))
                 self.advance()
                 self.advance()
             elif current == '<' and self.peek(1) == '=':
-                self.tokens.append(Token(TokenType.LE, '<=', start_line, start_col))
+                self.tokens.append(Token(TokenType.LE, '<=', start_line, start_col, TokenKind.LE))
                 self.advance()
                 self.advance()
             elif current == '<' and self.peek(1) == '<':
-                self.tokens.append(Token(TokenType.DOUBLE_ASSIGN, '<<', start_line, start_col))
+                self.tokens.append(Token(TokenType.DOUBLE_ASSIGN, '<<', start_line, start_col, TokenKind.DOUBLE_ASSIGN))
                 self.advance()
                 self.advance()
             elif current == '>' and self.peek(1) == '=':
-                self.tokens.append(Token(TokenType.GE, '>=', start_line, start_col))
+                self.tokens.append(Token(TokenType.GE, '>=', start_line, start_col, TokenKind.GE))
                 self.advance()
                 self.advance()
             elif current == '&' and self.peek(1) == '&':
-                self.tokens.append(Token(TokenType.AND, '&&', start_line, start_col))
+                self.tokens.append(Token(TokenType.AND, '&&', start_line, start_col, TokenKind.AND))
                 self.advance()
                 self.advance()
             elif current == '|' and self.peek(1) == '|':
-                self.tokens.append(Token(TokenType.OR, '||', start_line, start_col))
+                self.tokens.append(Token(TokenType.OR, '||', start_line, start_col, TokenKind.OR))
                 self.advance()
                 self.advance()
             elif current == ':' and self.peek(1) == ':':
-                self.tokens.append(Token(TokenType.DOUBLE_COLON, '::', start_line, start_col))
+                self.tokens.append(Token(TokenType.DOUBLE_COLON, '::', start_line, start_col, TokenKind.DOUBLE_COLON))
                 self.advance()
                 self.advance()
             elif current == '=':
-                self.tokens.append(Token(TokenType.ASSIGN, '=', start_line, start_col))
+                self.tokens.append(Token(TokenType.ASSIGN, '=', start_line, start_col, TokenKind.ASSIGN))
                 self.advance()
             elif current == '<':
-                self.tokens.append(Token(TokenType.LT, '<', start_line, start_col))
+                self.tokens.append(Token(TokenType.LT, '<', start_line, start_col, TokenKind.LT))
                 self.advance()
             elif current == '>':
-                self.tokens.append(Token(TokenType.GT, '>', start_line, start_col))
+                self.tokens.append(Token(TokenType.GT, '>', start_line, start_col, TokenKind.GT))
                 self.advance()
             elif current == '+':
-                self.tokens.append(Token(TokenType.PLUS, '+', start_line, start_col))
+                self.tokens.append(Token(TokenType.PLUS, '+', start_line, start_col, TokenKind.PLUS))
                 self.advance()
             elif current == '-':
-                self.tokens.append(Token(TokenType.MINUS, '-', start_line, start_col))
+                self.tokens.append(Token(TokenType.MINUS, '-', start_line, start_col, TokenKind.MINUS))
                 self.advance()
             elif current == '*':
-                self.tokens.append(Token(TokenType.STAR, '*', start_line, start_col))
+                self.tokens.append(Token(TokenType.STAR, '*', start_line, start_col, TokenKind.STAR))
                 self.advance()
             elif current == '/':
-                self.tokens.append(Token(TokenType.SLASH, '/', start_line, start_col))
+                self.tokens.append(Token(TokenType.SLASH, '/', start_line, start_col, TokenKind.SLASH))
                 self.advance()
             elif current == '%':
-                self.tokens.append(Token(TokenType.PERCENT, '%', start_line, start_col))
+                self.tokens.append(Token(TokenType.PERCENT, '%', start_line, start_col, TokenKind.PERCENT))
                 self.advance()
             elif current == '!':
-                self.tokens.append(Token(TokenType.NOT, '!', start_line, start_col))
+                self.tokens.append(Token(TokenType.NOT, '!', start_line, start_col, TokenKind.NOT))
                 self.advance()
             elif current == '(':
-                self.tokens.append(Token(TokenType.LPAREN, '(', start_line, start_col))
+                self.tokens.append(Token(TokenType.LPAREN, '(', start_line, start_col, TokenKind.LPAREN))
                 self.advance()
             elif current == ')':
-                self.tokens.append(Token(TokenType.RPAREN, ')', start_line, start_col))
+                self.tokens.append(Token(TokenType.RPAREN, ')', start_line, start_col, TokenKind.RPAREN))
                 self.advance()
             elif current == '[':
-                self.tokens.append(Token(TokenType.LBRACKET, '[', start_line, start_col))
+                self.tokens.append(Token(TokenType.LBRACKET, '[', start_line, start_col, TokenKind.LBRACKET))
                 self.advance()
             elif current == ']':
-                self.tokens.append(Token(TokenType.RBRACKET, ']', start_line, start_col))
+                self.tokens.append(Token(TokenType.RBRACKET, ']', start_line, start_col, TokenKind.RBRACKET))
                 self.advance()
             elif current == ',':
-                self.tokens.append(Token(TokenType.COMMA, ',', start_line, start_col))
+                self.tokens.append(Token(TokenType.COMMA, ',', start_line, start_col, TokenKind.COMMA))
                 self.advance()
             elif current == ':':
-                self.tokens.append(Token(TokenType.COLON, ':', start_line, start_col))
+                self.tokens.append(Token(TokenType.COLON, ':', start_line, start_col, TokenKind.COLON))
                 self.advance()
             elif current == '.':
-                self.tokens.append(Token(TokenType.DOT, '.', start_line, start_col))
+                self.tokens.append(Token(TokenType.DOT, '.', start_line, start_col, TokenKind.DOT))
                 self.advance()
             elif current == '$':
-                self.tokens.append(Token(TokenType.DOLLAR, '$', start_line, start_col))
+                self.tokens.append(Token(TokenType.DOLLAR, '$', start_line, start_col, TokenKind.DOLLAR))
                 self.advance()
             else:
                 self.error(f"Unexpected character: {current}")
         
-        self.tokens.append(Token(TokenType.EOF, '', self.line, self.column))
+        self.tokens.append(Token(TokenType.EOF, '', self.line, self.column, TokenKind.EOF))
         return self.tokens
+
+# Keyword text -> integer kind
+KEYWORD_KINDS = {word: getattr(TokenKind, 'KW_' + word.upper()) for word in Lexer.KEYWORDS}
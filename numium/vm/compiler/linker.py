@@ -0,0 +1,129 @@
+"""
+Numium Linker - Merge separately compiled units into one program
+Liên kết các đơn vị biên dịch riêng (thư viện import) thành một chương trình
+
+Each `import <lib>` names a library compiled on its own to <lib>.numo, a
+.numbc v2 file that keeps its imports and the CALLs it could not resolve
+(to modules defined elsewhere). link() lays the units out one after the
+other, libraries first, so their top-level code runs in import order
+before the program's. It merges the constant pools, maps variables by name
+and points every CALL at the callee's entry. Local slots need no mapping.
+"""
+
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+try:
+    from .bytecode import Bytecode, iter_instructions
+    from .opcodes import OPERAND_KINDS, SWITCH_ENTRY_KINDS, switch_kinds
+except ImportError:  # run as a script from vm/compiler
+    from bytecode import Bytecode, iter_instructions
+    from opcodes import OPERAND_KINDS, SWITCH_ENTRY_KINDS, switch_kinds
+
+# Libraries provided by the runtime; importing them links no code
+BUILTIN_LIBRARIES = frozenset({'numium_stdio', 'environment', 'time', 'kernel_linker'})
+
+OBJECT_SUFFIX = '.numo'
+
+class LinkError(Exception):
+    """Missing library, undefined or duplicate module"""
+
+def linked_imports(bytecode: Bytecode) -> List[str]:
+    """Imports of a unit that need linking (not built into the runtime)"""
+    return [name for name in bytecode.imports if name not in BUILTIN_LIBRARIES]
+
+def find_library(name: str, search_path: Sequence[str]) -> str:
+    """Path of <name>.num in the first search directory that has it"""
+    for directory in search_path:
+        path = os.path.join(directory, name + '.num')
+        if os.path.isfile(path):
+            return path
+    raise LinkError(f"Cannot find library '{name}' (looked in {', '.join(search_path) or 'nothing'})")
+
+def object_file(source_filename: str) -> str:
+    return os.path.splitext(source_filename)[0] + OBJECT_SUFFIX
+
+def link(units: List[Tuple[str, Bytecode]]) -> Bytecode:
+    """Merge (name, unit) pairs, in execution order, into one program"""
+    symbols: Dict[str, int] = {}
+    owners: Dict[str, str] = {}
+    bases = []
+    base = 0
+    for name, unit in units:
+        for function, offset in unit.functions.items():
+            if function in symbols:
+                raise LinkError(f"Module '{function}' is defined in both {owners[function]} and {name}")
+            symbols[function] = base + offset
+            owners[function] = name
+        bases.append(base)
+        base += len(unit.code)
+    
+    linked = Bytecode()
+    emit = linked.emit
+    for (name, unit), base in zip(units, bases):
+        constants = [linked.add_constant(value) for value in unit.constants]
+        variables = [0] * len(unit.variables)
+        for variable, index in unit.variables.items():
+            variables[index] = linked.add_variable(variable)
+        external_calls = unit.external_calls
+        
+        for offset, opcode, operands in iter_instructions(unit.code):
+            kinds = OPERAND_KINDS.get(opcode)
+            if opcode in SWITCH_ENTRY_KINDS:
+                kinds = switch_kinds(opcode, operands)
+            if not kinds:
+                emit(opcode)
+                continue
+            args = []
+            for position, (kind, value) in enumerate(zip(kinds, operands)):
+                if kind == 'c':
+                    value = constants[value]
+                elif kind == 'v':
+                    value = variables[value]
+                elif kind == 'l' or kind == 'n':  # Frame slots are per function; counts stay
+                    pass
+                else:
+                    callee = external_calls.get(offset + 1 + 4 * position)
+                    if callee is None:
+                        value += base
+                    elif callee in symbols:
+                        value = symbols[callee]
+                    else:
+                        raise LinkError(f"{name}: call to undefined module '{callee}'")
+                args.append(value)
+            emit(opcode, *args)
+    
+    linked.functions.update(symbols)
+    for (_, unit), base in zip(units, bases):
+        linked.frame_sizes.update(unit.frame_sizes)
+        # Lines stay those of each unit's own source
+        linked.positions += [(base + offset, line, column) for offset, line, column in unit.positions]
+    return linked
+
+def import_order(program: Bytecode, load_unit, program_name: str = 'program') -> List[Tuple[str, Bytecode]]:
+    """Units reachable from program's imports, dependencies first, program last
+    
+    load_unit(name) returns the compiled library; each is loaded once.
+    """
+    units: List[Tuple[str, Bytecode]] = []
+    done = set()
+    visiting: List[str] = []
+    
+    # Iterative depth-first post-order over the import graph
+    stack: List[Tuple[str, Optional[Bytecode], int]] = [(program_name, program, 0)]
+    while stack:
+        name, unit, position = stack.pop()
+        imports = linked_imports(unit)
+        if position == 0:
+            visiting.append(name)
+        if position < len(imports):
+            stack.append((name, unit, position + 1))
+            library = imports[position]
+            if library in visiting:
+                raise LinkError(f"Import cycle: {' -> '.join(visiting + [library])}")
+            if library not in done:
+                stack.append((library, load_unit(library), 0))
+            continue
+        visiting.pop()
+        done.add(name)
+        units.append((name, unit))
+    return units
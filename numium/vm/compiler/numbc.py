@@ -0,0 +1,366 @@
+"""
+Numium Bytecode File - The .numbc v2 container
+Định dạng file bytecode nhị phân, đọc trực tiếp bằng mmap
+
+Layout (all integers little-endian):
+
+    header      magic "NUMB", u16 version, u16 flags, u32 section count, u32 reserved
+    sections    per section: 4-byte kind, u32 offset, u32 size, u32 entry count
+    CODE        raw instruction bytes
+    CNST        per constant: u8 type, 3 pad, u32 length, 8-byte payload
+    VARS, FUNC  per name: u32 value (slot / entry offset), u32 name offset, u32 name length
+    FRAM        per function: local slots in its call frame, then the name as above
+    STRS        UTF-8 bytes of string constants and names, offsets relative to STRS
+
+Separately compiled units (linker.py) may also have:
+
+    IMPT        imported libraries, as names (value 0)
+    XREF        CALLs to other units: u32 operand offset, callee name
+    SKEY        ASCII cache key of the source the unit was compiled from
+
+and any file may have a source position table:
+
+    LINE        per entry, LEB128 varints: code offset delta, then zigzag
+                line and column deltas; an entry covers the code up to the
+                next one (see encode_positions)
+
+and set FLAG_UNRESOLVED in the header while XREF is not empty. Register
+bytecode (numiac --target=reg) sets FLAG_REGISTER and has an empty REGS
+section whose entry count is the number of registers.
+
+Sections start on 8-byte boundaries, so every table can be read in place.
+Files from before v2 are raw code plus a .meta.json sidecar; convert_legacy()
+rewrites them.
+"""
+
+import json
+import mmap
+import struct
+import sys
+from array import array
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+MAGIC = b'NUMB'
+FORMAT_VERSION = 2
+
+HEADER = struct.Struct('<4sHHII')
+SECTION = struct.Struct('<4sIII')
+CONSTANT = struct.Struct('<BxxxIq')  # Float payloads are reinterpreted from the int64
+NAME = struct.Struct('<III')
+_INT64 = struct.Struct('<q')
+_FLOAT64 = struct.Struct('<d')
+
+SECTION_CODE = b'CODE'
+SECTION_CONSTANTS = b'CNST'
+SECTION_VARIABLES = b'VARS'
+SECTION_FUNCTIONS = b'FUNC'
+SECTION_STRINGS = b'STRS'
+SECTION_FRAMES = b'FRAM'
+SECTION_IMPORTS = b'IMPT'
+SECTION_EXTERNAL_CALLS = b'XREF'
+SECTION_SOURCE_KEY = b'SKEY'
+SECTION_REGISTERS = b'REGS'
+SECTION_LINES = b'LINE'
+
+# Header flags
+FLAG_UNRESOLVED = 0x1  # Some CALLs still need linking; not runnable as is
+FLAG_REGISTER = 0x2  # Register-machine code (regcodegen.py), not stack code
+
+# Constant type tags; the same numbers as ValueType in vm.h
+TYPE_INTEGER = 0
+TYPE_FLOAT = 1
+TYPE_STRING = 2
+TYPE_BOOL = 3
+TYPE_NULL = 6
+
+ALIGNMENT = 8
+
+class NumbcError(ValueError):
+    """Malformed or unsupported .numbc file"""
+
+def is_container(data: bytes) -> bool:
+    """True if data starts with a v2 container header"""
+    return data[:4] == MAGIC
+
+class _Strings:
+    """STRS section builder; equal strings are stored once"""
+    
+    def __init__(self):
+        self.data = bytearray()
+        self.offsets: Dict[str, Tuple[int, int]] = {}
+    
+    def add(self, text: str) -> Tuple[int, int]:
+        span = self.offsets.get(text)
+        if span is None:
+            encoded = text.encode('utf-8')
+            span = (len(self.data), len(encoded))
+            self.data += encoded
+            self.offsets[text] = span
+        return span
+
+def _encode_constant(value: Any, strings: _Strings) -> bytes:
+    kind = type(value)
+    if kind is bool:
+        return CONSTANT.pack(TYPE_BOOL, 0, int(value))
+    if kind is int:
+        if not -(1 << 63) <= value < 1 << 63:
+            raise NumbcError(f"Integer constant {value} does not fit in 64 bits")
+        return CONSTANT.pack(TYPE_INTEGER, 0, value)
+    if kind is float:
+        return CONSTANT.pack(TYPE_FLOAT, 0, _INT64.unpack(_FLOAT64.pack(value))[0])
+    if kind is str:
+        offset, length = strings.add(value)
+        return CONSTANT.pack(TYPE_STRING, length, offset)
+    if value is None:
+        return CONSTANT.pack(TYPE_NULL, 0, 0)
+    raise NumbcError(f"Cannot store constant of type {kind.__name__}")
+
+def _varint(value: int, out: bytearray):
+    while value > 0x7F:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+def encode_positions(positions: Sequence[Tuple[int, int, int]]) -> bytes:
+    """Delta-encode (code offset, line, column) entries sorted by offset
+    
+    Like CPython's line table, most entries take three bytes: the offset
+    grows a little and line and column move by small amounts.
+    """
+    out = bytearray()
+    previous = (0, 0, 0)
+    for entry in positions:
+        offset, line, column = entry
+        _varint(offset - previous[0], out)
+        for delta in (line - previous[1], column - previous[2]):
+            _varint(delta << 1 if delta >= 0 else (~delta << 1) | 1, out)  # Zigzag
+        previous = entry
+    return bytes(out)
+
+def decode_positions(data: bytes, count: int) -> List[Tuple[int, int, int]]:
+    """Inverse of encode_positions"""
+    positions = []
+    values = [0, 0, 0]
+    index = 0
+    try:
+        for _ in range(count):
+            for field in range(3):
+                shift = value = 0
+                while True:
+                    byte = data[index]
+                    index += 1
+                    value |= (byte & 0x7F) << shift
+                    shift += 7
+                    if byte < 0x80:
+                        break
+                values[field] += value if field == 0 else (value >> 1) ^ -(value & 1)
+            positions.append(tuple(values))
+    except IndexError:
+        raise NumbcError("Position table runs past its section") from None
+    return positions
+
+def _encode_names(names: Dict[str, int], strings: _Strings) -> bytes:
+    entries = bytearray()
+    for name, value in names.items():
+        offset, length = strings.add(name)
+        entries += NAME.pack(value, offset, length)
+    return bytes(entries)
+
+def encode(code: bytes, constants: List[Any], variables: Dict[str, int],
+           functions: Dict[str, int], imports: Sequence[str] = (),
+           external_calls: Optional[Dict[int, str]] = None, source_key: str = '',
+           register_count: Optional[int] = None,
+           frame_sizes: Optional[Dict[str, int]] = None,
+           positions: Sequence[Tuple[int, int, int]] = ()) -> bytes:
+    """Build a v2 container"""
+    strings = _Strings()
+    constant_table = b''.join(_encode_constant(value, strings) for value in constants)
+    sections = [
+        (SECTION_CODE, bytes(code), len(code)),
+        (SECTION_CONSTANTS, constant_table, len(constants)),
+        (SECTION_VARIABLES, _encode_names(variables, strings), len(variables)),
+        (SECTION_FUNCTIONS, _encode_names(functions, strings), len(functions)),
+    ]
+    if frame_sizes:
+        sections.append((SECTION_FRAMES, _encode_names(frame_sizes, strings), len(frame_sizes)))
+    if imports:
+        sections.append((SECTION_IMPORTS, _encode_names(dict.fromkeys(imports, 0), strings), len(imports)))
+    if external_calls:
+        table = b''.join(NAME.pack(offset, *strings.add(name)) for offset, name in external_calls.items())
+        sections.append((SECTION_EXTERNAL_CALLS, table, len(external_calls)))
+    if source_key:
+        sections.append((SECTION_SOURCE_KEY, source_key.encode('ascii'), len(source_key)))
+    if register_count is not None:
+        sections.append((SECTION_REGISTERS, b'', register_count))
+    if positions:
+        sections.append((SECTION_LINES, encode_positions(positions), len(positions)))
+    sections.append((SECTION_STRINGS, bytes(strings.data), len(strings.data)))
+    
+    flags = FLAG_UNRESOLVED if external_calls else 0
+    if register_count is not None:
+        flags |= FLAG_REGISTER
+    out = bytearray(HEADER.pack(MAGIC, FORMAT_VERSION, flags, len(sections), 0))
+    table_at = len(out)
+    out += bytes(SECTION.size * len(sections))
+    for index, (kind, data, count) in enumerate(sections):
+        out += bytes(-len(out) % ALIGNMENT)
+        SECTION.pack_into(out, table_at + index * SECTION.size, kind, len(out), len(data), count)
+        out += data
+    return bytes(out)
+
+def _decode_constant(kind: int, length: int, payload: int, strings: '_StringTable') -> Any:
+    if kind == TYPE_STRING:
+        return strings.get(payload, length)
+    if kind == TYPE_INTEGER:
+        return payload
+    if kind == TYPE_FLOAT:
+        return _FLOAT64.unpack(_INT64.pack(payload))[0]
+    if kind == TYPE_BOOL:
+        return payload != 0
+    if kind == TYPE_NULL:
+        return None
+    raise NumbcError(f"Unknown constant type {kind}")
+
+class _StringTable:
+    """STRS section reader; ASCII tables are decoded once and sliced as str"""
+    
+    def __init__(self, data: memoryview):
+        self.data = bytes(data)
+        self.text = self.data.decode('ascii') if self.data.isascii() else None
+    
+    def get(self, offset: int, length: int) -> str:
+        if self.text is not None:
+            return self.text[offset:offset + length]
+        return self.data[offset:offset + length].decode('utf-8')
+
+class NumbcImage:
+    """A v2 container over bytes or an mmap; sections are decoded on demand"""
+    
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.view = memoryview(buffer)
+        if len(self.view) < HEADER.size:
+            raise NumbcError("File too short for a .numbc header")
+        magic, version, self.flags, count, _reserved = HEADER.unpack_from(self.view, 0)
+        if magic != MAGIC:
+            raise NumbcError("Not a .numbc v2 file (bad magic)")
+        if version != FORMAT_VERSION:
+            raise NumbcError(f"Unsupported .numbc version {version}")
+        if HEADER.size + count * SECTION.size > len(self.view):
+            raise NumbcError("Section table runs past the end of the file")
+        
+        self.sections: Dict[bytes, Tuple[int, int, int]] = {}
+        for index in range(count):
+            kind, offset, size, entries = SECTION.unpack_from(self.view, HEADER.size + index * SECTION.size)
+            if offset + size > len(self.view):
+                raise NumbcError(f"Section {kind.decode('ascii', 'replace')} runs past the end of the file")
+            self.sections[kind] = (offset, size, entries)
+    
+    @classmethod
+    def open(cls, filename: str) -> 'NumbcImage':
+        """Map a file read-only"""
+        with open(filename, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(mapped)
+    
+    def close(self):
+        """Unmap the file; section views taken from it must be released first"""
+        self.view.release()
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+    
+    def __enter__(self) -> 'NumbcImage':
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def section(self, kind: bytes) -> memoryview:
+        """Bytes of a section, without copying; empty if the file has none"""
+        offset, size, _ = self.sections.get(kind, (0, 0, 0))
+        return self.view[offset:offset + size]
+    
+    def count(self, kind: bytes) -> int:
+        return self.sections.get(kind, (0, 0, 0))[2]
+    
+    @property
+    def code(self) -> memoryview:
+        return self.section(SECTION_CODE)
+    
+    def strings(self) -> _StringTable:
+        return _StringTable(self.section(SECTION_STRINGS))
+    
+    def constant(self, index: int) -> Any:
+        """Decode one constant"""
+        entry = CONSTANT.unpack_from(self.section(SECTION_CONSTANTS), index * CONSTANT.size)
+        return _decode_constant(*entry, self.strings())
+    
+    def constants(self) -> List[Any]:
+        strings = self.strings()
+        return [_decode_constant(kind, length, payload, strings)
+                for kind, length, payload in CONSTANT.iter_unpack(self.section(SECTION_CONSTANTS))]
+    
+    def name_table(self, kind: bytes) -> Iterator[Tuple[str, int]]:
+        """(name, value) pairs of a VARS, FUNC, FRAM, IMPT or XREF table"""
+        fields = array('I')
+        fields.frombytes(self.section(kind))
+        if sys.byteorder == 'big':
+            fields.byteswap()
+        get = self.strings().get
+        return zip(map(get, fields[1::3], fields[2::3]), fields[0::3])
+    
+    def names(self, kind: bytes) -> Dict[str, int]:
+        """Decode a name table into name -> value"""
+        return dict(self.name_table(kind))
+    
+    def variables(self) -> Dict[str, int]:
+        return self.names(SECTION_VARIABLES)
+    
+    def functions(self) -> Dict[str, int]:
+        return self.names(SECTION_FUNCTIONS)
+    
+    def frame_sizes(self) -> Dict[str, int]:
+        return self.names(SECTION_FRAMES)
+    
+    def imports(self) -> List[str]:
+        return list(self.names(SECTION_IMPORTS))
+    
+    def external_calls(self) -> Dict[int, str]:
+        return {offset: name for name, offset in self.name_table(SECTION_EXTERNAL_CALLS)}
+    
+    def source_key(self) -> str:
+        return str(self.section(SECTION_SOURCE_KEY), 'ascii')
+    
+    def register_count(self) -> int:
+        return self.count(SECTION_REGISTERS)
+    
+    def positions(self) -> List[Tuple[int, int, int]]:
+        """(code offset, line, column) entries; empty for files without a LINE section"""
+        return decode_positions(self.section(SECTION_LINES), self.count(SECTION_LINES))
+
+def legacy_metadata_file(filename: str) -> str:
+    """The .meta.json sidecar that goes with a pre-v2 .numbc file"""
+    return filename.replace('.numbc', '.meta.json')
+
+def load_legacy(filename: str) -> Tuple[bytes, List[Any], Dict[str, int], Dict[str, int]]:
+    """Read a pre-v2 file: (code, constants, variables, functions)"""
+    with open(filename, 'rb') as f:
+        code = f.read()
+    try:
+        with open(legacy_metadata_file(filename), 'r') as f:
+            metadata = json.load(f)
+    except FileNotFoundError:
+        metadata = {}
+    return (code, metadata.get('constants', []), metadata.get('variables', {}),
+            metadata.get('functions', {}))
+
+def convert_legacy(filename: str, output_filename: str = None) -> str:
+    """Rewrite a .numbc + .meta.json pair as a v2 container; returns the output path"""
+    with open(filename, 'rb') as f:
+        if is_container(f.read(len(MAGIC))):
+            raise NumbcError(f"{filename} is already a .numbc v2 file")
+    data = encode(*load_legacy(filename))
+    output_filename = output_filename or filename
+    with open(output_filename, 'wb') as f:
+        f.write(data)
+    return output_filename
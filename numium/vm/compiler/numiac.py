@@ -5,48 +5,224 @@ Biên dịch file Numium thành bytecode
 """
 
 import sys
+import os
+import glob
+import io
+import json
 import argparse
-from compiler import compile_file
+import contextlib
+import gc
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+try:
+    from .compiler import Compiler, compile_file
+    from .cache import CompileCache, DEFAULT_MAX_BYTES
+    from .regcodegen import disassemble
+    from .stats import CompileStats, stats_report, format_report
+except ImportError:  # run as a script from vm/compiler
+    from compiler import Compiler, compile_file
+    from cache import CompileCache, DEFAULT_MAX_BYTES
+    from regcodegen import disassemble
+    from stats import CompileStats, stats_report, format_report
 
-def main():
+def collect_inputs(patterns: List[str]) -> List[str]:
+    """Expand files, directories (every .num below them) and glob patterns, in order, once each"""
+    inputs = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for root, dirs, files in os.walk(pattern):
+                dirs.sort()
+                inputs.extend(os.path.join(root, name) for name in sorted(files) if name.endswith('.num'))
+        elif glob.has_magic(pattern):
+            inputs.extend(sorted(path for path in glob.glob(pattern, recursive=True)
+                                 if not os.path.isdir(path)))
+        else:
+            inputs.append(pattern)
+    return list(dict.fromkeys(inputs))
+
+def output_name(input_file: str, library: bool = False) -> str:
+    return os.path.splitext(input_file)[0] + ('.numo' if library else '.numbc')
+
+def compile_one(input_file: str, output_file: str, args: argparse.Namespace,
+                cache: Optional[CompileCache]
+                ) -> Tuple[bool, str, str, Tuple[int, int, int], Optional[dict]]:
+    """Compile one file with its printed output captured
+    
+    Returns (ok, stdout text, error message, (cache hits, misses, evictions),
+    --stats report or None) so a batch can report every file in input order.
+    """
+    out = io.StringIO()
+    error = ''
+    report = None
+    stats = CompileStats()
+    bytecode = None
+    if args.stats:
+        tracemalloc.start()
+    try:
+        with contextlib.redirect_stdout(out):
+            print(f"Compiling {input_file}...")
+            bytecode = compile_file(input_file, output_file, stream=args.stream,
+                                    compact_tokens=args.compact_tokens, opt_level=args.opt_level,
+                                    cache=cache, library=args.library,
+                                    search_path=args.library_dirs, target=args.target, stats=stats)
+            
+            if args.debug:
+                print("\n=== Bytecode Metadata ===")
+                print(f"Optimization level: -O{args.opt_level}")
+                print(f"Bytecode size: {len(bytecode.code)} bytes")
+                print(f"Instructions: {bytecode.instruction_count()}")
+                if args.opt_level > 0:
+                    with open(input_file, 'r') as f:
+                        baseline = Compiler(f.read(), target=args.target).compile()
+                    print(f"Unoptimized (-O0): {len(baseline.code)} bytes, "
+                          f"{baseline.instruction_count()} instructions")
+                print(f"Constants: {len(bytecode.constants)}")
+                print(f"Variables: {dict(bytecode.variables)}")
+                print(f"Functions: {dict(bytecode.functions)}")
+                if args.target == 'reg':
+                    print(f"Registers: {bytecode.register_count} ({len(bytecode.variables)} variables, "
+                          f"temporaries per module: {bytecode.frames})")
+                    print("\n=== Register Code ===")
+                    for line in disassemble(bytecode.code):
+                        print(line)
+            
+            print(f"✓ Successfully compiled to {output_file}")
+        ok = True
+    except Exception as e:
+        ok = False
+        error = str(e)
+        if args.debug:
+            import traceback
+            error += '\n' + traceback.format_exc()
+    if args.stats:
+        stats.peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        report = stats_report(stats, bytecode)
+        if args.stats == 'text':
+            out.write(format_report(report) + '\n')
+    counts = (cache.hits, cache.misses, cache.evictions) if cache is not None else (0, 0, 0)
+    if cache is not None:
+        cache.hits = cache.misses = cache.evictions = 0  # Counted once per file
+    return ok, out.getvalue(), error, counts, report
+
+def _compile_job(job):
+    return compile_one(*job)
+
+def main(argv: Optional[List[str]] = None):
     parser = argparse.ArgumentParser(
         description='Numium Language Compiler',
-        epilog='Example: numiac hello.num -o hello.numbc'
+        epilog='Example: numiac hello.num -o hello.numbc; numiac -j 8 src/ "lib/**/*.num"; numiac -L lib main.num'
     )
     
-    parser.add_argument('input', help='Source file (.num)')
-    parser.add_argument('-o', '--output', help='Output bytecode file (.numbc)', default=None)
+    parser.add_argument('inputs', nargs='*', metavar='input',
+                        help='Source files (.num), directories or glob patterns')
+    parser.add_argument('-o', '--output', help='Output bytecode file (.numbc), single input only',
+                        default=None)
+    parser.add_argument('-c', dest='library', action='store_true',
+                        help='Compile library units (.numo) to link later, without linking imports')
+    parser.add_argument('-L', dest='library_dirs', action='append', default=[], metavar='DIR',
+                        help='Also look for imported libraries in DIR (after the importing file\'s directory)')
+    parser.add_argument('--target', choices=('stack', 'reg'), default='stack',
+                        help='Bytecode form: stack machine (default) or three-address register machine')
+    parser.add_argument('-j', '--jobs', type=int, default=1, metavar='N',
+                        help='Compile N files at once in worker processes (0: one per CPU)')
     parser.add_argument('--debug', action='store_true', help='Print debug information')
+    parser.add_argument('-O', dest='opt_level', type=int, choices=(0, 1, 2), default=0,
+                        metavar='LEVEL', help='Optimization level: -O0 (default), -O1 or -O2')
+    parser.add_argument('--stream', action='store_true',
+                        help='Lex the source lazily while parsing (constant token memory)')
+    parser.add_argument('--compact-tokens', action='store_true',
+                        help='Keep tokens in a struct-of-arrays TokenBuffer')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Always compile; do not read or write the compile cache')
+    parser.add_argument('--cache-dir', default=None,
+                        help='Compile cache directory (default: $NUMIUM_CACHE_DIR or ~/.cache/numium)')
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024),
+                        metavar='MB', help='Evict least recently used cache entries above this size')
+    parser.add_argument('--cache-stats', action='store_true',
+                        help='Print cache hits, misses and size after compiling')
+    parser.add_argument('--stats', choices=('text', 'json'), default=None, metavar='FORMAT',
+                        help='Report phase timings, peak memory (tracemalloc) and code statistics '
+                             'per file: --stats=text, or --stats=json for one JSON document only')
+    parser.add_argument('--serve', action='store_true',
+                        help='Keep a warm compiler listening on a Unix socket for numiac-client')
+    parser.add_argument('--socket', default=None, metavar='PATH',
+                        help='Socket for --serve (default: $NUMIAC_SOCKET or numiac-<uid>.sock in /tmp)')
     parser.add_argument('--version', action='version', version='Numium Compiler v0.1')
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    
+    if args.serve:
+        if args.inputs:
+            parser.error('--serve takes no input files')
+        try:
+            from .server import serve
+        except ImportError:
+            from server import serve
+        return serve(args.socket)
+    if not args.inputs:
+        parser.error('the following arguments are required: input')
+    inputs = collect_inputs(args.inputs)
+    if not inputs:
+        parser.error('no .num files found')
+    if args.library and args.target != 'stack':
+        parser.error('-c needs --target=stack')
+    if args.output is not None and len(inputs) > 1:
+        parser.error('-o/--output needs exactly one input file')
+    outputs = [args.output or output_name(input_file, args.library) for input_file in inputs]
     
-    # Determine output filename
-    if args.output is None:
-        output_file = args.input.replace('.num', '.numbc')
-    else:
-        output_file = args.output
+    cache = None
+    if not args.no_cache:
+        cache = CompileCache(args.cache_dir, args.cache_size * 1024 * 1024)
     
+    jobs = [(input_file, output_file, args, cache) for input_file, output_file in zip(inputs, outputs)]
+    workers = min(args.jobs if args.jobs > 0 else (os.cpu_count() or 1), len(jobs))
+    # The IR is acyclic; keep the cycle collector from rescanning it on every
+    # allocation burst. Only this batch run, never the library, pauses it.
+    gc_enabled = gc.isenabled()
+    gc.disable()
     try:
-        print(f"Compiling {args.input}...")
-        bytecode = compile_file(args.input, output_file)
-        
-        if args.debug:
-            print("\n=== Bytecode Metadata ===")
-            print(f"Bytecode size: {len(bytecode.code)} bytes")
-            print(f"Constants: {len(bytecode.constants)}")
-            print(f"Variables: {dict(bytecode.variables)}")
-            print(f"Functions: {dict(bytecode.functions)}")
-        
-        print(f"✓ Successfully compiled to {output_file}")
-        return 0
-        
-    except Exception as e:
-        print(f"✗ Compilation failed: {e}", file=sys.stderr)
-        if args.debug:
-            import traceback
-            traceback.print_exc()
-        return 1
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers, initializer=gc.disable) as executor:
+                results = executor.map(_compile_job, jobs, chunksize=max(1, len(jobs) // (workers * 4)))
+                results = list(results)
+        else:
+            results = list(map(_compile_job, jobs))
+    finally:
+        if gc_enabled:
+            gc.enable()
+    
+    # Report in input order, whatever order the workers finished in
+    failures = []
+    reports = []
+    hits = misses = evictions = 0
+    for input_file, (ok, text, error, counts, report) in zip(inputs, results):
+        if args.stats == 'json':
+            reports.append(dict(file=input_file, ok=ok, **report))
+        else:
+            sys.stdout.write(text)
+        if not ok:
+            failures.append((input_file, error))
+            print(f"✗ Compilation failed: {error}", file=sys.stderr)
+        hits, misses, evictions = hits + counts[0], misses + counts[1], evictions + counts[2]
+    
+    if args.stats == 'json':
+        json.dump({'opt_level': args.opt_level, 'target': args.target, 'files': reports},
+                  sys.stdout, indent=2)
+        print()
+        return 1 if failures else 0
+    if args.cache_stats:
+        if cache is not None:
+            cache.hits, cache.misses, cache.evictions = hits, misses, evictions
+            print(cache.stats())
+        else:
+            print("Cache disabled (--no-cache)")
+    if len(inputs) > 1:
+        print(f"\n{len(inputs) - len(failures)} of {len(inputs)} files compiled, {len(failures)} failed")
+        for input_file, error in failures:
+            print(f"  ✗ {input_file}: {error.splitlines()[0] if error else 'failed'}", file=sys.stderr)
+    return 1 if failures else 0
 
 if __name__ == '__main__':
     sys.exit(main())
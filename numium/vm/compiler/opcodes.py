@@ -19,6 +19,17 @@ class Opcode:
     MOD = 0x14           # Modulo
     NEG = 0x15           # Negate
     
+    # Typed arithmetic (-O1, see specialize.py); any other operands take the generic path
+    ADD_INT = 0x16       # int + int
+    SUB_INT = 0x17
+    MUL_INT = 0x18
+    DIV_INT = 0x19
+    MOD_INT = 0x1A
+    ADD_FLOAT = 0x1B     # float + float
+    SUB_FLOAT = 0x1C
+    MUL_FLOAT = 0x1D
+    DIV_FLOAT = 0x1E
+    
     # Comparison
     EQ = 0x20            # Equal
     NE = 0x21            # Not equal
@@ -27,6 +38,18 @@ class Opcode:
     GT = 0x24            # Greater than
     GE = 0x25            # Greater than or equal
     
+    # Typed comparison; float equality keeps the generic tolerance
+    EQ_INT = 0x26
+    NE_INT = 0x27
+    LT_INT = 0x28
+    LE_INT = 0x29
+    GT_INT = 0x2A
+    GE_INT = 0x2B
+    LT_FLOAT = 0x2C
+    LE_FLOAT = 0x2D
+    GT_FLOAT = 0x2E
+    GE_FLOAT = 0x2F
+    
     # Logic
     AND_OP = 0x30        # Logical AND
     OR_OP = 0x31         # Logical OR
@@ -36,6 +59,8 @@ class Opcode:
     LOAD_VAR = 0x40      # Load variable
     STORE_VAR = 0x41     # Store to variable
     INIT_VAR = 0x42      # Initialize variable
+    LOAD_LOCAL = 0x43    # Load slot of the current call frame
+    STORE_LOCAL = 0x44   # Store to slot of the current call frame
     
     # Control Flow
     JMP = 0x50           # Jump
@@ -43,6 +68,12 @@ class Opcode:
     JMP_IFNOT = 0x52     # Jump if false
     CALL = 0x53          # Call function
     RET = 0x54           # Return from function
+    FOR_RANGE_INIT = 0x55  # vars[a] = 0; vars[b] = pop(); jump unless 0 < vars[b]
+    FOR_RANGE_NEXT = 0x56  # vars[a] += 1; jump if vars[a] < vars[b]
+    FOR_LOCAL_INIT = 0x57  # Same, on slots of the current call frame
+    FOR_LOCAL_NEXT = 0x58
+    TABLESWITCH = 0x59   # Jump through a table indexed by pop() - consts[low]
+    LOOKUPSWITCH = 0x5A  # Binary search of sorted (consts[key], target) pairs for pop()
     
     # I/O
     OUTPUT = 0x60        # Print to output
@@ -56,6 +87,19 @@ class Opcode:
     DICT_GET = 0x74      # Get dict value
     DICT_SET = 0x75      # Set dict value
     
+    # Superinstructions (fused by peephole.py); var/const operands are indices
+    LOAD_VAR2 = 0x80     # Load variables a, b
+    STORE_CONST = 0x81   # vars[a] = consts[k]
+    ADD_VARS = 0x82      # Push vars[a] + vars[b]
+    ADD_VAR_CONST = 0x83 # Push vars[a] + consts[k]
+    INC_VAR = 0x84       # vars[a] = vars[a] + consts[k]
+    JMP_IFNOT_EQ = 0x88  # Jump unless vars[a] == consts[k]
+    JMP_IFNOT_NE = 0x89  # Jump unless vars[a] != consts[k]
+    JMP_IFNOT_LT = 0x8A  # Jump unless vars[a] < consts[k]
+    JMP_IFNOT_LE = 0x8B  # Jump unless vars[a] <= consts[k]
+    JMP_IFNOT_GT = 0x8C  # Jump unless vars[a] > consts[k]
+    JMP_IFNOT_GE = 0x8D  # Jump unless vars[a] >= consts[k]
+    
     # Special
     NOP = 0xFF           # No operation
     HALT = 0x00          # Stop execution
@@ -71,23 +115,50 @@ OPCODE_NAMES = {
     0x13: "DIV",
     0x14: "MOD",
     0x15: "NEG",
+    0x16: "ADD_INT",
+    0x17: "SUB_INT",
+    0x18: "MUL_INT",
+    0x19: "DIV_INT",
+    0x1A: "MOD_INT",
+    0x1B: "ADD_FLOAT",
+    0x1C: "SUB_FLOAT",
+    0x1D: "MUL_FLOAT",
+    0x1E: "DIV_FLOAT",
     0x20: "EQ",
     0x21: "NE",
     0x22: "LT",
     0x23: "LE",
     0x24: "GT",
     0x25: "GE",
+    0x26: "EQ_INT",
+    0x27: "NE_INT",
+    0x28: "LT_INT",
+    0x29: "LE_INT",
+    0x2A: "GT_INT",
+    0x2B: "GE_INT",
+    0x2C: "LT_FLOAT",
+    0x2D: "LE_FLOAT",
+    0x2E: "GT_FLOAT",
+    0x2F: "GE_FLOAT",
     0x30: "AND",
     0x31: "OR",
     0x32: "NOT",
     0x40: "LOAD_VAR",
     0x41: "STORE_VAR",
     0x42: "INIT_VAR",
+    0x43: "LOAD_LOCAL",
+    0x44: "STORE_LOCAL",
     0x50: "JMP",
     0x51: "JMP_IF",
     0x52: "JMP_IFNOT",
     0x53: "CALL",
     0x54: "RET",
+    0x55: "FOR_RANGE_INIT",
+    0x56: "FOR_RANGE_NEXT",
+    0x57: "FOR_LOCAL_INIT",
+    0x58: "FOR_LOCAL_NEXT",
+    0x59: "TABLESWITCH",
+    0x5A: "LOOKUPSWITCH",
     0x60: "OUTPUT",
     0x61: "INPUT",
     0x70: "MAKE_LIST",
@@ -96,6 +167,184 @@ OPCODE_NAMES = {
     0x73: "LIST_SET",
     0x74: "DICT_GET",
     0x75: "DICT_SET",
+    0x80: "LOAD_VAR2",
+    0x81: "STORE_CONST",
+    0x82: "ADD_VARS",
+    0x83: "ADD_VAR_CONST",
+    0x84: "INC_VAR",
+    0x88: "JMP_IFNOT_EQ",
+    0x89: "JMP_IFNOT_NE",
+    0x8A: "JMP_IFNOT_LT",
+    0x8B: "JMP_IFNOT_LE",
+    0x8C: "JMP_IFNOT_GT",
+    0x8D: "JMP_IFNOT_GE",
     0xFF: "NOP",
     0x00: "HALT",
 }
+
+# What each 4-byte little-endian operand refers to (opcodes not listed have none):
+# 'c' constant pool index, 'v' variable index, 'l' local slot, 'j' code offset,
+# 'n' a count
+OPERAND_KINDS = {
+    Opcode.PUSH: 'c', Opcode.LOAD_VAR: 'v', Opcode.STORE_VAR: 'v', Opcode.INIT_VAR: 'v',
+    Opcode.LOAD_LOCAL: 'l', Opcode.STORE_LOCAL: 'l',
+    Opcode.JMP: 'j', Opcode.JMP_IF: 'j', Opcode.JMP_IFNOT: 'j', Opcode.CALL: 'j',
+    Opcode.FOR_RANGE_INIT: 'vvj', Opcode.FOR_RANGE_NEXT: 'vvj',
+    Opcode.FOR_LOCAL_INIT: 'llj', Opcode.FOR_LOCAL_NEXT: 'llj',
+    Opcode.TABLESWITCH: 'cnj', Opcode.LOOKUPSWITCH: 'nj',
+    Opcode.LOAD_VAR2: 'vv', Opcode.STORE_CONST: 'vc', Opcode.ADD_VARS: 'vv',
+    Opcode.ADD_VAR_CONST: 'vc', Opcode.INC_VAR: 'vc',
+    Opcode.JMP_IFNOT_EQ: 'vcj', Opcode.JMP_IFNOT_NE: 'vcj', Opcode.JMP_IFNOT_LT: 'vcj',
+    Opcode.JMP_IFNOT_LE: 'vcj', Opcode.JMP_IFNOT_GT: 'vcj', Opcode.JMP_IFNOT_GE: 'vcj',
+}
+
+# Switches: the operands above (low, count, default target), then a table of
+# count entries of these kinds. Integer keys are int-typed, no bool or float;
+# a subject of another type, or missing from the table, takes the default.
+SWITCH_ENTRY_KINDS = {
+    Opcode.TABLESWITCH: 'j',        # Target for consts[low] + 0, + 1, ...
+    Opcode.LOOKUPSWITCH: 'cj',      # Key and target, keys sorted (ints, or strings by bytes)
+}
+
+def switch_kinds(opcode: int, operands, kinds=OPERAND_KINDS, entries=SWITCH_ENTRY_KINDS) -> str:
+    """Operand kinds of a whole switch instruction, table included"""
+    fixed = kinds[opcode]
+    return fixed + entries[opcode] * operands[fixed.index('n')]
+
+# Number of operands after each opcode (switches: before the table)
+OPERAND_COUNTS = {opcode: len(kinds) for opcode, kinds in OPERAND_KINDS.items()}
+
+# Opcodes followed by at least one operand
+ARG_OPCODES = frozenset(OPERAND_COUNTS)
+
+# Opcodes whose last operand is a code offset (CALL takes the callee's entry)
+JUMP_OPCODES = frozenset({
+    Opcode.JMP, Opcode.JMP_IF, Opcode.JMP_IFNOT, Opcode.CALL,
+    Opcode.FOR_RANGE_INIT, Opcode.FOR_RANGE_NEXT, Opcode.FOR_LOCAL_INIT, Opcode.FOR_LOCAL_NEXT,
+    Opcode.JMP_IFNOT_EQ, Opcode.JMP_IFNOT_NE, Opcode.JMP_IFNOT_LT,
+    Opcode.JMP_IFNOT_LE, Opcode.JMP_IFNOT_GT, Opcode.JMP_IFNOT_GE,
+})
+
+# Comparison opcode -> fused compare-with-constant-and-branch opcode
+COMPARE_BRANCHES = {
+    Opcode.EQ: Opcode.JMP_IFNOT_EQ,
+    Opcode.NE: Opcode.JMP_IFNOT_NE,
+    Opcode.LT: Opcode.JMP_IFNOT_LT,
+    Opcode.LE: Opcode.JMP_IFNOT_LE,
+    Opcode.GT: Opcode.JMP_IFNOT_GT,
+    Opcode.GE: Opcode.JMP_IFNOT_GE,
+}
+
+# (generic opcode, operand type) -> typed opcode, for operands both of that type
+TYPED_OPCODES = {
+    (Opcode.ADD, 'int'): Opcode.ADD_INT, (Opcode.SUB, 'int'): Opcode.SUB_INT,
+    (Opcode.MUL, 'int'): Opcode.MUL_INT, (Opcode.DIV, 'int'): Opcode.DIV_INT,
+    (Opcode.MOD, 'int'): Opcode.MOD_INT,
+    (Opcode.ADD, 'float'): Opcode.ADD_FLOAT, (Opcode.SUB, 'float'): Opcode.SUB_FLOAT,
+    (Opcode.MUL, 'float'): Opcode.MUL_FLOAT, (Opcode.DIV, 'float'): Opcode.DIV_FLOAT,
+    (Opcode.EQ, 'int'): Opcode.EQ_INT, (Opcode.NE, 'int'): Opcode.NE_INT,
+    (Opcode.LT, 'int'): Opcode.LT_INT, (Opcode.LE, 'int'): Opcode.LE_INT,
+    (Opcode.GT, 'int'): Opcode.GT_INT, (Opcode.GE, 'int'): Opcode.GE_INT,
+    (Opcode.LT, 'float'): Opcode.LT_FLOAT, (Opcode.LE, 'float'): Opcode.LE_FLOAT,
+    (Opcode.GT, 'float'): Opcode.GT_FLOAT, (Opcode.GE, 'float'): Opcode.GE_FLOAT,
+}
+
+# Typed opcode -> the generic opcode it computes
+GENERIC_OPCODES = {typed: generic for (generic, _), typed in TYPED_OPCODES.items()}
+
+class RegOpcode:
+    """Register-machine opcodes (numiac --target=reg, see regcodegen.py)
+    
+    Three-address form: `ADD a, b, c` sets register a to b + c. Source
+    operands marked 'x' are RK: a register, or a constant pool index with
+    RK_CONSTANT set. Arithmetic, comparison and logic opcodes share their
+    numbers with the stack set.
+    """
+    
+    MOVE = 0x01          # a = RK(b)
+    LOADK = 0x02         # a = consts[k], for pool indices too big for RK
+    
+    ADD = 0x10
+    SUB = 0x11
+    MUL = 0x12
+    DIV = 0x13
+    MOD = 0x14
+    NEG = 0x15           # a = -RK(b)
+    ADD_INT = 0x16       # Typed forms as in the stack set
+    SUB_INT = 0x17
+    MUL_INT = 0x18
+    DIV_INT = 0x19
+    MOD_INT = 0x1A
+    ADD_FLOAT = 0x1B
+    SUB_FLOAT = 0x1C
+    MUL_FLOAT = 0x1D
+    DIV_FLOAT = 0x1E
+    
+    EQ = 0x20
+    NE = 0x21
+    LT = 0x22
+    LE = 0x23
+    GT = 0x24
+    GE = 0x25
+    EQ_INT = 0x26
+    NE_INT = 0x27
+    LT_INT = 0x28
+    LE_INT = 0x29
+    GT_INT = 0x2A
+    GE_INT = 0x2B
+    LT_FLOAT = 0x2C
+    LE_FLOAT = 0x2D
+    GT_FLOAT = 0x2E
+    GE_FLOAT = 0x2F
+    
+    AND_OP = 0x30
+    OR_OP = 0x31
+    NOT_OP = 0x32        # a = !RK(b)
+    
+    JMP = 0x50
+    JMP_IF = 0x51        # Jump if RK(a)
+    JMP_IFNOT = 0x52     # Jump unless RK(a)
+    CALL = 0x53
+    RET = 0x54
+    FOR_RANGE_INIT = 0x55  # a = 0; jump unless 0 < RK(b)
+    FOR_RANGE_NEXT = 0x56  # a += 1; jump if a < RK(b)
+    TABLESWITCH = 0x59   # Switch on RK(a), tables as in the stack set
+    LOOKUPSWITCH = 0x5A
+    
+    OUTPUT = 0x60        # Print RK(a)
+    INPUT = 0x61         # a = input line
+    
+    JMP_IFNOT_EQ = 0x88  # Jump unless RK(a) == RK(b)
+    JMP_IFNOT_NE = 0x89
+    JMP_IFNOT_LT = 0x8A
+    JMP_IFNOT_LE = 0x8B
+    JMP_IFNOT_GT = 0x8C
+    JMP_IFNOT_GE = 0x8D
+    
+    NOP = 0xFF
+    HALT = 0x00
+
+REG_OPCODE_NAMES = {value: name[:-3] if name.endswith('_OP') else name
+                    for name, value in vars(RegOpcode).items() if name.isupper()}
+
+# RK operand bit: the rest of the operand is a constant pool index
+RK_CONSTANT = 0x8000
+
+# Operands after each register opcode: 'r' register and 'x' RK (2 bytes each),
+# 'k' constant pool index, 'j' code offset and 'n' count (4 bytes each)
+REG_OPERAND_KINDS = {
+    RegOpcode.MOVE: 'rx', RegOpcode.LOADK: 'rk',
+    RegOpcode.NEG: 'rx', RegOpcode.NOT_OP: 'rx',
+    RegOpcode.JMP: 'j', RegOpcode.JMP_IF: 'xj', RegOpcode.JMP_IFNOT: 'xj', RegOpcode.CALL: 'j',
+    RegOpcode.FOR_RANGE_INIT: 'rxj', RegOpcode.FOR_RANGE_NEXT: 'rxj',
+    RegOpcode.TABLESWITCH: 'xknj', RegOpcode.LOOKUPSWITCH: 'xnj',
+    RegOpcode.OUTPUT: 'x', RegOpcode.INPUT: 'r',
+}
+REG_SWITCH_ENTRY_KINDS = {RegOpcode.TABLESWITCH: 'j', RegOpcode.LOOKUPSWITCH: 'kj'}
+for _opcode in (RegOpcode.ADD, RegOpcode.SUB, RegOpcode.MUL, RegOpcode.DIV, RegOpcode.MOD,
+                RegOpcode.EQ, RegOpcode.NE, RegOpcode.LT, RegOpcode.LE, RegOpcode.GT, RegOpcode.GE,
+                RegOpcode.AND_OP, RegOpcode.OR_OP, *GENERIC_OPCODES):
+    REG_OPERAND_KINDS[_opcode] = 'rxx'
+for _opcode in range(RegOpcode.JMP_IFNOT_EQ, RegOpcode.JMP_IFNOT_GE + 1):
+    REG_OPERAND_KINDS[_opcode] = 'xxj'
+del _opcode
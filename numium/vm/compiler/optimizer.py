@@ -0,0 +1,571 @@
+"""
+Numium Optimizer - IR passes behind the -O levels
+Tối ưu hóa cây IR: gộp hằng số, bỏ mã chết và lệnh gán thừa
+"""
+
+import math
+import re
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+try:
+    from .opcodes import Opcode
+    from .ir import (Node, Const, Var, Unary, Binary, EnvDecl, Call, ExprStmt, If, While, For,
+                     Switch, Try, Return, Function, Program, TERMINATORS, function_locals,
+                     postorder, scoped_walk, walk)
+except ImportError:  # run as a script from vm/compiler
+    from opcodes import Opcode
+    from ir import (Node, Const, Var, Unary, Binary, EnvDecl, Call, ExprStmt, If, While, For,
+                    Switch, Try, Return, Function, Program, TERMINATORS, function_locals,
+                    postorder, scoped_walk, walk)
+
+INT64_MIN = -(1 << 63)
+INT64_MAX = (1 << 63) - 1
+
+# Upper bound on optimize/dead-store rounds per program
+MAX_PASSES = 8
+
+# Built-in calls that only read their arguments
+BUILTINS = frozenset({'output', 'input'})
+
+# output("value: $var") reads var
+_INTERPOLATION = re.compile(r'\$([A-Za-z_][A-Za-z0-9_]*)')
+
+_NUMERIC = ('int', 'float')
+_ARITHMETIC = frozenset({Opcode.ADD, Opcode.SUB, Opcode.MUL, Opcode.DIV, Opcode.MOD})
+_ORDERING = frozenset({Opcode.LT, Opcode.LE, Opcode.GT, Opcode.GE})
+
+# Identity operands: x + 0, 0 + x, x - 0, x * 1, 1 * x, x / 1
+_RIGHT_IDENTITY = {Opcode.ADD: 0, Opcode.SUB: 0, Opcode.MUL: 1, Opcode.DIV: 1}
+_LEFT_IDENTITY = {Opcode.ADD: 0, Opcode.MUL: 1}
+
+_UNFOLDED = object()  # the VM would not produce a plain constant
+_UNSET = 'unset'      # no store seen yet during type inference
+_COUNTER = Const(0)   # stands for the 0, 1, ... a range loop stores to its variable
+
+# Variable tables are keyed by (module, name) for a module's locals
+# (ir.function_locals) and by (None, name) for globals
+VariableKey = Tuple[Optional[str], str]
+
+def value_type(value: Any) -> Optional[str]:
+    """Numium type name of a constant"""
+    if isinstance(value, bool):
+        return 'bool'
+    if isinstance(value, int):
+        return 'int'
+    if isinstance(value, float):
+        return 'float'
+    if isinstance(value, str):
+        return 'string'
+    return None
+
+def truth(value: Any) -> bool:
+    """Truthiness used by AND/OR/NOT and conditional jumps: a nonzero bool or int"""
+    return type(value) in (bool, int) and value != 0
+
+def _c_div(a: int, b: int) -> int:
+    """Integer division truncating toward zero, as in C"""
+    quotient = abs(a) // abs(b)
+    return quotient if (a < 0) == (b < 0) else -quotient
+
+def _equal(a: Any, b: Any) -> bool:
+    kind = value_type(a)
+    if kind != value_type(b):
+        return False
+    if kind == 'float':
+        return abs(a - b) < 1e-9
+    return a == b
+
+def fold_binary(op: int, a: Any, b: Any) -> Any:
+    """Evaluate a binary opcode on two constants the way the VM does"""
+    if op == Opcode.AND_OP:
+        return truth(a) and truth(b)
+    if op == Opcode.OR_OP:
+        return truth(a) or truth(b)
+    if op == Opcode.EQ:
+        return _equal(a, b)
+    if op == Opcode.NE:
+        return not _equal(a, b)
+    
+    left, right = value_type(a), value_type(b)
+    if (left == 'int' and not INT64_MIN <= a <= INT64_MAX or
+            right == 'int' and not INT64_MIN <= b <= INT64_MAX):
+        return _UNFOLDED
+    ints = left == 'int' and right == 'int'
+    floats = not ints and left in _NUMERIC and right in _NUMERIC
+    
+    if op in _ORDERING:
+        if ints or floats:
+            result = a < b if op in (Opcode.LT, Opcode.LE) else a > b
+        elif left == 'float' or right == 'float':
+            return _UNFOLDED
+        else:
+            result = False
+        if op in (Opcode.LE, Opcode.GE):
+            result = result or _equal(a, b)
+        return result
+    
+    if ints:
+        if op == Opcode.ADD:
+            result = a + b
+        elif op == Opcode.SUB:
+            result = a - b
+        elif op == Opcode.MUL:
+            result = a * b
+        elif b == 0:
+            return _UNFOLDED
+        elif op == Opcode.DIV:
+            result = _c_div(a, b)
+        else:
+            result = a - b * _c_div(a, b)
+        return result if INT64_MIN <= result <= INT64_MAX else _UNFOLDED
+    
+    if floats and op != Opcode.MOD:
+        a, b = float(a), float(b)
+        if op == Opcode.ADD:
+            result = a + b
+        elif op == Opcode.SUB:
+            result = a - b
+        elif op == Opcode.MUL:
+            result = a * b
+        elif b == 0:
+            return _UNFOLDED
+        else:
+            result = a / b
+        return result if math.isfinite(result) else _UNFOLDED
+    
+    if op == Opcode.ADD and left == 'string' and right == 'string':
+        return a + b
+    return _UNFOLDED
+
+def fold_unary(op: int, a: Any) -> Any:
+    """Evaluate a prefix opcode on a constant the way the VM does"""
+    if op == Opcode.NOT_OP:
+        return not truth(a)
+    kind = value_type(a)
+    if kind == 'int' and INT64_MIN < a <= INT64_MAX:
+        return -a
+    if kind == 'float':
+        return -a
+    return _UNFOLDED
+
+def binary_type(op: int, left: Optional[str], right: Optional[str]) -> Optional[str]:
+    """Result type of a binary opcode; None if unknown or null"""
+    if op not in _ARITHMETIC:
+        return 'bool'
+    if left == _UNSET or right == _UNSET:
+        return _UNSET
+    if left == 'int' and right == 'int':
+        return 'int'
+    if op != Opcode.MOD and left in _NUMERIC and right in _NUMERIC:
+        return 'float'
+    if op == Opcode.ADD and left == 'string' and right == 'string':
+        return 'string'
+    return None
+
+def unary_type(op: int, operand: Optional[str]) -> Optional[str]:
+    if op == Opcode.NOT_OP:
+        return 'bool'
+    return operand if operand in _NUMERIC or operand == _UNSET else None
+
+def expression_type(expr: Node, var_types: Dict[Any, Optional[str]],
+                    key: Optional[Callable[[str], VariableKey]] = None) -> Optional[str]:
+    """Static type of an expression given variable types, keyed by name or by key(name)"""
+    types = []
+    for node in postorder(expr):
+        kind = type(node)
+        if kind is Binary:
+            right = types.pop()
+            types.append(binary_type(node.op, types.pop(), right))
+        elif kind is Unary:
+            types.append(unary_type(node.op, types.pop()))
+        elif kind is Const:
+            types.append(value_type(node.value))
+        else:
+            types.append(var_types.get(node.name if key is None else key(node.name), _UNSET))
+    return types[0]
+
+def scope_keys(program: Program) -> Dict[Optional[str], Callable[[str], VariableKey]]:
+    """Module name (None: top level) -> the table key of a name used there"""
+    def scope(module: Optional[str], local_names) -> Callable[[str], VariableKey]:
+        return lambda name: (module, name) if name in local_names else (None, name)
+    keys = {module: scope(module, slots) for module, slots in function_locals(program).items()}
+    keys[None] = scope(None, ())
+    return keys
+
+def infer_types(program: Program) -> Dict[VariableKey, Optional[str]]:
+    """Flow-insensitive variable types: the common type of every value stored to each variable
+    
+    A variable read before any store holds null; stores are assumed to
+    come first, which is safe for the identities used at -O1 since each
+    of them also maps null to null.
+    """
+    keys = scope_keys(program)
+    stores: List[Tuple[VariableKey, Node, Callable[[str], VariableKey]]] = []
+    types: Dict[VariableKey, Optional[str]] = {}
+    for module, statement in scoped_walk(program):
+        kind = type(statement)
+        key = keys[module]
+        if kind is EnvDecl:
+            stores.append((key(statement.name), statement.value, key))
+        elif kind is For:
+            stores.append((key(statement.var), _COUNTER, key))
+    
+    changed = True
+    while changed:
+        changed = False
+        for name, value, key in stores:
+            old = types.get(name, _UNSET)
+            if old is None:
+                continue
+            new = expression_type(value, types, key)
+            if new == _UNSET or new == old:
+                continue
+            types[name] = new if old == _UNSET else None
+            changed = True
+    return {name: (None if kind == _UNSET else kind) for name, kind in types.items()}
+
+def variable_reads(expr: Node) -> Set[str]:
+    """Variables an expression reads, including $name interpolations in strings"""
+    names = set()
+    for node in postorder(expr):
+        kind = type(node)
+        if kind is Var:
+            names.add(node.name)
+        elif kind is Const and type(node.value) is str and '$' in node.value:
+            names.update(_INTERPOLATION.findall(node.value))
+    return names
+
+def program_reads(program: Program) -> Set[str]:
+    """Variables the program reads; a range loop reads its variable to count on"""
+    names = set()
+    for statement in walk(program.body):
+        if type(statement) is For:
+            names.add(statement.var)
+        for expr in statement.expressions():
+            names |= variable_reads(expr)
+    return names
+
+def program_blocks(program: Program) -> List[List[Node]]:
+    """Every statement list in the program, outermost first"""
+    blocks = [program.body]
+    for statement in walk(program.body):
+        blocks.extend(statement.blocks())
+    return blocks
+
+def constant_variables(program: Program) -> Dict[VariableKey, Any]:
+    """Variables stored exactly once, with a constant"""
+    keys = scope_keys(program)
+    stores: Dict[VariableKey, List[Optional[Node]]] = {}
+    for module, statement in scoped_walk(program):
+        kind = type(statement)
+        if kind is EnvDecl:
+            stores.setdefault(keys[module](statement.name), []).append(statement.value)
+        elif kind is For:
+            stores.setdefault(keys[module](statement.var), []).append(None)
+    return {name: values[0].value for name, values in stores.items()
+            if len(values) == 1 and type(values[0]) is Const}
+
+class Optimizer:
+    """IR optimization passes
+    
+    -O1: constant folding, algebraic simplification, constant if/while/switch
+         conditions, unreachable code after back/stop/continue/HALT,
+         unused expression statements and dead stores to env variables.
+    -O2: also assumes every variable is stored before it is read, which
+         enables constant propagation and identities such as x * 0 -> 0.
+    
+    Variables are global across linked units. Unless whole_program is
+    true, another unit may store or read any variable, so nothing is
+    assumed about their types or values and unread stores are kept.
+    """
+    
+    def __init__(self, level: int = 1, whole_program: bool = True):
+        self.level = level
+        self.whole_program = whole_program
+        self.var_types: Dict[VariableKey, Optional[str]] = {}
+        self.constants: Dict[VariableKey, Any] = {}
+        self.keys: Dict[Optional[str], Callable[[str], VariableKey]] = {}
+        self.key = lambda name: (None, name)  # Scope of the statements being optimized
+        self.rewrites = 0
+    
+    def run(self, program: Program) -> Program:
+        if self.level <= 0:
+            return program
+        for _ in range(MAX_PASSES):
+            if self.whole_program:
+                self.keys = scope_keys(program)
+                self.var_types = infer_types(program)
+            if self.level >= 2 and self.whole_program:
+                self.constants = constant_variables(program)
+            self.rewrites = 0
+            program.body = self.optimize_block(program.body)
+            removed = self.eliminate_dead_stores(program)
+            if not removed and not self.rewrites:
+                break
+        return program
+    
+    # Statements
+    
+    def optimize_block(self, body: List[Node]) -> List[Node]:
+        """Optimize each statement and drop everything after a terminator"""
+        result = []
+        handlers = self.STATEMENT_HANDLERS
+        for statement in body:
+            handler = handlers.get(type(statement))
+            replacement = handler(self, statement) if handler else statement
+            if replacement is None:
+                continue
+            if type(replacement) is list:
+                result.extend(replacement)
+            else:
+                result.append(replacement)
+            if result and self.terminates(result[-1]):
+                break
+        return result
+    
+    def terminates(self, statement: Node) -> bool:
+        """True if control never reaches the statement after this one"""
+        if isinstance(statement, TERMINATORS):
+            return True
+        if type(statement) is If and statement.orelse:
+            return (bool(statement.body) and self.terminates(statement.body[-1]) and
+                    self.terminates(statement.orelse[-1]))
+        if type(statement) is Switch and statement.default:
+            return all(body and self.terminates(body[-1]) for body in statement.blocks())
+        return False
+    
+    def optimize_env(self, node: EnvDecl) -> Node:
+        node.value = self.fold(node.value)
+        return node
+    
+    def optimize_call(self, node: Call) -> Node:
+        node.args = [self.fold(arg) for arg in node.args]
+        return node
+    
+    def optimize_expr_stmt(self, node: ExprStmt) -> None:
+        # Expressions have no side effects; the value is never used
+        return None
+    
+    def optimize_if(self, node: If):
+        node.cond = self.fold(node.cond)
+        if type(node.cond) is Const:
+            if truth(node.cond.value):
+                return self.optimize_block(node.body)
+            return self.optimize_block(node.orelse) if node.orelse else None
+        
+        node.body = self.optimize_block(node.body)
+        if node.orelse is not None:
+            node.orelse = self.optimize_block(node.orelse) or None
+        if not node.body and node.orelse is None:
+            return None
+        return node
+    
+    def optimize_while(self, node: While) -> Optional[Node]:
+        node.cond = self.fold(node.cond)
+        if type(node.cond) is Const and not truth(node.cond.value):
+            return None
+        node.body = self.optimize_block(node.body)
+        return node
+    
+    def optimize_for(self, node: For) -> Node:
+        node.count = self.fold(node.count)
+        node.body = self.optimize_block(node.body)
+        return node
+    
+    def optimize_switch(self, node: Switch):
+        node.subject = self.fold(node.subject)
+        if type(node.subject) is Const:
+            subject = node.subject.value
+            for values, body in node.cases:
+                if any(_equal(value.value, subject) for value in values):
+                    return self.optimize_block(body)
+            return self.optimize_block(node.default) if node.default else None
+        
+        node.cases = [(values, self.optimize_block(body)) for values, body in node.cases]
+        if node.default is not None:
+            node.default = self.optimize_block(node.default) or None
+        if node.default is None and not any(body for _, body in node.cases):
+            return None
+        return node
+    
+    def optimize_try(self, node: Try) -> Optional[Node]:
+        node.body = self.optimize_block(node.body)
+        if not node.body:
+            return None  # Nothing can raise; the handler is unreachable
+        node.handler = self.optimize_block(node.handler)
+        return node
+    
+    def optimize_return(self, node: Return) -> Node:
+        if node.value is not None:
+            node.value = self.fold(node.value)
+        return node
+    
+    def optimize_function(self, node: Function) -> Node:
+        outer = self.key
+        if node.kind == 'module':
+            self.key = self.keys.get(node.name, outer)
+        try:
+            node.body = self.optimize_block(node.body)
+        finally:
+            self.key = outer
+        return node
+    
+    # Expressions
+    
+    def fold(self, expr: Node) -> Node:
+        """Constant-fold and simplify an expression tree"""
+        values = []  # (node, type)
+        var_types = self.var_types
+        constants = self.constants
+        key = self.key
+        for node in postorder(expr):
+            kind = type(node)
+            if kind is Binary:
+                right = values.pop()
+                values.append(self.fold_binary(node, values.pop(), right))
+            elif kind is Unary:
+                values.append(self.fold_unary(node, values.pop()))
+            elif kind is Const:
+                values.append((node, value_type(node.value)))
+            elif key(node.name) in constants:
+                value = constants[key(node.name)]
+                self.rewrites += 1
+                values.append((Const(value), value_type(value)))
+            else:
+                values.append((node, var_types.get(key(node.name))))
+        return values[0][0]
+    
+    def fold_binary(self, node: Binary, left_value, right_value):
+        left, left_type = left_value
+        right, right_type = right_value
+        op = node.op
+        if type(left) is Const and type(right) is Const:
+            value = fold_binary(op, left.value, right.value)
+            if value is not _UNFOLDED:
+                return Const(value), value_type(value)
+        
+        result_type = binary_type(op, left_type, right_type)
+        simplified = self.simplify(op, left, left_type, right, right_type, result_type)
+        if simplified is not None:
+            return simplified
+        node.left = left
+        node.right = right
+        return node, result_type
+    
+    def simplify(self, op: int, left: Node, left_type, right: Node, right_type, result_type):
+        """Algebraic identities; (node, type) or None"""
+        left_const = type(left) is Const
+        right_const = type(right) is Const
+        
+        # Operands have no side effects, so one constant can decide AND/OR
+        if op == Opcode.AND_OP or op == Opcode.OR_OP:
+            for const, other, other_type in ((left, right, right_type), (right, left, left_type)):
+                if type(const) is not Const:
+                    continue
+                if truth(const.value) == (op == Opcode.OR_OP):
+                    return Const(op == Opcode.OR_OP), 'bool'
+                if other_type == 'bool':
+                    return other, 'bool'
+            return None
+        
+        if result_type not in _NUMERIC:
+            return None
+        if (right_const and value_type(right.value) in _NUMERIC and
+                right.value == _RIGHT_IDENTITY.get(op) and left_type == result_type):
+            return left, result_type
+        if (left_const and value_type(left.value) in _NUMERIC and
+                left.value == _LEFT_IDENTITY.get(op) and right_type == result_type):
+            return right, result_type
+        
+        # -O2: identities that do not hold when an operand is still null
+        if self.level >= 2 and result_type == 'int':
+            if op == Opcode.MUL and (left_const and left.value == 0 or
+                                     right_const and right.value == 0):
+                return Const(0), 'int'
+            if op == Opcode.MOD and right_const and right.value in (1, -1):
+                return Const(0), 'int'
+            if (op == Opcode.SUB and type(left) is Var and type(right) is Var and
+                    left.name == right.name):
+                return Const(0), 'int'
+        return None
+    
+    def fold_unary(self, node: Unary, operand_value):
+        operand, operand_type = operand_value
+        op = node.op
+        if type(operand) is Const:
+            value = fold_unary(op, operand.value)
+            if value is not _UNFOLDED:
+                return Const(value), value_type(value)
+        
+        # --x -> x for numbers; !!x -> x for booleans
+        if type(operand) is Unary and operand.op == op:
+            inner = operand.operand
+            if op == Opcode.NEG and operand_type in _NUMERIC:
+                return inner, operand_type
+            if op == Opcode.NOT_OP and expression_type(inner, self.var_types, self.key) == 'bool':
+                return inner, 'bool'
+        node.operand = operand
+        return node, unary_type(op, operand_type)
+    
+    # Dead stores
+    
+    def eliminate_dead_stores(self, program: Program) -> int:
+        """Remove stores to variables nobody reads, then stores overwritten before a read"""
+        removed = 0
+        while self.whole_program:
+            reads = program_reads(program)
+            count = 0
+            for block in program_blocks(program):
+                kept = [statement for statement in block
+                        if type(statement) is not EnvDecl or statement.name in reads]
+                count += len(block) - len(kept)
+                block[:] = kept
+            if not count:
+                break
+            removed += count
+        
+        for block in program_blocks(program):
+            removed += self.drop_overwritten(block)
+        return removed
+    
+    def drop_overwritten(self, block: List[Node]) -> int:
+        """Remove stores in a straight-line run that a later store replaces unread"""
+        overwritten: Set[str] = set()
+        kept = []
+        for statement in reversed(block):
+            kind = type(statement)
+            if kind is EnvDecl:
+                if statement.name in overwritten:
+                    continue
+                overwritten.add(statement.name)
+                overwritten -= variable_reads(statement.value)
+            elif kind is Call and statement.name in BUILTINS:
+                for arg in statement.args:
+                    overwritten -= variable_reads(arg)
+            else:
+                # Control flow or user code may read anything
+                overwritten = set()
+            kept.append(statement)
+        
+        removed = len(block) - len(kept)
+        if removed:
+            kept.reverse()
+            block[:] = kept
+        return removed
+    
+    # IR node type -> optimize method; other statements are kept as they are
+    STATEMENT_HANDLERS = {
+        EnvDecl: optimize_env,
+        Call: optimize_call,
+        ExprStmt: optimize_expr_stmt,
+        If: optimize_if,
+        While: optimize_while,
+        For: optimize_for,
+        Switch: optimize_switch,
+        Try: optimize_try,
+        Return: optimize_return,
+        Function: optimize_function,
+    }
+
+def optimize(program: Program, level: int = 1, whole_program: bool = True) -> Program:
+    """Optimize a Program in place at the given -O level"""
+    return Optimizer(level, whole_program).run(program)
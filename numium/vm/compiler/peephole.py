@@ -0,0 +1,296 @@
+"""
+Numium Peephole Optimizer - Bytecode cleanups and superinstructions
+Tối ưu hóa cửa sổ nhỏ trên bytecode và gộp lệnh thường gặp
+"""
+
+from typing import Dict, List, Optional, Set, Tuple
+try:
+    from .bytecode import Bytecode, iter_instructions
+    from .opcodes import (Opcode, OPERAND_COUNTS, JUMP_OPCODES, COMPARE_BRANCHES, GENERIC_OPCODES,
+                          SWITCH_ENTRY_KINDS, switch_kinds)
+except ImportError:  # run as a script from vm/compiler
+    from bytecode import Bytecode, iter_instructions
+    from opcodes import (Opcode, OPERAND_COUNTS, JUMP_OPCODES, COMPARE_BRANCHES, GENERIC_OPCODES,
+                         SWITCH_ENTRY_KINDS, switch_kinds)
+
+# Upper bound on cleanup rounds before fusion
+MAX_PASSES = 8
+
+# Control never continues to the next instruction
+_NO_FALLTHROUGH = frozenset({Opcode.JMP, Opcode.HALT, *SWITCH_ENTRY_KINDS})
+
+# Instructions that only push a value, so a following POP cancels them
+_PURE_PUSHES = frozenset({Opcode.PUSH, Opcode.LOAD_VAR, Opcode.LOAD_LOCAL, Opcode.DUP})
+
+class Instruction:
+    """A decoded instruction; jumps refer to their target Instruction"""
+    __slots__ = ('op', 'args', 'target', 'table', 'symbol', 'live', 'forward', 'position')
+    
+    def __init__(self, op: int, args: List[int]):
+        self.op = op
+        self.args = args  # Operands without the jump target (a switch keeps all of them)
+        self.target: Optional['Instruction'] = None  # None: the end of the code
+        self.table: Optional[List[Optional['Instruction']]] = None  # A switch's 'j' targets
+        self.symbol: Optional[str] = None  # CALL into another unit, resolved by the linker
+        self.live = True
+        self.forward: Optional['Instruction'] = None  # Next live one once removed
+        self.position: Optional[Tuple[int, int]] = None  # Source (line, column)
+
+class PeepholeOptimizer:
+    """Rewrite Bytecode.code in place
+    
+    Cleanups: PUSH/POP pairs, jump-to-jump threading, jumps to the next
+    instruction and code after JMP/HALT that nothing jumps to. Then common
+    sequences are fused into superinstructions (see Opcode.LOAD_VAR2 and
+    below). Function entry points are kept as jump targets.
+    """
+    
+    def __init__(self, bytecode: Bytecode):
+        self.bytecode = bytecode
+        self.instructions: List[Instruction] = []
+        self.entries: Dict[str, Instruction] = {}
+    
+    def run(self) -> bool:
+        """Optimize; False (and no change) if some jump target is not an instruction"""
+        if not self.decode():
+            return False
+        for _ in range(MAX_PASSES):
+            changed = self.thread_jumps()
+            changed = self.remove_unreachable() or changed
+            changed = self.remove_useless() or changed
+            self.compact()
+            if not changed:
+                break
+        self.fuse()
+        self.compact()
+        self.encode()
+        return True
+    
+    def decode(self) -> bool:
+        by_offset: Dict[int, Instruction] = {}
+        jumps = []
+        switches = []
+        external_calls = self.bytecode.external_calls
+        positions = self.bytecode.positions
+        next_position = 0
+        position = None
+        for offset, op, operands in iter_instructions(self.bytecode.code):
+            instruction = Instruction(op, list(operands))
+            while next_position < len(positions) and positions[next_position][0] <= offset:
+                position = positions[next_position][1:]
+                next_position += 1
+            instruction.position = position
+            if op in SWITCH_ENTRY_KINDS:
+                kinds = switch_kinds(op, operands)
+                switches.append((instruction, [value for kind, value in zip(kinds, operands)
+                                               if kind == 'j']))
+            elif op in JUMP_OPCODES:
+                target = instruction.args.pop()
+                instruction.symbol = external_calls.get(offset + 1 + 4 * len(instruction.args))
+                if instruction.symbol is None:
+                    jumps.append((instruction, target))
+            by_offset[offset] = instruction
+            self.instructions.append(instruction)
+        
+        end = len(self.bytecode.code)
+        for instruction, offset in jumps:
+            instruction.target = by_offset.get(offset)
+            if instruction.target is None and offset != end:
+                return False
+        for instruction, offsets in switches:
+            instruction.table = [by_offset.get(offset) for offset in offsets]
+            if any(target is None and offset != end
+                   for target, offset in zip(instruction.table, offsets)):
+                return False
+        for name, offset in self.bytecode.functions.items():
+            if offset not in by_offset:
+                return False
+            self.entries[name] = by_offset[offset]
+        return True
+    
+    def targeted(self) -> Set[int]:
+        """ids of instructions that are jumped to or are function entries"""
+        targets = {id(instruction.target) for instruction in self.instructions
+                   if instruction.target is not None}
+        for instruction in self.instructions:
+            if instruction.table is not None:
+                targets.update(id(target) for target in instruction.table if target is not None)
+        targets.update(id(entry) for entry in self.entries.values())
+        return targets
+    
+    def thread_jumps(self) -> bool:
+        """Point jumps that land on a JMP at that JMP's final destination"""
+        def destination(jump: Instruction, target: Optional[Instruction]) -> Optional[Instruction]:
+            seen = {id(jump)}
+            while target is not None and target.op == Opcode.JMP and id(target) not in seen:
+                seen.add(id(target))
+                target = target.target
+            return target
+        
+        changed = False
+        for instruction in self.instructions:
+            if instruction.table is not None:
+                table = [destination(instruction, target) for target in instruction.table]
+                if any(new is not old for new, old in zip(table, instruction.table)):
+                    instruction.table = table
+                    changed = True
+            target = instruction.target
+            if target is None:
+                continue
+            target = destination(instruction, target)
+            if target is not instruction.target:
+                instruction.target = target
+                changed = True
+        return changed
+    
+    def remove_unreachable(self) -> bool:
+        """Drop instructions after JMP/HALT/switches up to the next jump target"""
+        targeted = self.targeted()
+        changed = False
+        dead = False
+        for instruction in self.instructions:
+            if dead and id(instruction) not in targeted:
+                instruction.live = False
+                changed = True
+                continue
+            dead = instruction.op in _NO_FALLTHROUGH
+        return changed
+    
+    def remove_useless(self) -> bool:
+        """Drop jumps to the next instruction and value pushes that are popped right away"""
+        targeted = self.targeted()
+        instructions = self.instructions
+        changed = False
+        for index, instruction in enumerate(instructions):
+            if not instruction.live:
+                continue
+            following = instructions[index + 1] if index + 1 < len(instructions) else None
+            op = instruction.op
+            if instruction.target is not None and instruction.target is following:
+                if op == Opcode.JMP:
+                    instruction.live = False
+                    changed = True
+                elif op in (Opcode.JMP_IF, Opcode.JMP_IFNOT):
+                    # Both ways continue here; only the condition is consumed
+                    instruction.op = Opcode.POP
+                    instruction.target = None
+                    changed = True
+            elif (op in _PURE_PUSHES and following is not None and following.live and
+                    following.op == Opcode.POP and id(following) not in targeted):
+                instruction.live = False
+                following.live = False
+                changed = True
+        return changed
+    
+    def fuse(self):
+        """Replace common sequences with superinstructions"""
+        targeted = self.targeted()
+        instructions = self.instructions
+        count = len(instructions)
+        index = 0
+        while index < count:
+            first = instructions[index]
+            # Later instructions of a fused sequence must not be jump targets
+            window = [first]
+            for following in instructions[index + 1:index + 4]:
+                if id(following) in targeted:
+                    break
+                window.append(following)
+            # Superinstructions are generic, so typed operators fuse like the generic ones
+            ops = [GENERIC_OPCODES.get(instruction.op, instruction.op) for instruction in window]
+            length = self.fuse_window(first, window, ops)
+            for instruction in window[1:length]:
+                instruction.live = False
+            index += max(length, 1)
+    
+    @staticmethod
+    def fuse_window(first: Instruction, window: List[Instruction], ops: List[int]) -> int:
+        """Fuse a prefix of window into first; returns the number of instructions consumed"""
+        if len(ops) >= 2 and ops[0] == Opcode.LOAD_VAR:
+            var = first.args[0]
+            if ops[1] == Opcode.PUSH:
+                const = window[1].args[0]
+                if ops[2:4] == [Opcode.ADD, Opcode.STORE_VAR] and window[3].args[0] == var:
+                    first.op, first.args = Opcode.INC_VAR, [var, const]
+                    return 4
+                if len(ops) == 4 and ops[2] in COMPARE_BRANCHES and ops[3] == Opcode.JMP_IFNOT:
+                    first.op, first.args = COMPARE_BRANCHES[ops[2]], [var, const]
+                    first.target = window[3].target
+                    return 4
+                if ops[2:3] == [Opcode.ADD]:
+                    first.op, first.args = Opcode.ADD_VAR_CONST, [var, const]
+                    return 3
+            elif ops[1] == Opcode.LOAD_VAR:
+                other = window[1].args[0]
+                if ops[2:3] == [Opcode.ADD]:
+                    first.op, first.args = Opcode.ADD_VARS, [var, other]
+                    return 3
+                first.op, first.args = Opcode.LOAD_VAR2, [var, other]
+                return 2
+        elif ops[:2] == [Opcode.PUSH, Opcode.STORE_VAR]:
+            first.op, first.args = Opcode.STORE_CONST, [window[1].args[0], first.args[0]]
+            return 2
+        return 1
+    
+    def compact(self):
+        """Drop removed instructions, moving their jump targets to the next live one"""
+        following = None
+        for instruction in reversed(self.instructions):
+            if instruction.live:
+                following = instruction
+            else:
+                instruction.forward = following
+        
+        def resolve(target: Optional[Instruction]) -> Optional[Instruction]:
+            while target is not None and not target.live:
+                target = target.forward
+            return target
+        
+        self.instructions = [instruction for instruction in self.instructions if instruction.live]
+        for instruction in self.instructions:
+            if instruction.target is not None:
+                instruction.target = resolve(instruction.target)
+            if instruction.table is not None:
+                instruction.table = [resolve(target) for target in instruction.table]
+        for name, entry in self.entries.items():
+            self.entries[name] = resolve(entry)
+    
+    def encode(self):
+        """Lay the instructions out again and write bytecode.code and the function table"""
+        offsets: Dict[int, int] = {}
+        end = 0
+        for instruction in self.instructions:
+            offsets[id(instruction)] = end
+            if instruction.table is not None:
+                end += 1 + 4 * len(instruction.args)
+            else:
+                end += 1 + 4 * OPERAND_COUNTS.get(instruction.op, 0)
+        
+        output = Bytecode()
+        for instruction in self.instructions:
+            if instruction.position is not None:
+                output.mark(*instruction.position)
+            args = instruction.args
+            if instruction.symbol is not None:
+                output.emit(instruction.op, *args, 0)
+                output.external_calls[len(output.code) - 4] = instruction.symbol
+                continue
+            if instruction.table is not None:
+                targets = iter([offsets[id(target)] if target is not None else end
+                                for target in instruction.table])
+                kinds = switch_kinds(instruction.op, args)
+                args = [next(targets) if kind == 'j' else value for kind, value in zip(kinds, args)]
+            if instruction.op in JUMP_OPCODES:
+                target = instruction.target
+                args = args + [offsets[id(target)] if target is not None else end]
+            output.emit(instruction.op, *args)
+        
+        self.bytecode.code[:] = output.code
+        self.bytecode.external_calls = output.external_calls
+        self.bytecode.positions = output.positions
+        for name, entry in self.entries.items():
+            self.bytecode.functions[name] = offsets[id(entry)] if entry is not None else end
+
+def optimize_bytecode(bytecode: Bytecode) -> bool:
+    """Run the peephole optimizer over bytecode in place"""
+    return PeepholeOptimizer(bytecode).run()
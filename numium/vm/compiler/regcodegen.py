@@ -0,0 +1,548 @@
+"""
+Numium Register Code Generator - Emit three-address register bytecode from the IR
+Sinh bytecode cho máy thanh ghi (numiac --target=reg)
+
+Every variable lives in its own register (0 .. len(variables) - 1), so
+`env x << a + b` is the single instruction `ADD x, a, b` where the stack
+form needs LOAD_VAR, LOAD_VAR, ADD, STORE_VAR. Constants are read in place
+through RK operands. Inner subexpressions go to temporaries, allocated
+last-in first-out per module above the variables and the module's
+locals (ir.function_locals). A module's locals and temporaries form its
+window; relocate_frames() then moves each window above the windows of
+every module that can be active when it is called, so a CALL saves
+nothing, and modules never active together share registers. A module
+whose window is live across a call to itself is rejected.
+A condition that compares two operands is a single JMP_IFNOT_<cmp>, and
+a switch that cannot use a table tests each case with one JMP_IFNOT_NE.
+"""
+
+import struct
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+try:
+    from .bytecode import Bytecode
+    from .lexer import SourceError
+    from .opcodes import (Opcode, RegOpcode, REG_OPCODE_NAMES, REG_OPERAND_KINDS, RK_CONSTANT,
+                          GENERIC_OPCODES, REG_SWITCH_ENTRY_KINDS, switch_kinds)
+    from .ir import (Node, Const, Var, Unary, Binary, EnvDecl, Call, ExprStmt, If, While, For,
+                     Switch, Try, Return, Stop, Continue, Pass, Halt, Function, Import, Init,
+                     ClassDef, Program, function_locals, postorder, walk)
+    from .linker import BUILTIN_LIBRARIES
+    from .codegen import plan_switch
+    from . import numbc
+except ImportError:  # run as a script from vm/compiler
+    from bytecode import Bytecode
+    from lexer import SourceError
+    from opcodes import (Opcode, RegOpcode, REG_OPCODE_NAMES, REG_OPERAND_KINDS, RK_CONSTANT,
+                         GENERIC_OPCODES, REG_SWITCH_ENTRY_KINDS, switch_kinds)
+    from ir import (Node, Const, Var, Unary, Binary, EnvDecl, Call, ExprStmt, If, While, For,
+                    Switch, Try, Return, Stop, Continue, Pass, Halt, Function, Import, Init,
+                    ClassDef, Program, function_locals, postorder, walk)
+    from linker import BUILTIN_LIBRARIES
+    from codegen import plan_switch
+    import numbc
+
+_WIDTHS = {'r': 'H', 'x': 'H', 'k': 'I', 'j': 'I', 'n': 'I'}
+
+# Register opcode -> instruction layout: opcode byte, then its operands
+REG_LAYOUTS = {opcode: struct.Struct('<B' + ''.join(_WIDTHS[kind] for kind in kinds))
+               for opcode, kinds in REG_OPERAND_KINDS.items()}
+_NO_OPERANDS = struct.Struct('<B')
+
+# Largest register number an RK operand can name
+MAX_REGISTERS = RK_CONSTANT
+
+# Stack comparison opcode (as found in Binary.op) -> fused register branch
+_COMPARE_BRANCHES = {
+    Opcode.EQ: RegOpcode.JMP_IFNOT_EQ, Opcode.NE: RegOpcode.JMP_IFNOT_NE,
+    Opcode.LT: RegOpcode.JMP_IFNOT_LT, Opcode.LE: RegOpcode.JMP_IFNOT_LE,
+    Opcode.GT: RegOpcode.JMP_IFNOT_GT, Opcode.GE: RegOpcode.JMP_IFNOT_GE,
+}
+_COMPARE_BRANCHES.update((typed, _COMPARE_BRANCHES[generic]) for typed, generic in GENERIC_OPCODES.items()
+                         if generic in _COMPARE_BRANCHES)
+
+def iter_register_instructions(code: bytes) -> Iterator[Tuple[int, int, Tuple[int, ...]]]:
+    """Yield (offset, opcode, operands) for each instruction of register code"""
+    layouts = REG_LAYOUTS
+    switches = REG_SWITCH_ENTRY_KINDS
+    pc = 0
+    end = len(code)
+    while pc < end:
+        opcode = code[pc]
+        layout = layouts.get(opcode, _NO_OPERANDS)
+        operands = layout.unpack_from(code, pc)[1:]
+        size = layout.size
+        if opcode in switches:  # Table entries are 4 bytes each
+            length = len(switch_kinds(opcode, operands, REG_OPERAND_KINDS, switches)) - len(operands)
+            operands += struct.unpack_from(f'<{length}I', code, pc + size)
+            size += 4 * length
+        yield pc, opcode, operands
+        pc += size
+
+def format_operand(kind: str, value: int) -> str:
+    if kind == 'x' and value & RK_CONSTANT:
+        return f"k{value & ~RK_CONSTANT}"
+    if kind in 'rx':
+        return f"r{value}"
+    if kind == 'k':
+        return f"k{value}"
+    if kind == 'n':
+        return str(value)
+    return f"0x{value:04X}"
+
+def disassemble(code: bytes) -> Iterator[str]:
+    """Yield one `0xOFFSET: NAME operands` line per instruction"""
+    for offset, opcode, operands in iter_register_instructions(code):
+        name = REG_OPCODE_NAMES.get(opcode, f"UNKNOWN({opcode:02X})")
+        kinds = REG_OPERAND_KINDS.get(opcode, '')
+        if opcode in REG_SWITCH_ENTRY_KINDS:
+            kinds = switch_kinds(opcode, operands, REG_OPERAND_KINDS, REG_SWITCH_ENTRY_KINDS)
+        text = ', '.join(format_operand(kind, value) for kind, value in zip(kinds, operands))
+        yield f"0x{offset:04X}: {name:12} {text}".rstrip()
+
+def module_calls(program: Program) -> Dict[str, Set[str]]:
+    """Module -> names it calls; '' is the top-level code, `area` bodies included"""
+    calls: Dict[str, Set[str]] = {'': set()}
+    for statement in program.body:
+        if type(statement) is Function and statement.kind == 'module':
+            calls[statement.name] = {node.name for node in walk(statement.body) if type(node) is Call}
+        else:
+            calls[''].update(node.name for node in walk([statement]) if type(node) is Call)
+    return calls
+
+def recursive_modules(program: Program, scopes: Dict[str, Dict[str, int]]) -> List[str]:
+    """Modules with locals that can reach a CALL to themselves"""
+    calls = module_calls(program)
+    recursive = []
+    for name, callees in calls.items():
+        if not name or not scopes.get(name):
+            continue
+        seen = set()
+        pending = list(callees)
+        while pending:
+            callee = pending.pop()
+            if callee == name:
+                recursive.append(name)
+                break
+            if callee not in seen:
+                seen.add(callee)
+                pending.extend(calls.get(callee, ()))
+    return recursive
+
+def frame_bases(calls: Dict[str, Set[str]], frames: Dict[str, int]) -> Dict[str, int]:
+    """Module -> offset of its window: above the window of every caller, transitively
+    
+    Raises ValueError when a cycle of calls passes through a non-empty
+    window, since that window would be overwritten while still in use.
+    """
+    bases = dict.fromkeys(calls, 0)
+    for _ in range(len(calls) + 1):
+        changed = False
+        for caller, callees in calls.items():
+            top = bases[caller] + frames.get(caller, 0)
+            for callee in callees:
+                if callee in bases and bases[callee] < top:
+                    bases[callee] = top
+                    changed = True
+        if not changed:
+            return bases
+    name = max((name for name in calls if name), key=bases.get)
+    raise ValueError(f"Module '{name}' may call itself while its registers are in use; "
+                     f"--target=reg has no call frames, use --target=stack")
+
+def relocate_frames(bytecode: 'RegisterBytecode', first_temporary: int, bases: Dict[str, int]):
+    """Add each module's window offset to the local and temporary registers in its code"""
+    entries = sorted((offset, name) for name, offset in bytecode.functions.items() if name in bases)
+    if not any(bases[name] for _, name in entries):
+        return
+    ends = [offset for offset, _ in entries[1:]] + [len(bytecode.code)]
+    code = bytecode.code
+    register = struct.Struct('<H')
+    widths = RegisterBytecode.OPERAND_WIDTHS
+    for (start, name), end in zip(entries, ends):
+        base = bases[name]
+        if not base:
+            continue
+        for offset, opcode, operands in iter_register_instructions(code[start:end]):
+            at = start + offset + 1
+            for kind in REG_OPERAND_KINDS.get(opcode, ''):  # Switch tables hold no registers
+                if kind in 'rx':
+                    value = register.unpack_from(code, at)[0]
+                    if first_temporary <= value < RK_CONSTANT:
+                        register.pack_into(code, at, value + base)
+                at += widths[kind]
+
+class RegisterBytecode(Bytecode):
+    """Register-machine bytecode: variables are registers 0 .. len(variables) - 1"""
+    
+    FLAGS = numbc.FLAG_REGISTER
+    OPERAND_KINDS = REG_OPERAND_KINDS
+    SWITCH_ENTRY_KINDS = REG_SWITCH_ENTRY_KINDS
+    OPERAND_WIDTHS = {kind: struct.calcsize(width) for kind, width in _WIDTHS.items()}
+    
+    def __init__(self):
+        super().__init__()
+        self.register_count = 0
+        self.frames: Dict[str, int] = {}  # Module -> locals and temporaries it uses
+    
+    def emit(self, opcode: int, *args: int):
+        """Emit an opcode instruction; missing operands (a jump's target) are 0"""
+        count = len(REG_OPERAND_KINDS.get(opcode, ''))
+        if len(args) != count:
+            if opcode in REG_SWITCH_ENTRY_KINDS:  # 4-byte table entries follow
+                self.code += REG_LAYOUTS[opcode].pack(opcode, *args[:count])
+                self.code += struct.pack(f'<{len(args) - count}I', *args[count:])
+                return
+            args = (args + (0,) * count)[:count]
+        self.code += REG_LAYOUTS.get(opcode, _NO_OPERANDS).pack(opcode, *args)
+    
+    def instruction_count(self) -> int:
+        return sum(1 for _ in iter_register_instructions(self.code))
+    
+    def to_bytes(self) -> bytes:
+        """A .numbc v2 file flagged as register bytecode"""
+        return numbc.encode(self.code, self.constants, self.variables, self.functions,
+                            register_count=self.register_count, positions=self.positions)
+    
+    @classmethod
+    def from_image(cls, image: numbc.NumbcImage, name: str = 'data') -> 'RegisterBytecode':
+        bytecode = super().from_image(image, name)
+        bytecode.register_count = image.register_count()
+        return bytecode
+
+class RegisterGenerator:
+    """Walk a Program and emit register bytecode; the layout follows CodeGenerator"""
+    
+    def __init__(self):
+        self.bytecode = RegisterBytecode()
+        self.function_labels: Dict[str, int] = {}
+        self.first_temporary = 0  # First register above the variables
+        self.temporaries = 0  # First temporary of the module being emitted
+        self.top = 0  # Next free temporary
+        self.high_water = 0
+        self.scopes: Dict[str, Dict[str, int]] = {}
+        self.locals: Dict[str, int] = {}  # Local name -> register
+        self.loops: List[Tuple[int, int]] = []  # (continue label, stop label), innermost last
+    
+    def generate(self, program: Program) -> RegisterBytecode:
+        bytecode = self.bytecode
+        # Variables first, so temporaries can be numbered above them
+        self.scopes = function_locals(program)
+        for top_level in program.body:
+            local_names = self.scopes.get(top_level.name, {}) if type(top_level) is Function else {}
+            for statement in walk([top_level]):
+                if type(statement) is EnvDecl and statement.name not in local_names:
+                    bytecode.add_variable(statement.name)
+                elif type(statement) is For and statement.var not in local_names:
+                    bytecode.add_variable(statement.var)
+                elif type(statement) is Import and statement.name not in BUILTIN_LIBRARIES:
+                    raise ValueError(f"Cannot import '{statement.name}' with --target=reg; "
+                                     f"linking is only supported for stack bytecode")
+                elif type(statement) is Function:
+                    self.function_labels[statement.name] = bytecode.new_label()
+                for expr in statement.expressions():
+                    for node in postorder(expr):
+                        if type(node) is Var and node.name not in local_names:
+                            bytecode.add_variable(node.name)
+        self.first_temporary = len(bytecode.variables)
+        recursive = recursive_modules(program, self.scopes)
+        if recursive:
+            raise ValueError(f"Module '{recursive[0]}' has locals and may call itself; "
+                             f"--target=reg has no call frames, use --target=stack")
+        
+        self.begin_frame({})
+        self.gen_block(program.body)
+        self.end_frame('')
+        for statement in program.body:
+            if type(statement) is Function and statement.kind == 'module':
+                self.begin_frame(self.scopes[statement.name])
+                self.gen_function_body(statement)
+                self.end_frame(statement.name)
+        
+        bases = frame_bases(module_calls(program), bytecode.frames)
+        relocate_frames(bytecode, self.first_temporary, bases)
+        bytecode.register_count = self.first_temporary + max(
+            (bases.get(name, 0) + size for name, size in bytecode.frames.items()), default=0)
+        if bytecode.register_count > MAX_REGISTERS:
+            raise ValueError(f"Program needs {bytecode.register_count} registers; "
+                             f"--target=reg supports {MAX_REGISTERS}")
+        bytecode.resolve_labels()
+        return bytecode
+    
+    def begin_frame(self, local_slots: Dict[str, int]):
+        self.locals = {name: self.first_temporary + slot for name, slot in local_slots.items()}
+        self.temporaries = self.first_temporary + len(local_slots)
+        self.top = self.high_water = self.temporaries
+    
+    def end_frame(self, name: str):
+        self.bytecode.frames[name] = max(self.bytecode.frames.get(name, 0),
+                                         self.high_water - self.first_temporary)
+    
+    def gen_block(self, body: List[Node]):
+        handlers = self.STATEMENT_HANDLERS
+        mark = self.bytecode.mark
+        for statement in body:
+            mark(statement.line, statement.column)
+            handlers[type(statement)](self, statement)
+    
+    # Registers and operands
+    
+    def allocate(self) -> int:
+        register = self.top
+        self.top += 1
+        if self.top > self.high_water:
+            self.high_water = self.top
+        return register
+    
+    def release(self, operand: int):
+        """Free operand if it is a temporary; temporaries are freed in reverse order"""
+        if self.temporaries <= operand < RK_CONSTANT:
+            self.top = operand
+    
+    def constant_operand(self, value) -> int:
+        index = self.bytecode.add_constant(value)
+        if index < RK_CONSTANT:
+            return index | RK_CONSTANT
+        register = self.allocate()
+        self.bytecode.emit(RegOpcode.LOADK, register, index)
+        return register
+    
+    def gen_operand(self, expr: Node, dest: Optional[int] = None) -> int:
+        """Evaluate expr and return an RK operand holding it
+        
+        Variables and constants cost no instruction. With dest, the value
+        ends up in register dest and dest is returned.
+        """
+        emit = self.bytecode.emit
+        variables = self.bytecode.variables
+        local_registers = self.locals
+        operands: List[int] = []
+        for node in postorder(expr):
+            kind = type(node)
+            if kind is Const:
+                operands.append(self.constant_operand(node.value))
+            elif kind is Var:
+                register = local_registers.get(node.name)
+                operands.append(variables[node.name] if register is None else register)
+            elif kind is Binary:
+                right = operands.pop()
+                left = operands.pop()
+                self.release(right)
+                self.release(left)
+                target = dest if node is expr and dest is not None else self.allocate()
+                emit(node.op, target, left, right)
+                operands.append(target)
+            else:
+                operand = operands.pop()
+                self.release(operand)
+                target = dest if node is expr and dest is not None else self.allocate()
+                emit(node.op, target, operand)
+                operands.append(target)
+        
+        operand = operands.pop()
+        if dest is None or operand == dest:
+            return operand
+        self.release(operand)
+        emit(RegOpcode.MOVE, dest, operand)
+        return dest
+    
+    def gen_branch_unless(self, cond: Node, label: int):
+        """Jump to label unless cond holds"""
+        bytecode = self.bytecode
+        kind = type(cond)
+        if kind is Binary and cond.op in _COMPARE_BRANCHES:
+            left = self.gen_operand(cond.left)
+            right = self.gen_operand(cond.right)
+            bytecode.emit_jump(_COMPARE_BRANCHES[cond.op], label, left, right)
+            self.release(right)
+            self.release(left)
+        elif kind is Unary and cond.op == Opcode.NOT_OP:
+            operand = self.gen_operand(cond.operand)
+            bytecode.emit_jump(RegOpcode.JMP_IF, label, operand)
+            self.release(operand)
+        else:
+            operand = self.gen_operand(cond)
+            bytecode.emit_jump(RegOpcode.JMP_IFNOT, label, operand)
+            self.release(operand)
+    
+    def gen_discarded(self, expr: Node) -> int:
+        """Evaluate expr for its errors only; returns its operand, already released"""
+        operand = self.gen_operand(expr)
+        self.release(operand)
+        return operand
+    
+    # Statements
+    
+    def gen_env(self, node: EnvDecl):
+        register = self.locals.get(node.name)
+        if register is None:
+            register = self.bytecode.variables[node.name]
+        self.gen_operand(node.value, register)
+    
+    def gen_call(self, node: Call):
+        bytecode = self.bytecode
+        if node.name == 'output':
+            # Like the stack form, the last argument is printed
+            operands = [self.gen_operand(arg) for arg in node.args]
+            last = operands[-1] if operands else self.constant_operand(None)
+            bytecode.emit(RegOpcode.OUTPUT, last)
+            for operand in reversed(operands):
+                self.release(operand)
+            return
+        
+        for arg in node.args:
+            self.gen_discarded(arg)
+        if node.name == 'input':
+            bytecode.emit(RegOpcode.INPUT, self.allocate())
+            self.top -= 1
+        elif node.name in self.function_labels:
+            bytecode.emit_jump(RegOpcode.CALL, self.function_labels[node.name])
+        else:
+            raise SourceError(f"Call to undefined module '{node.name}'", node.line, node.column)
+    
+    def gen_expr_stmt(self, node: ExprStmt):
+        self.gen_discarded(node.expr)
+    
+    def gen_if(self, node: If):
+        bytecode = self.bytecode
+        else_label = bytecode.new_label()
+        self.gen_branch_unless(node.cond, else_label)
+        self.gen_block(node.body)
+        
+        if node.orelse is not None:
+            end_label = bytecode.new_label()
+            bytecode.emit_jump(RegOpcode.JMP, end_label)
+            bytecode.bind_label(else_label)
+            self.gen_block(node.orelse)
+            bytecode.bind_label(end_label)
+        else:
+            bytecode.bind_label(else_label)
+    
+    def gen_while(self, node: While):
+        bytecode = self.bytecode
+        loop_label = bytecode.new_label()
+        end_label = bytecode.new_label()
+        bytecode.bind_label(loop_label)
+        self.gen_branch_unless(node.cond, end_label)
+        self.loops.append((loop_label, end_label))
+        self.gen_block(node.body)
+        self.loops.pop()
+        bytecode.mark(node.line, node.column)  # The loop's own step and jump back
+        bytecode.emit_jump(RegOpcode.JMP, loop_label)
+        bytecode.bind_label(end_label)
+    
+    def gen_for(self, node: For):
+        """The count stays in a temporary (or is a constant) for the whole loop"""
+        bytecode = self.bytecode
+        counter = self.locals.get(node.var)
+        if counter is None:
+            counter = bytecode.variables[node.var]
+        limit = self.gen_operand(node.count)
+        if limit < self.temporaries:  # A variable the body may change
+            limit = self.gen_operand(node.count, self.allocate())
+        
+        body_label = bytecode.new_label()
+        next_label = bytecode.new_label()
+        end_label = bytecode.new_label()
+        bytecode.emit_jump(RegOpcode.FOR_RANGE_INIT, end_label, counter, limit)
+        bytecode.bind_label(body_label)
+        self.loops.append((next_label, end_label))
+        self.gen_block(node.body)
+        self.loops.pop()
+        bytecode.mark(node.line, node.column)  # The loop's own step and jump back
+        bytecode.bind_label(next_label)
+        bytecode.emit_jump(RegOpcode.FOR_RANGE_NEXT, body_label, counter, limit)
+        bytecode.bind_label(end_label)
+        self.release(limit)
+    
+    def gen_stop(self, node: Stop):
+        self.bytecode.emit_jump(RegOpcode.JMP, self.loop_labels(node, 'stop')[1])
+    
+    def gen_continue(self, node: Continue):
+        self.bytecode.emit_jump(RegOpcode.JMP, self.loop_labels(node, 'continue')[0])
+    
+    def loop_labels(self, node: Node, keyword: str) -> Tuple[int, int]:
+        if not self.loops:
+            raise SourceError(f"'{keyword}' outside a loop", node.line, node.column)
+        return self.loops[-1]
+    
+    def gen_switch(self, node: Switch):
+        """Same layout as the stack form; the subject is an RK operand"""
+        bytecode = self.bytecode
+        arms = [bytecode.new_label() for _ in node.cases]
+        default_label = bytecode.new_label()
+        end_label = bytecode.new_label()
+        opcode, keys = plan_switch(node)
+        subject = self.gen_operand(node.subject)
+        
+        if opcode == Opcode.TABLESWITCH:
+            low = keys[0][0]
+            targets = [default_label] * (keys[-1][0] - low + 1)
+            for value, arm in keys:
+                targets[value - low] = arms[arm]
+            bytecode.emit_switch(RegOpcode.TABLESWITCH, subject, bytecode.add_constant(low),
+                                 len(targets), default_label, *targets)
+        elif opcode == Opcode.LOOKUPSWITCH:
+            table = []
+            for value, arm in keys:
+                table += (bytecode.add_constant(value), arms[arm])
+            bytecode.emit_switch(RegOpcode.LOOKUPSWITCH, subject, len(keys), default_label, *table)
+        else:
+            for value, arm in keys:
+                # Jump unless subject != value: to the arm when they are equal
+                key = self.constant_operand(value)
+                bytecode.emit_jump(RegOpcode.JMP_IFNOT_NE, arms[arm], subject, key)
+                self.release(key)
+        self.release(subject)
+        
+        bytecode.bind_label(default_label)
+        self.gen_block(node.default or [])
+        for label, (_, body) in zip(arms, node.cases):
+            bytecode.emit_jump(RegOpcode.JMP, end_label)
+            bytecode.bind_label(label)
+            self.gen_block(body)
+        bytecode.bind_label(end_label)
+    
+    def gen_try(self, node: Try):
+        self.gen_block(node.body)
+        self.gen_block(node.handler)
+    
+    def gen_return(self, node: Return):
+        if node.value is not None:
+            self.gen_discarded(node.value)
+        self.bytecode.emit(RegOpcode.RET)
+    
+    def gen_halt(self, node: Halt):
+        self.bytecode.emit(RegOpcode.HALT)
+    
+    def gen_function(self, node: Function):
+        if node.kind != 'module':  # Modules are emitted after the top-level code
+            self.gen_function_body(node)
+    
+    def gen_function_body(self, node: Function):
+        self.bytecode.bind_label(self.function_labels[node.name])
+        self.bytecode.functions[node.name] = len(self.bytecode.code)
+        self.gen_block(node.body)
+    
+    def gen_nothing(self, node: Node):
+        pass
+    
+    # IR node type -> emit method
+    STATEMENT_HANDLERS = {
+        EnvDecl: gen_env,
+        Call: gen_call,
+        ExprStmt: gen_expr_stmt,
+        If: gen_if,
+        While: gen_while,
+        For: gen_for,
+        Switch: gen_switch,
+        Try: gen_try,
+        Return: gen_return,
+        Stop: gen_stop,
+        Continue: gen_continue,
+        Pass: gen_nothing,
+        Halt: gen_halt,
+        Function: gen_function,
+        Import: gen_nothing,
+        Init: gen_nothing,
+        ClassDef: gen_nothing,
+    }
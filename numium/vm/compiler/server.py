@@ -0,0 +1,181 @@
+"""
+Numium Compile Server - A warm numiac process on a Unix socket (numiac --serve)
+Tiến trình biên dịch thường trú: nhận yêu cầu qua Unix socket, tự khởi động lại khi mã trình biên dịch thay đổi
+
+The server imports the compiler once, then forks a child per request, so
+requests run concurrently and each gets its own working directory,
+environment and captured stdout/stderr. The child runs numiac's main()
+with the client's arguments and replies with the exit status and output
+(see client.py for the protocol).
+
+Before each request, and every half second when idle, the server checks
+the modification times of the compiler's modules. When one changed it
+waits for running requests, then re-executes itself; the listening socket
+and the waiting connection are inherited by the new process, so no client
+sees a refused connection or a stale compiler.
+"""
+
+import contextlib
+import io
+import os
+import signal
+import socket
+import socketserver
+import sys
+import traceback
+from typing import Any, Dict, List, Optional, Tuple
+try:
+    from .client import default_socket, read_message, send_message
+except ImportError:  # run as a script from vm/compiler
+    from client import default_socket, read_message, send_message
+
+# Inherited descriptors across a restart: the listening socket, and the
+# connection whose request found the compiler changed
+LISTEN_FD_VARIABLE = 'NUMIAC_SERVER_FD'
+PENDING_FD_VARIABLE = 'NUMIAC_PENDING_FD'
+
+COMPILER_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+def compiler_stamp() -> Tuple[Tuple[str, int, int], ...]:
+    """(name, mtime, size) of every compiler module; cheap enough to check per request"""
+    stamp = []
+    for entry in os.scandir(COMPILER_DIRECTORY):
+        if entry.name.endswith('.py'):
+            info = entry.stat()
+            stamp.append((entry.name, info.st_mtime_ns, info.st_size))
+    return tuple(sorted(stamp))
+
+def run_numiac(argv: List[str]) -> Tuple[int, str, str]:
+    """numiac main(argv) with its output captured: (status, stdout, stderr)"""
+    try:
+        from .numiac import main as numiac_main
+    except ImportError:
+        from numiac import main as numiac_main
+    out, err = io.StringIO(), io.StringIO()
+    with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+        try:
+            status = numiac_main(argv)
+        except SystemExit as e:  # argparse errors, --help, --version
+            status = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+            if isinstance(e.code, str):
+                print(e.code, file=sys.stderr)
+        except Exception:
+            traceback.print_exc()
+            status = 1
+    return status, out.getvalue(), err.getvalue()
+
+def handle(message: Dict[str, Any]) -> Dict[str, Any]:
+    """Run one compile request; called in the forked child"""
+    argv = message.get('argv')
+    if not isinstance(argv, list) or '--serve' in argv:
+        return {'status': 2, 'stdout': '', 'stderr': "numiac server: bad request\n"}
+    try:
+        os.chdir(message.get('cwd') or '/')
+    except OSError as e:
+        return {'status': 1, 'stdout': '', 'stderr': f"numiac server: {e}\n"}
+    os.environ.update(message.get('env') or {})
+    status, stdout, stderr = run_numiac([str(arg) for arg in argv])
+    return {'status': status, 'stdout': stdout, 'stderr': stderr}
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            message = read_message(self.rfile)
+        except ValueError:
+            message = None
+        if message is None:
+            return
+        if message.get('stop'):
+            send_message(self.connection, {'status': 0, 'stdout': '', 'stderr': ''})
+            os.kill(os.getppid(), signal.SIGTERM)
+            return
+        send_message(self.connection, handle(message))
+
+class CompileServer(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+    """Forks a child per connection; restarts itself when the compiler changes"""
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.stamp = compiler_stamp()
+        inherited = os.environ.pop(LISTEN_FD_VARIABLE, None)
+        pending = os.environ.pop(PENDING_FD_VARIABLE, None)
+        super().__init__(path, RequestHandler, bind_and_activate=inherited is None)
+        if inherited is not None:
+            self.socket.close()
+            self.socket = socket.socket(fileno=int(inherited))
+        else:
+            os.chmod(path, 0o600)  # Only this user may send compile requests
+        self.pending = socket.socket(fileno=int(pending)) if pending is not None else None
+    
+    def server_bind(self):
+        if os.path.exists(self.path):
+            if server_running(self.path):
+                raise OSError(f"A numiac server is already listening on {self.path}")
+            os.unlink(self.path)  # Left behind by a server that was killed
+        super().server_bind()
+    
+    def serve(self):
+        if self.pending is not None:  # The request that triggered the restart
+            connection, self.pending = self.pending, None
+            self.process_request(connection, self.path)
+        self.serve_forever(poll_interval=0.5)
+    
+    def stale(self) -> bool:
+        return compiler_stamp() != self.stamp
+    
+    def verify_request(self, request, client_address) -> bool:
+        if self.stale():
+            self.restart(request)
+        return True
+    
+    def service_actions(self):
+        super().service_actions()  # Reaps finished children
+        if self.stale():
+            self.restart()
+    
+    def restart(self, pending: Optional[socket.socket] = None):
+        """Wait for running requests, then exec a fresh server that inherits the sockets"""
+        print("numiac server: compiler changed, restarting", file=sys.stderr)
+        self.collect_children(blocking=True)
+        self.socket.set_inheritable(True)
+        os.environ[LISTEN_FD_VARIABLE] = str(self.socket.fileno())
+        if pending is not None:
+            pending.set_inheritable(True)
+            os.environ[PENDING_FD_VARIABLE] = str(pending.fileno())
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.execv(sys.executable, [sys.executable] + sys.argv)
+
+def server_running(path: Optional[str] = None) -> bool:
+    """True when something accepts connections on the socket"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(path or default_socket())
+        except OSError:
+            return False
+    return True
+
+def serve(path: Optional[str] = None) -> int:
+    """Run the server in the foreground until SIGTERM, SIGINT or a --stop request"""
+    path = path or default_socket()
+    restarted = LISTEN_FD_VARIABLE in os.environ
+    try:
+        server = CompileServer(path)
+    except OSError as e:
+        print(f"numiac server: {e}", file=sys.stderr)
+        return 1
+    
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, stop)
+    if not restarted:
+        print(f"numiac server listening on {path}", file=sys.stderr)
+    try:
+        server.serve()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(path)
+    return 0
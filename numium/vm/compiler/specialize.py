@@ -0,0 +1,111 @@
+"""
+Numium Type Specializer - Typed opcodes from static types
+Chọn opcode theo kiểu tĩnh từ khai báo env và kiểu hằng số
+
+type_table() gives each variable one static type: the type its
+`env x int = ...` declarations name, or else the common type of every
+value stored to it, found from literal types as in optimizer.infer_types.
+specialize() then rewrites each arithmetic or comparison Binary whose
+operands have the same known type to its typed opcode (ADD_INT, LT_FLOAT,
+...). The table is flow-insensitive and a variable holds null until its
+first store, so the typed opcodes check their operand types and fall back
+to the generic operation; the fast path is one check instead of the
+generic type dispatch.
+"""
+
+from typing import Callable, Dict, List, Optional, Tuple
+try:
+    from .opcodes import TYPED_OPCODES
+    from .lexer import SourceError
+    from .ir import Node, Const, Unary, Binary, EnvDecl, For, Program, postorder, scoped_walk
+    from .optimizer import (_UNSET, _COUNTER, VariableKey, binary_type, unary_type, expression_type,
+                            scope_keys, value_type)
+except ImportError:  # run as a script from vm/compiler
+    from opcodes import TYPED_OPCODES
+    from lexer import SourceError
+    from ir import Node, Const, Unary, Binary, EnvDecl, For, Program, postorder, scoped_walk
+    from optimizer import (_UNSET, _COUNTER, VariableKey, binary_type, unary_type, expression_type,
+                           scope_keys, value_type)
+
+# Declared types the VM has values for; other declarations only document
+DECLARED_TYPES = frozenset({'int', 'float', 'string', 'bool'})
+
+# Generic opcodes that have typed forms
+_SPECIALIZABLE = frozenset(generic for generic, _ in TYPED_OPCODES)
+
+def type_table(program: Program) -> Dict[VariableKey, Optional[str]]:
+    """Variable (optimizer.VariableKey) -> static type, None if it can hold values of different types
+    
+    Raises SyntaxError when a declaration is given a value of another type.
+    An int literal declared float is stored as a float.
+    """
+    keys = scope_keys(program)
+    stores: List[Tuple[VariableKey, Node, Optional[str], Node, Callable[[str], VariableKey]]] = []
+    types: Dict[VariableKey, Optional[str]] = {}
+    for module, statement in scoped_walk(program):
+        kind = type(statement)
+        key = keys[module]
+        if kind is EnvDecl:
+            declared = statement.type_name if statement.type_name in DECLARED_TYPES else None
+            value = statement.value
+            if declared == 'float' and type(value) is Const and value_type(value.value) == 'int':
+                statement.value = Const(float(value.value))
+            stores.append((key(statement.name), statement.value, declared, statement, key))
+        elif kind is For:
+            stores.append((key(statement.var), _COUNTER, None, statement, key))
+    
+    changed = True
+    while changed:
+        changed = False
+        for name, value, declared, _, key in stores:
+            old = types.get(name, _UNSET)
+            if old is None:
+                continue
+            new = declared or expression_type(value, types, key)
+            if new == _UNSET or new == old:
+                continue
+            types[name] = new if old == _UNSET else None
+            changed = True
+    
+    for (_, name), value, declared, statement, key in stores:
+        if declared is None:
+            continue
+        actual = expression_type(value, types, key)
+        if actual is not None and actual != _UNSET and actual != declared:
+            raise SourceError(f"'{name}' is declared {declared} but assigned {actual}",
+                              statement.line, statement.column)
+    return {name: (None if kind == _UNSET else kind) for name, kind in types.items()}
+
+def specialize(program: Program, var_types: Dict[VariableKey, Optional[str]]) -> Tuple[int, int]:
+    """Rewrite Binary ops to typed opcodes in place
+    
+    Returns (specialized, candidates): how many arithmetic and comparison
+    operators got a typed opcode, out of all of them.
+    """
+    specialized = 0
+    candidates = 0
+    keys = scope_keys(program)
+    for module, statement in scoped_walk(program):
+        key = keys[module]
+        for expr in statement.expressions():
+            types = []
+            for node in postorder(expr):
+                kind = type(node)
+                if kind is Binary:
+                    right = types.pop()
+                    left = types.pop()
+                    op = node.op
+                    types.append(binary_type(op, left, right))
+                    if op in _SPECIALIZABLE:
+                        candidates += 1
+                        typed = TYPED_OPCODES.get((op, left)) if left == right else None
+                        if typed is not None:
+                            node.op = typed
+                            specialized += 1
+                elif kind is Unary:
+                    types.append(unary_type(node.op, types.pop()))
+                elif kind is Const:
+                    types.append(value_type(node.value))
+                else:
+                    types.append(var_types.get(key(node.name)))
+    return specialized, candidates
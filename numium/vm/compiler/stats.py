@@ -0,0 +1,114 @@
+"""
+Numium Compile Statistics - Phase timings and code size (numiac --stats)
+Thống kê biên dịch: thời gian từng pha, số lệnh theo opcode, kích thước hàm
+
+Every Compiler times its phases in a CompileStats: lex, parse, optimize
+(IR passes and typed opcodes), emit and peephole. compile_file adds read,
+link and write. code_stats() describes the finished bytecode. numiac
+--stats prints both per file, as text or as JSON for CI to compare runs.
+"""
+
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+try:
+    from .opcodes import OPCODE_NAMES, REG_OPCODE_NAMES
+    from .bytecode import Bytecode, iter_instructions
+    from .regcodegen import RegisterBytecode, iter_register_instructions
+    from . import numbc
+except ImportError:  # run as a script from vm/compiler
+    from opcodes import OPCODE_NAMES, REG_OPCODE_NAMES
+    from bytecode import Bytecode, iter_instructions
+    from regcodegen import RegisterBytecode, iter_register_instructions
+    import numbc
+
+# Name of the code before the first function entry
+TOP_LEVEL = '<top level>'
+
+class CompileStats:
+    """Wall time per phase, in the order phases first ran, plus counters"""
+    
+    def __init__(self):
+        self.phases: Dict[str, float] = {}  # Phase -> seconds
+        self.tokens = 0
+        self.peak_memory: Optional[int] = None  # Bytes, when traced (see numiac --stats)
+        self.failed: Optional[str] = None  # Phase that raised, if any
+    
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Time a block; a phase that runs again accumulates"""
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.failed = self.failed or name
+            raise
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+    
+    def total(self) -> float:
+        return sum(self.phases.values())
+
+def function_sizes(bytecode: Bytecode) -> Dict[str, int]:
+    """Bytes of code from each function entry to the next one (or the end)"""
+    entries = sorted((offset, name) for name, offset in bytecode.functions.items())
+    sizes: Dict[str, int] = {}
+    if not entries or entries[0][0] > 0:
+        sizes[TOP_LEVEL] = entries[0][0] if entries else len(bytecode.code)
+    ends = [offset for offset, _ in entries[1:]] + [len(bytecode.code)]
+    for (offset, name), end in zip(entries, ends):
+        sizes[name] = end - offset
+    return sizes
+
+def code_stats(bytecode: Bytecode) -> Dict[str, Any]:
+    """Instruction histogram by opcode name, function sizes and constant pool size"""
+    if isinstance(bytecode, RegisterBytecode):
+        instructions, names = iter_register_instructions(bytecode.code), REG_OPCODE_NAMES
+    else:
+        instructions, names = iter_instructions(bytecode.code), OPCODE_NAMES
+    histogram = Counter(names.get(opcode, f"0x{opcode:02X}") for _, opcode, _ in instructions)
+    
+    string_bytes = sum(len(value.encode('utf-8')) for value in bytecode.constants if type(value) is str)
+    return {
+        'code_bytes': len(bytecode.code),
+        'instructions': sum(histogram.values()),
+        'opcodes': dict(histogram.most_common()),
+        'functions': function_sizes(bytecode),
+        'constants': len(bytecode.constants),
+        'constant_bytes': numbc.CONSTANT.size * len(bytecode.constants) + string_bytes,
+        'variables': len(bytecode.variables),
+    }
+
+def stats_report(stats: CompileStats, bytecode: Optional[Bytecode]) -> Dict[str, Any]:
+    """JSON-ready report: phases in milliseconds, counters and code statistics"""
+    report: Dict[str, Any] = {
+        'phases_ms': {name: round(seconds * 1000, 3) for name, seconds in stats.phases.items()},
+        'total_ms': round(stats.total() * 1000, 3),
+        'tokens': stats.tokens,
+    }
+    if stats.peak_memory is not None:
+        report['peak_memory_bytes'] = stats.peak_memory
+    if bytecode is not None:
+        report.update(code_stats(bytecode))
+    return report
+
+def format_report(report: Dict[str, Any], top: int = 10) -> str:
+    """Human-readable form of stats_report()"""
+    lines = ["=== Compile Statistics ==="]
+    phases = ', '.join(f"{name} {ms:.2f}" for name, ms in report['phases_ms'].items())
+    lines.append(f"Phases (ms): {phases}; total {report['total_ms']:.2f}")
+    lines.append(f"Tokens: {report['tokens']}")
+    if 'peak_memory_bytes' in report:
+        lines.append(f"Peak memory: {report['peak_memory_bytes'] / 1024:.1f} KiB")
+    if 'code_bytes' in report:
+        lines.append(f"Code: {report['code_bytes']} bytes, {report['instructions']} instructions")
+        opcodes = list(report['opcodes'].items())
+        shown = ', '.join(f"{name} {count}" for name, count in opcodes[:top])
+        more = f", ... ({len(opcodes) - top} more)" if len(opcodes) > top else ''
+        lines.append(f"Opcodes: {shown}{more}")
+        lines.append("Functions (bytes): " +
+                     ', '.join(f"{name} {size}" for name, size in report['functions'].items()))
+        lines.append(f"Constants: {report['constants']} ({report['constant_bytes']} bytes), "
+                     f"variables: {report['variables']}")
+    return '\n'.join(lines)
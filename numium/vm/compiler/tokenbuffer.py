@@ -0,0 +1,193 @@
+"""
+Numium Token Buffer - Compact struct-of-arrays token store
+Lưu token dạng cột (array) thay vì List[Token]
+"""
+
+from array import array
+from sys import intern
+from typing import Dict, List, Optional
+try:
+    from .lexer import (Lexer, Token, TokenType, TokenKind, KEYWORD_KINDS, _TOKEN_PATTERN,
+                        _OPERATOR_TYPES, _ESCAPE_PATTERN, _unescape)
+except ImportError:  # run as a script from vm/compiler
+    from lexer import (Lexer, Token, TokenType, TokenKind, KEYWORD_KINDS, _TOKEN_PATTERN,
+                       _OPERATOR_TYPES, _ESCAPE_PATTERN, _unescape)
+
+# TokenType lookup by integer kind (every keyword kind maps to KEYWORD)
+_TYPES: List[Optional[TokenType]] = [None] * (max(KEYWORD_KINDS.values()) + 1)
+for _type in TokenType:
+    _TYPES[_type.value] = _type
+for _kind in KEYWORD_KINDS.values():
+    _TYPES[_kind] = TokenType.KEYWORD
+
+_IDENTIFIER = TokenKind.IDENTIFIER
+_NEWLINE = TokenKind.NEWLINE
+_INTEGER = TokenKind.INTEGER
+_FLOAT = TokenKind.FLOAT
+_HEX64 = TokenKind.HEX64
+_STRING = TokenKind.STRING
+_EOF = TokenKind.EOF
+_FIRST_KEYWORD = min(KEYWORD_KINDS.values())
+_OPERATOR_KINDS = {text: token_type.value for text, token_type in _OPERATOR_TYPES.items()}
+
+class TokenBuffer:
+    """Token stream stored as parallel arrays
+    
+    Each token costs one byte of kind (see TokenKind) plus four 32-bit columns (source
+    offset, length, line, column). Values are sliced from the source on
+    demand; only string literals with escapes (and tokens from the
+    reference tokenizer that are not plain slices) keep a decoded value.
+    Indexing returns a Token, so Compiler.peek/advance/expect work on a
+    TokenBuffer exactly as on a List[Token].
+    """
+    
+    def __init__(self, source: str):
+        self.source = source
+        self.kinds = array('B')
+        self.offsets = array('I')
+        self.lengths = array('I')
+        self.lines = array('I')
+        self.columns = array('I')
+        self.values: Dict[int, str] = {}
+        self._cached_index = -1
+        self._cached_token: Optional[Token] = None
+    
+    @classmethod
+    def from_source(cls, source: str) -> 'TokenBuffer':
+        """Tokenize source straight into a TokenBuffer"""
+        buffer = cls(source)
+        if not buffer._scan():
+            buffer = cls(source)
+            buffer.extend(Lexer(source).tokenize_chars())
+        return buffer
+    
+    def _scan(self) -> bool:
+        """Fill the columns with _TOKEN_PATTERN; False if it cannot cover the source"""
+        source = self.source
+        kinds = self.kinds.append
+        offsets = self.offsets.append
+        lengths = self.lengths.append
+        lines = self.lines.append
+        columns = self.columns.append
+        values = self.values
+        keyword_kinds = KEYWORD_KINDS
+        operators = _OPERATOR_KINDS
+        pos = 0
+        line = 1
+        line_start = 0
+        
+        for match in _TOKEN_PATTERN.finditer(source):
+            start = match.start()
+            if start != pos:
+                return False
+            pos = match.end()
+            kind = match.lastgroup
+            
+            if kind == 'ws' or kind == 'comment':
+                continue
+            
+            if kind == 'name':
+                kinds(keyword_kinds.get(match.group(), _IDENTIFIER))
+            elif kind == 'op':
+                kinds(operators[match.group()])
+            elif kind == 'newline':
+                kinds(_NEWLINE)
+            elif kind == 'number':
+                kinds(_FLOAT if '.' in match.group() else _INTEGER)
+            elif kind == 'hex':
+                kinds(_HEX64)
+            else:  # string: offset/length cover the text between the quotes
+                text = match.group()
+                if '\\' in text:
+                    values[len(self.offsets)] = _ESCAPE_PATTERN.sub(_unescape, text[1:-1])
+                kinds(_STRING)
+                offsets(start + 1)
+                lengths(pos - start - 2)
+                lines(line)
+                columns(start - line_start + 1)
+                newlines = text.count('\n')
+                if newlines:
+                    line += newlines
+                    line_start = start + text.rfind('\n') + 1
+                continue
+            
+            offsets(start)
+            lengths(pos - start)
+            lines(line)
+            columns(start - line_start + 1)
+            if kind == 'newline':
+                line += 1
+                line_start = pos
+        
+        if pos != len(source):
+            return False
+        
+        kinds(_EOF)
+        offsets(pos)
+        lengths(0)
+        lines(line)
+        columns(pos - line_start + 1)
+        return True
+    
+    def extend(self, tokens: List[Token]):
+        """Append Token objects, e.g. from Lexer.tokenize_chars()"""
+        source = self.source
+        line_starts = [0]
+        index = source.find('\n')
+        while index != -1:
+            line_starts.append(index + 1)
+            index = source.find('\n', index + 1)
+        
+        for token in tokens:
+            offset = line_starts[token.line - 1] + token.column - 1
+            value = token.value
+            self.kinds.append(token.kind)
+            self.offsets.append(offset)
+            self.lengths.append(len(value))
+            self.lines.append(token.line)
+            self.columns.append(token.column)
+            if token.type != TokenType.NEWLINE and source[offset:offset + len(value)] != value:
+                self.values[len(self.offsets) - 1] = value
+    
+    def __len__(self) -> int:
+        return len(self.kinds)
+    
+    def type_at(self, index: int) -> TokenType:
+        return _TYPES[self.kinds[index]]
+    
+    def kind_at(self, index: int) -> int:
+        return self.kinds[index]
+    
+    def value_at(self, index: int) -> str:
+        value = self.values.get(index)
+        if value is not None:
+            return value
+        kind = self.kinds[index]
+        if kind == _NEWLINE:
+            return '\\n'
+        offset = self.offsets[index]
+        value = self.source[offset:offset + self.lengths[index]]
+        return intern(value) if kind == _IDENTIFIER or kind >= _FIRST_KEYWORD else value
+    
+    def __getitem__(self, index: int) -> Token:
+        # The compiler peeks the same position several times before
+        # advancing, so keep the last materialized token
+        if index == self._cached_index:
+            return self._cached_token
+        if index < 0:
+            index += len(self.kinds)
+        kind = self.kinds[index]
+        token = Token(_TYPES[kind], self.value_at(index),
+                      self.lines[index], self.columns[index], kind)
+        self._cached_index = index
+        self._cached_token = token
+        return token
+    
+    def __iter__(self):
+        for index in range(len(self.kinds)):
+            yield self[index]
+    
+    def nbytes(self) -> int:
+        """Bytes held by the columns (excluding the source and decoded values)"""
+        return sum(column.itemsize * len(column) for column in
+                   (self.kinds, self.offsets, self.lengths, self.lines, self.columns))
@@ -0,0 +1,15 @@
+"""
+Numium Python VM - In-process bytecode interpreter
+Máy ảo Python chạy .numbc không cần runtime C
+"""
+
+from .interpreter import VM, VMError, load_bytecode, load_program, run_file, format_value
+
+__all__ = [
+    'VM',
+    'VMError',
+    'load_bytecode',
+    'load_program',
+    'run_file',
+    'format_value',
+]
@@ -0,0 +1,40 @@
+"""
+Numium Python VM command line: python3 -m vm.pyvm program.numbc
+Chạy .numbc (hoặc biên dịch .num trong bộ nhớ) bằng máy ảo Python
+"""
+
+import argparse
+import sys
+import time
+
+from ..compiler.compiler import CompileError
+from .interpreter import VMError, run_file
+
+def main():
+    parser = argparse.ArgumentParser(prog='python3 -m vm.pyvm',
+                                     description='Run Numium bytecode in the Python VM')
+    parser.add_argument('program', help='Bytecode file (.numbc) or source file (.num)')
+    parser.add_argument('-O', dest='opt_level', type=int, choices=(0, 1, 2), default=0,
+                        help='Optimization level when compiling a .num source (default 0)')
+    parser.add_argument('--target', choices=('stack', 'reg'), default='stack',
+                        help='Bytecode kind when compiling a .num source (default stack)')
+    parser.add_argument('--debug', action='store_true', help='Print run time and final globals')
+    args = parser.parse_args()
+    
+    start = time.perf_counter()
+    try:
+        vm = run_file(args.program, opt_level=args.opt_level, target=args.target)
+    except (OSError, ValueError, CompileError, VMError) as e:
+        sys.stdout.flush()
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    if args.debug:
+        sys.stdout.flush()
+        print(f"\n[pyvm] {time.perf_counter() - start:.3f} s, {len(vm.instructions)} instructions",
+              file=sys.stderr)
+        for name, value in vm.globals().items():
+            print(f"[pyvm]   {name} = {value!r}", file=sys.stderr)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
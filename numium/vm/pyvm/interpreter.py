@@ -0,0 +1,729 @@
+"""
+Numium Python VM - Run bytecode in-process, without the C runtime
+Máy ảo viết bằng Python: giải mã bytecode một lần rồi chạy vòng lặp dispatch
+
+Loading decodes the code once into a list of fixed-size tuples
+(kind, a, b, c, d): operands are unpacked, constant indices are replaced
+by the constants, jump targets by instruction indices, and each binary
+opcode carries the function that computes it. The dispatch loop then only
+indexes that list, with the most frequent kinds tested first.
+
+Values follow vm.c: int is 64-bit and wraps, float, string, bool and null
+(None). Arithmetic a type pair does not support gives null, integer
+division by zero prints an error and gives null, float equality has a
+1e-9 tolerance and output() prints floats as printf's %f. The list and
+dict opcodes, which the compiler does not emit yet, take their element
+count from the stack. Register bytecode (numiac --target=reg) runs in a
+second loop of the same shape.
+"""
+
+import math
+import operator
+import os
+import struct
+import sys
+from typing import Any, Dict, List, Optional, TextIO, Tuple
+try:
+    from ..compiler.opcodes import Opcode, RegOpcode, COMPARE_BRANCHES, RK_CONSTANT
+    from ..compiler.optimizer import INT64_MIN, INT64_MAX, truth
+    from ..compiler.bytecode import Bytecode, iter_instructions
+    from ..compiler.regcodegen import RegisterBytecode, iter_register_instructions
+    from ..compiler import numbc
+except ImportError:  # vm/compiler on sys.path, as in tools/
+    from opcodes import Opcode, RegOpcode, COMPARE_BRANCHES, RK_CONSTANT
+    from optimizer import INT64_MIN, INT64_MAX, truth
+    from bytecode import Bytecode, iter_instructions
+    from regcodegen import RegisterBytecode, iter_register_instructions
+    import numbc
+
+# Nested CALLs allowed before the VM gives up
+MAX_CALL_DEPTH = 10000
+
+class VMError(RuntimeError):
+    """Bytecode the VM cannot load or run"""
+
+def runtime_error(message: str):
+    """Report an error the program survives, as vm.c does"""
+    sys.stderr.write(f"Error: {message}\n")
+
+# Values
+
+_NUMBERS = (int, float, bool)  # Types vm.c reads as numbers when a float is involved
+
+def wrap(value: int) -> int:
+    """Two's complement 64-bit result of an int operation"""
+    return (value - INT64_MIN) % (1 << 64) + INT64_MIN
+
+def c_div(a: int, b: int) -> int:
+    """Integer division truncating toward zero"""
+    quotient = abs(a) // abs(b)
+    return quotient if (a < 0) == (b < 0) else -quotient
+
+def c_mod(a: int, b: int) -> int:
+    """Remainder with the sign of the dividend"""
+    return a - b * c_div(a, b)
+
+def float_div(a: float, b: float) -> float:
+    """IEEE division: x / 0.0 is an infinity, 0.0 / 0.0 is nan"""
+    try:
+        return a / b
+    except ZeroDivisionError:
+        if a == 0 or a != a:
+            return math.nan
+        return math.copysign(math.inf, a) * math.copysign(1.0, b)
+
+def format_value(value: Any) -> str:
+    """Text output() prints for a value"""
+    kind = type(value)
+    if kind is str:
+        return value
+    if kind is int:
+        return str(value)
+    if kind is float:
+        return '%f' % value
+    if kind is bool:
+        return 'true' if value else 'false'
+    if value is None:
+        return 'null'
+    if kind is list:
+        return '[' + ', '.join(format_value(item) for item in value) + ']'
+    if kind is dict:
+        return '{' + ', '.join(f"{format_value(key)}: {format_value(item)}"
+                               for key, item in value.items()) + '}'
+    return '<unknown>'
+
+# Generic operations
+
+def add(a, b):
+    ta, tb = type(a), type(b)
+    if ta is int and tb is int:
+        result = a + b
+        return result if INT64_MIN <= result <= INT64_MAX else wrap(result)
+    if ta is float or tb is float:
+        return float(a) + float(b) if ta in _NUMBERS and tb in _NUMBERS else None
+    if ta is str and tb is str:
+        return a + b
+    return None
+
+def sub(a, b):
+    ta, tb = type(a), type(b)
+    if ta is int and tb is int:
+        result = a - b
+        return result if INT64_MIN <= result <= INT64_MAX else wrap(result)
+    if (ta is float or tb is float) and ta in _NUMBERS and tb in _NUMBERS:
+        return float(a) - float(b)
+    return None
+
+def mul(a, b):
+    ta, tb = type(a), type(b)
+    if ta is int and tb is int:
+        result = a * b
+        return result if INT64_MIN <= result <= INT64_MAX else wrap(result)
+    if (ta is float or tb is float) and ta in _NUMBERS and tb in _NUMBERS:
+        return float(a) * float(b)
+    return None
+
+def div(a, b):
+    ta, tb = type(a), type(b)
+    if tb is int and b == 0:
+        runtime_error("Division by zero")
+        return None
+    if ta is int and tb is int:
+        return wrap(c_div(a, b))
+    if (ta is float or tb is float) and ta in _NUMBERS and tb in _NUMBERS:
+        return float_div(float(a), float(b))
+    return None
+
+def mod(a, b):
+    ta, tb = type(a), type(b)
+    if tb is int and b == 0:
+        runtime_error("Division by zero")
+        return None
+    if ta is int and tb is int:
+        return wrap(c_mod(a, b))
+    return None
+
+def neg(a):
+    kind = type(a)
+    if kind is int:
+        return wrap(-a)
+    if kind is float:
+        return -a
+    return None
+
+def eq(a, b):
+    kind = type(a)
+    if kind is not type(b):
+        return False
+    if kind is float:
+        return abs(a - b) < 1e-9
+    if kind is int or kind is str or kind is bool:
+        return a == b
+    return False
+
+def ne(a, b):
+    return not eq(a, b)
+
+def lt(a, b):
+    ta, tb = type(a), type(b)
+    if ta is int and tb is int:
+        return a < b
+    if (ta is float or tb is float) and ta in _NUMBERS and tb in _NUMBERS:
+        return float(a) < float(b)
+    return False
+
+def gt(a, b):
+    ta, tb = type(a), type(b)
+    if ta is int and tb is int:
+        return a > b
+    if (ta is float or tb is float) and ta in _NUMBERS and tb in _NUMBERS:
+        return float(a) > float(b)
+    return False
+
+def le(a, b):
+    return lt(a, b) or eq(a, b)
+
+def ge(a, b):
+    return gt(a, b) or eq(a, b)
+
+def logical_and(a, b):
+    return truth(a) and truth(b)
+
+def logical_or(a, b):
+    return truth(a) or truth(b)
+
+def logical_not(a):
+    return not truth(a)
+
+# Typed opcodes: the check the compiler expects to pass, else the generic operation
+
+def _typed_int(operation, generic, nonzero=False):
+    def typed(a, b):
+        if type(a) is int and type(b) is int and (b or not nonzero):
+            result = operation(a, b)
+            if INT64_MIN <= result <= INT64_MAX:
+                return result
+        return generic(a, b)
+    return typed
+
+def _typed_float(operation, generic, nonzero=False):
+    def typed(a, b):
+        if type(a) is float and type(b) is float and (b or not nonzero):
+            return operation(a, b)
+        return generic(a, b)
+    return typed
+
+# Binary opcode -> function of the two operands (register code shares the numbers)
+BINARY_OPERATIONS = {
+    Opcode.ADD: add, Opcode.SUB: sub, Opcode.MUL: mul, Opcode.DIV: div, Opcode.MOD: mod,
+    Opcode.EQ: eq, Opcode.NE: ne, Opcode.LT: lt, Opcode.LE: le, Opcode.GT: gt, Opcode.GE: ge,
+    Opcode.AND_OP: logical_and, Opcode.OR_OP: logical_or,
+    Opcode.ADD_INT: _typed_int(operator.add, add),
+    Opcode.SUB_INT: _typed_int(operator.sub, sub),
+    Opcode.MUL_INT: _typed_int(operator.mul, mul),
+    Opcode.DIV_INT: _typed_int(c_div, div, nonzero=True),
+    Opcode.MOD_INT: _typed_int(c_mod, mod, nonzero=True),
+    Opcode.ADD_FLOAT: _typed_float(operator.add, add),
+    Opcode.SUB_FLOAT: _typed_float(operator.sub, sub),
+    Opcode.MUL_FLOAT: _typed_float(operator.mul, mul),
+    Opcode.DIV_FLOAT: _typed_float(operator.truediv, div, nonzero=True),
+    Opcode.EQ_INT: _typed_int(operator.eq, eq),
+    Opcode.NE_INT: _typed_int(operator.ne, ne),
+    Opcode.LT_INT: _typed_int(operator.lt, lt),
+    Opcode.LE_INT: _typed_int(operator.le, le),
+    Opcode.GT_INT: _typed_int(operator.gt, gt),
+    Opcode.GE_INT: _typed_int(operator.ge, ge),
+    Opcode.LT_FLOAT: _typed_float(operator.lt, lt),
+    Opcode.LE_FLOAT: _typed_float(operator.le, le),
+    Opcode.GT_FLOAT: _typed_float(operator.gt, gt),
+    Opcode.GE_FLOAT: _typed_float(operator.ge, ge),
+}
+# Typed opcodes the stack loop runs inline: (operation, generic fallback, operand type);
+# int arithmetic also checks for 64-bit overflow
+INLINE_TYPED = {
+    Opcode.ADD_INT: (operator.add, add, int), Opcode.SUB_INT: (operator.sub, sub, int),
+    Opcode.MUL_INT: (operator.mul, mul, int),
+    Opcode.ADD_FLOAT: (operator.add, add, float), Opcode.SUB_FLOAT: (operator.sub, sub, float),
+    Opcode.MUL_FLOAT: (operator.mul, mul, float),
+    Opcode.EQ_INT: (operator.eq, eq, int), Opcode.NE_INT: (operator.ne, ne, int),
+    Opcode.LT_INT: (operator.lt, lt, int), Opcode.LE_INT: (operator.le, le, int),
+    Opcode.GT_INT: (operator.gt, gt, int), Opcode.GE_INT: (operator.ge, ge, int),
+    Opcode.LT_FLOAT: (operator.lt, lt, float), Opcode.LE_FLOAT: (operator.le, le, float),
+    Opcode.GT_FLOAT: (operator.gt, gt, float), Opcode.GE_FLOAT: (operator.ge, ge, float),
+}
+_INT_ARITHMETIC = frozenset({Opcode.ADD_INT, Opcode.SUB_INT, Opcode.MUL_INT})
+
+UNARY_OPERATIONS = {Opcode.NEG: neg, Opcode.NOT_OP: logical_not}
+
+# Fused compare-and-branch opcode -> the comparison it tests
+BRANCH_COMPARES = {branch: BINARY_OPERATIONS[compare] for compare, branch in COMPARE_BRANCHES.items()}
+
+# Decoded instruction kinds, roughly by how often programs run them
+(PUSH, LOAD, STORE, TYPED, INT_ARITHMETIC, BINARY, JUMP_UNLESS, JUMP, LOAD_LOCAL, STORE_LOCAL, BRANCH_UNLESS,
+ FOR_NEXT, FOR_LOCAL_NEXT, INC, ADD_CONST, ADD_VARS, LOAD2, STORE_CONST, JUMP_IF, UNARY,
+ OUTPUT, CALL, RET, DUP, POP, FOR_INIT, FOR_LOCAL_INIT, TABLE_SWITCH, LOOKUP_SWITCH,
+ INPUT, INIT, MAKE_LIST, MAKE_DICT, LIST_GET, LIST_SET, DICT_GET, DICT_SET, NOP, HALT,
+ MOVE) = range(40)
+
+# Stack opcode -> decoded kind, for opcodes whose operands need no rewriting
+_STACK_KINDS = {
+    Opcode.LOAD_VAR: LOAD, Opcode.STORE_VAR: STORE, Opcode.LOAD_LOCAL: LOAD_LOCAL,
+    Opcode.STORE_LOCAL: STORE_LOCAL, Opcode.LOAD_VAR2: LOAD2, Opcode.ADD_VARS: ADD_VARS,
+    Opcode.OUTPUT: OUTPUT, Opcode.RET: RET, Opcode.DUP: DUP, Opcode.POP: POP,
+    Opcode.INPUT: INPUT, Opcode.INIT_VAR: INIT, Opcode.MAKE_LIST: MAKE_LIST,
+    Opcode.MAKE_DICT: MAKE_DICT, Opcode.LIST_GET: LIST_GET, Opcode.LIST_SET: LIST_SET,
+    Opcode.DICT_GET: DICT_GET, Opcode.DICT_SET: DICT_SET, Opcode.NOP: NOP, Opcode.HALT: HALT,
+}
+_JUMP_KINDS = {Opcode.JMP: JUMP, Opcode.JMP_IF: JUMP_IF, Opcode.JMP_IFNOT: JUMP_UNLESS}
+_LOOP_KINDS = {Opcode.FOR_RANGE_INIT: FOR_INIT, Opcode.FOR_RANGE_NEXT: FOR_NEXT,
+               Opcode.FOR_LOCAL_INIT: FOR_LOCAL_INIT, Opcode.FOR_LOCAL_NEXT: FOR_LOCAL_NEXT}
+_CONSTANT_KINDS = {Opcode.STORE_CONST: STORE_CONST, Opcode.ADD_VAR_CONST: ADD_CONST,
+                   Opcode.INC_VAR: INC}
+
+Instruction = Tuple[int, Any, Any, Any, Any]
+
+class _Targets:
+    """Code offset -> instruction index, for jump operands"""
+    
+    def __init__(self, offsets: List[int], end: int):
+        self.index = {offset: index for index, offset in enumerate(offsets)}
+        self.index[end] = len(offsets)  # Jumping to the end halts
+    
+    def __call__(self, offset: int) -> int:
+        index = self.index.get(offset)
+        if index is None:
+            raise VMError(f"Jump to offset {offset}, which is not the start of an instruction")
+        return index
+
+def _switch(opcode: int, table: Tuple[int, ...], constants: List[Any], target) -> Tuple[Any, Any, int]:
+    """(a, b, default index) of a decoded switch; table is the operands after the subject"""
+    if opcode == Opcode.TABLESWITCH:
+        low, count, default = table[:3]
+        return constants[low], tuple(target(offset) for offset in table[3:3 + count]), target(default)
+    count, default = table[:2]
+    keys = [constants[index] for index in table[2:2 + 2 * count:2]]
+    targets = {key: target(offset) for key, offset in zip(keys, table[3:3 + 2 * count:2])}
+    return targets, type(keys[0]) if keys else type(None), target(default)
+
+def decode_stack(bytecode: Bytecode) -> Tuple[List[Instruction], List[int]]:
+    """Decode stack code into (instructions, code offset of each)"""
+    constants = bytecode.constants
+    try:
+        listing = list(iter_instructions(bytes(bytecode.code)))
+    except struct.error:
+        raise VMError("Code ends in the middle of an instruction") from None
+    offsets = [offset for offset, _, _ in listing]
+    target = _Targets(offsets, len(bytecode.code))
+    frame_sizes = {bytecode.functions[name]: size for name, size in bytecode.frame_sizes.items()
+                   if name in bytecode.functions}
+    
+    instructions: List[Instruction] = []
+    for offset, opcode, args in listing:
+        if opcode in INLINE_TYPED:
+            kind = INT_ARITHMETIC if opcode in _INT_ARITHMETIC else TYPED
+            instruction = (kind, *INLINE_TYPED[opcode], None)
+        elif opcode in BINARY_OPERATIONS:
+            instruction = (BINARY, BINARY_OPERATIONS[opcode], None, None, None)
+        elif opcode == Opcode.PUSH:
+            instruction = (PUSH, constants[args[0]], None, None, None)
+        elif opcode in _STACK_KINDS:
+            instruction = (_STACK_KINDS[opcode], *args, *(None,) * (4 - len(args)))
+        elif opcode in _JUMP_KINDS:
+            instruction = (_JUMP_KINDS[opcode], target(args[0]), None, None, None)
+        elif opcode in BRANCH_COMPARES:
+            instruction = (BRANCH_UNLESS, args[0], constants[args[1]], target(args[2]),
+                           BRANCH_COMPARES[opcode])
+        elif opcode in _LOOP_KINDS:
+            instruction = (_LOOP_KINDS[opcode], args[0], args[1], target(args[2]), None)
+        elif opcode in _CONSTANT_KINDS:
+            instruction = (_CONSTANT_KINDS[opcode], args[0], constants[args[1]], None, None)
+        elif opcode in UNARY_OPERATIONS:
+            instruction = (UNARY, UNARY_OPERATIONS[opcode], None, None, None)
+        elif opcode == Opcode.CALL:
+            if offset + 1 in bytecode.external_calls:
+                raise VMError(f"Unlinked call to '{bytecode.external_calls[offset + 1]}'; "
+                              f"link the program with numiac first")
+            instruction = (CALL, target(args[0]), frame_sizes.get(args[0], 0), None, None)
+        elif opcode == Opcode.TABLESWITCH or opcode == Opcode.LOOKUPSWITCH:
+            kind = TABLE_SWITCH if opcode == Opcode.TABLESWITCH else LOOKUP_SWITCH
+            instruction = (kind, *_switch(opcode, args, constants, target), None)
+        else:
+            raise VMError(f"Unknown opcode 0x{opcode:02X} at offset {offset}")
+        instructions.append(instruction)
+    instructions.append((HALT, None, None, None, None))  # Running off the end stops
+    offsets.append(len(bytecode.code))
+    return instructions, offsets
+
+# Register opcodes that take an RK or register operand first, then a jump
+_REG_JUMP_KINDS = {RegOpcode.JMP_IF: JUMP_IF, RegOpcode.JMP_IFNOT: JUMP_UNLESS}
+_REG_LOOP_KINDS = {RegOpcode.FOR_RANGE_INIT: FOR_INIT, RegOpcode.FOR_RANGE_NEXT: FOR_NEXT}
+
+def decode_register(bytecode: RegisterBytecode) -> Tuple[List[Instruction], List[int]]:
+    """Decode register code; RK operands become indices into registers + constants"""
+    constants = bytecode.constants
+    registers = bytecode.register_count
+    try:
+        listing = list(iter_register_instructions(bytes(bytecode.code)))
+    except struct.error:
+        raise VMError("Code ends in the middle of an instruction") from None
+    offsets = [offset for offset, _, _ in listing]
+    target = _Targets(offsets, len(bytecode.code))
+    
+    def rk(operand: int) -> int:
+        if operand & RK_CONSTANT:
+            index = operand & ~RK_CONSTANT
+            if index >= len(constants):
+                raise VMError(f"Constant operand {index} is past the constant pool")
+            return registers + index
+        if operand >= registers:
+            raise VMError(f"Register r{operand} is past the register count {registers}")
+        return operand
+    
+    instructions: List[Instruction] = []
+    for offset, opcode, args in listing:
+        if opcode in BINARY_OPERATIONS:
+            instruction = (BINARY, BINARY_OPERATIONS[opcode], rk(args[0]), rk(args[1]), rk(args[2]))
+        elif opcode == RegOpcode.MOVE:
+            instruction = (MOVE, rk(args[0]), rk(args[1]), None, None)
+        elif opcode in BRANCH_COMPARES:
+            instruction = (BRANCH_UNLESS, rk(args[0]), rk(args[1]), target(args[2]),
+                           BRANCH_COMPARES[opcode])
+        elif opcode == RegOpcode.JMP:
+            instruction = (JUMP, target(args[0]), None, None, None)
+        elif opcode in _REG_JUMP_KINDS:
+            instruction = (_REG_JUMP_KINDS[opcode], rk(args[0]), target(args[1]), None, None)
+        elif opcode in _REG_LOOP_KINDS:
+            instruction = (_REG_LOOP_KINDS[opcode], rk(args[0]), rk(args[1]), target(args[2]), None)
+        elif opcode == RegOpcode.LOADK:
+            instruction = (STORE_CONST, rk(args[0]), constants[args[1]], None, None)
+        elif opcode in UNARY_OPERATIONS:
+            instruction = (UNARY, UNARY_OPERATIONS[opcode], rk(args[0]), rk(args[1]), None)
+        elif opcode == RegOpcode.OUTPUT:
+            instruction = (OUTPUT, rk(args[0]), None, None, None)
+        elif opcode == RegOpcode.INPUT:
+            instruction = (INPUT, rk(args[0]), None, None, None)
+        elif opcode == RegOpcode.CALL:
+            instruction = (CALL, target(args[0]), None, None, None)
+        elif opcode == RegOpcode.TABLESWITCH or opcode == RegOpcode.LOOKUPSWITCH:
+            kind = TABLE_SWITCH if opcode == RegOpcode.TABLESWITCH else LOOKUP_SWITCH
+            instruction = (kind, *_switch(opcode, args[1:], constants, target), rk(args[0]))
+        elif opcode == RegOpcode.RET:
+            instruction = (RET, None, None, None, None)
+        elif opcode == RegOpcode.NOP:
+            instruction = (NOP, None, None, None, None)
+        elif opcode == RegOpcode.HALT:
+            instruction = (HALT, None, None, None, None)
+        else:
+            raise VMError(f"Unknown register opcode 0x{opcode:02X} at offset {offset}")
+        instructions.append(instruction)
+    instructions.append((HALT, None, None, None, None))
+    offsets.append(len(bytecode.code))
+    return instructions, offsets
+
+def load_bytecode(filename: str) -> Bytecode:
+    """Read a .numbc file as stack or register bytecode, whichever it holds"""
+    with open(filename, 'rb') as f:
+        is_container = numbc.is_container(f.read(len(numbc.MAGIC)))
+    if is_container:
+        with numbc.NumbcImage.open(filename) as image:
+            flags = image.flags
+        if flags & numbc.FLAG_UNRESOLVED:
+            raise VMError(f"{filename} is an unlinked unit; link it with numiac first")
+        if flags & numbc.FLAG_REGISTER:
+            return RegisterBytecode.from_file(filename)
+    return Bytecode.from_file(filename)
+
+def _count(value, available: int) -> int:
+    if type(value) is not int or not 0 <= value <= available:
+        raise VMError(f"Bad element count {format_value(value)} for {available} stack values")
+    return value
+
+class VM:
+    """Runs one program: decode once with the constructor, then run()"""
+    
+    def __init__(self, bytecode: Bytecode, output: Optional[TextIO] = None,
+                 input: Optional[TextIO] = None):
+        self.bytecode = bytecode
+        self.output = output
+        self.input = input
+        self.register = isinstance(bytecode, RegisterBytecode)
+        if self.register:
+            self.instructions, self.offsets = decode_register(bytecode)
+            # Registers, then the constants that RK operands read in place
+            self.values: List[Any] = [None] * bytecode.register_count + list(bytecode.constants)
+        else:
+            self.instructions, self.offsets = decode_stack(bytecode)
+            self.values = [None] * len(bytecode.variables)
+        self.stack: List[Any] = []
+        self.pc = 0  # Index into instructions
+    
+    @classmethod
+    def from_file(cls, filename: str, **streams) -> 'VM':
+        return cls(load_bytecode(filename), **streams)
+    
+    def globals(self) -> Dict[str, Any]:
+        """Variable name -> current value"""
+        return {name: self.values[index] for name, index in self.bytecode.variables.items()}
+    
+    def run(self) -> int:
+        """Execute until HALT, a RET with no caller, or the end of the code; returns the exit code"""
+        output = self.output if self.output is not None else sys.stdout
+        source = self.input if self.input is not None else sys.stdin
+        try:
+            if self.register:
+                self._run_register(output.write, source.readline)
+            else:
+                self._run_stack(output.write, source.readline)
+        except IndexError:
+            offset = self.offsets[self.pc - 1] if self.pc else 0
+            raise VMError(f"Stack underflow or bad operand at offset {offset}") from None
+        return 0
+    
+    def _run_stack(self, write, readline):
+        code = self.instructions
+        variables = self.values
+        stack = self.stack
+        push = stack.append
+        pop = stack.pop
+        slots: List[Any] = []
+        frames: List[Tuple[int, List[Any]]] = []
+        pc = 0
+        try:
+            while True:
+                kind, a, b, c, d = code[pc]
+                pc += 1
+                if kind == PUSH:
+                    push(a)
+                elif kind == LOAD:
+                    push(variables[a])
+                elif kind == STORE:
+                    variables[a] = pop()
+                elif kind == TYPED:
+                    right = pop()
+                    left = stack[-1]
+                    if type(left) is c and type(right) is c:
+                        stack[-1] = a(left, right)
+                    else:
+                        stack[-1] = b(left, right)
+                elif kind == INT_ARITHMETIC:
+                    right = pop()
+                    left = stack[-1]
+                    if type(left) is int and type(right) is int:
+                        result = a(left, right)
+                        stack[-1] = result if INT64_MIN <= result <= INT64_MAX else b(left, right)
+                    else:
+                        stack[-1] = b(left, right)
+                elif kind == BINARY:
+                    right = pop()
+                    stack[-1] = a(stack[-1], right)
+                elif kind == JUMP_UNLESS:
+                    value = pop()
+                    if value is not True and (value is False or not truth(value)):
+                        pc = a
+                elif kind == JUMP:
+                    pc = a
+                elif kind == LOAD_LOCAL:
+                    push(slots[a])
+                elif kind == STORE_LOCAL:
+                    slots[a] = pop()
+                elif kind == BRANCH_UNLESS:
+                    if not truth(d(variables[a], b)):
+                        pc = c
+                elif kind == FOR_NEXT or kind == FOR_LOCAL_NEXT:
+                    cells = variables if kind == FOR_NEXT else slots
+                    index, limit = cells[a], cells[b]
+                    if type(index) is int and type(limit) is int and index < INT64_MAX:
+                        index += 1
+                        cells[a] = index
+                        if index < limit:
+                            pc = c
+                    else:
+                        index = cells[a] = add(index, 1)
+                        if lt(index, limit):
+                            pc = c
+                elif kind == INC:
+                    variables[a] = add(variables[a], b)
+                elif kind == ADD_CONST:
+                    push(add(variables[a], b))
+                elif kind == ADD_VARS:
+                    push(add(variables[a], variables[b]))
+                elif kind == LOAD2:
+                    push(variables[a])
+                    push(variables[b])
+                elif kind == STORE_CONST:
+                    variables[a] = b
+                elif kind == JUMP_IF:
+                    if truth(pop()):
+                        pc = a
+                elif kind == UNARY:
+                    stack[-1] = a(stack[-1])
+                elif kind == OUTPUT:
+                    write(format_value(pop()))
+                elif kind == CALL:
+                    if len(frames) >= MAX_CALL_DEPTH:
+                        raise VMError(f"Call stack overflow ({MAX_CALL_DEPTH} frames)")
+                    frames.append((pc, slots))
+                    slots = [None] * b
+                    pc = a
+                elif kind == RET:
+                    if not frames:
+                        break
+                    pc, slots = frames.pop()
+                elif kind == DUP:
+                    push(stack[-1])
+                elif kind == POP:
+                    pop()
+                elif kind == FOR_INIT or kind == FOR_LOCAL_INIT:
+                    cells = variables if kind == FOR_INIT else slots
+                    cells[a] = 0
+                    limit = cells[b] = pop()
+                    if not lt(0, limit):
+                        pc = c
+                elif kind == TABLE_SWITCH:
+                    value = pop()
+                    index = value - a if type(value) is int else -1
+                    pc = b[index] if 0 <= index < len(b) else c
+                elif kind == LOOKUP_SWITCH:
+                    value = pop()
+                    pc = a.get(value, c) if type(value) is b else c
+                elif kind == HALT:
+                    break
+                elif kind == NOP:
+                    pass
+                else:
+                    self._data_op(kind, a, stack, variables, readline)
+        finally:
+            self.pc = pc
+    
+    @staticmethod
+    def _data_op(kind: int, a, stack: List[Any], variables: List[Any], readline):
+        """Rare stack opcodes: input, INIT_VAR, lists and dicts"""
+        pop = stack.pop
+        if kind == INPUT:
+            stack.append(readline() or None)
+        elif kind == INIT:
+            variables[a] = None
+        elif kind == MAKE_LIST:  # count = pop(), then count items, first item deepest
+            count = _count(pop(), len(stack))
+            items = stack[len(stack) - count:] if count else []
+            del stack[len(stack) - count:]
+            stack.append(items)
+        elif kind == MAKE_DICT:  # count = pop(), then count key, value pairs
+            count = _count(pop(), len(stack) // 2)
+            items = stack[len(stack) - 2 * count:] if count else []
+            del stack[len(stack) - 2 * count:]
+            stack.append(dict(zip(items[::2], items[1::2])))
+        elif kind == LIST_GET:  # list, index -> item, or null
+            index = pop()
+            items = pop()
+            ok = type(items) is list and type(index) is int and -len(items) <= index < len(items)
+            stack.append(items[index] if ok else None)
+        elif kind == LIST_SET:  # list, index, value ->
+            value = pop()
+            index = pop()
+            items = pop()
+            if type(items) is list and type(index) is int and -len(items) <= index < len(items):
+                items[index] = value
+        elif kind == DICT_GET:  # dict, key -> value, or null
+            key = pop()
+            table = pop()
+            stack.append(table.get(key) if type(table) is dict and type(key) in (int, str, bool) else None)
+        elif kind == DICT_SET:  # dict, key, value ->
+            value = pop()
+            key = pop()
+            table = pop()
+            if type(table) is dict and type(key) in (int, str, bool):
+                table[key] = value
+    
+    def _run_register(self, write, readline):
+        code = self.instructions
+        values = self.values
+        frames: List[int] = []
+        pc = 0
+        try:
+            while True:
+                kind, a, b, c, d = code[pc]
+                pc += 1
+                if kind == BINARY:
+                    values[b] = a(values[c], values[d])
+                elif kind == BRANCH_UNLESS:
+                    if not truth(d(values[a], values[b])):
+                        pc = c
+                elif kind == MOVE:
+                    values[a] = values[b]
+                elif kind == JUMP:
+                    pc = a
+                elif kind == JUMP_UNLESS:
+                    value = values[a]
+                    if value is not True and (value is False or not truth(value)):
+                        pc = b
+                elif kind == FOR_NEXT:
+                    index, limit = values[a], values[b]
+                    if type(index) is int and type(limit) is int and index < INT64_MAX:
+                        index += 1
+                        values[a] = index
+                        if index < limit:
+                            pc = c
+                    else:
+                        index = values[a] = add(index, 1)
+                        if lt(index, limit):
+                            pc = c
+                elif kind == STORE_CONST:
+                    values[a] = b
+                elif kind == JUMP_IF:
+                    if truth(values[a]):
+                        pc = b
+                elif kind == UNARY:
+                    values[b] = a(values[c])
+                elif kind == OUTPUT:
+                    write(format_value(values[a]))
+                elif kind == CALL:
+                    if len(frames) >= MAX_CALL_DEPTH:
+                        raise VMError(f"Call stack overflow ({MAX_CALL_DEPTH} frames)")
+                    frames.append(pc)
+                    pc = a
+                elif kind == RET:
+                    if not frames:
+                        break
+                    pc = frames.pop()
+                elif kind == FOR_INIT:
+                    values[a] = 0
+                    if not lt(0, values[b]):
+                        pc = c
+                elif kind == TABLE_SWITCH:
+                    value = values[d]
+                    index = value - a if type(value) is int else -1
+                    pc = b[index] if 0 <= index < len(b) else c
+                elif kind == LOOKUP_SWITCH:
+                    value = values[d]
+                    pc = a.get(value, c) if type(value) is b else c
+                elif kind == INPUT:
+                    values[a] = readline() or None
+                elif kind == HALT:
+                    break
+        finally:
+            self.pc = pc
+
+def load_program(filename: str, opt_level: int = 0, target: str = 'stack') -> Bytecode:
+    """Bytecode of a .numbc file, or of a .num source compiled and linked in memory
+    
+    Libraries are read from the source's directory; nothing is written or
+    printed. A source that does not compile raises CompileError.
+    """
+    if not filename.endswith('.num'):
+        return load_bytecode(filename)
+    try:
+        from ..compiler.compiler import CompileOptions, LibrarySources, compile_source
+    except ImportError:
+        from compiler import CompileOptions, LibrarySources, compile_source
+    with open(filename, 'r') as f:
+        source = f.read()
+    libraries = LibrarySources([os.path.dirname(os.path.abspath(filename))])
+    return compile_source(source, CompileOptions(opt_level=opt_level, target=target, libraries=libraries))
+
+def run_file(filename: str, output: Optional[TextIO] = None, input: Optional[TextIO] = None,
+             opt_level: int = 0, target: str = 'stack') -> VM:
+    """Run a .numbc file, or compile a .num source in memory and run it; returns the finished VM"""
+    vm = VM(load_program(filename, opt_level, target), output=output, input=input)
+    vm.run()
+    return vm
@@ -26,23 +26,50 @@
 #define OP_DIV 0x13
 #define OP_MOD 0x14
 #define OP_NEG 0x15
+#define OP_ADD_INT 0x16      /* Typed forms: fast path for int/int or float/float operands */
+#define OP_SUB_INT 0x17
+#define OP_MUL_INT 0x18
+#define OP_DIV_INT 0x19
+#define OP_MOD_INT 0x1A
+#define OP_ADD_FLOAT 0x1B
+#define OP_SUB_FLOAT 0x1C
+#define OP_MUL_FLOAT 0x1D
+#define OP_DIV_FLOAT 0x1E
 #define OP_EQ 0x20
 #define OP_NE 0x21
 #define OP_LT 0x22
 #define OP_LE 0x23
 #define OP_GT 0x24
 #define OP_GE 0x25
+#define OP_EQ_INT 0x26
+#define OP_NE_INT 0x27
+#define OP_LT_INT 0x28
+#define OP_LE_INT 0x29
+#define OP_GT_INT 0x2A
+#define OP_GE_INT 0x2B
+#define OP_LT_FLOAT 0x2C
+#define OP_LE_FLOAT 0x2D
+#define OP_GT_FLOAT 0x2E
+#define OP_GE_FLOAT 0x2F
 #define OP_AND 0x30
 #define OP_OR 0x31
 #define OP_NOT 0x32
 #define OP_LOAD_VAR 0x40
 #define OP_STORE_VAR 0x41
 #define OP_INIT_VAR 0x42
+#define OP_LOAD_LOCAL 0x43   /* Slot of the current call frame (FRAM gives frame sizes) */
+#define OP_STORE_LOCAL 0x44
 #define OP_JMP 0x50
 #define OP_JMP_IF 0x51
 #define OP_JMP_IFNOT 0x52
 #define OP_CALL 0x53
 #define OP_RET 0x54
+#define OP_FOR_RANGE_INIT 0x55  /* counter, limit, exit: counter = 0; limit = pop() */
+#define OP_FOR_RANGE_NEXT 0x56  /* counter, limit, body: ++counter < limit -> body */
+#define OP_FOR_LOCAL_INIT 0x57  /* Same on call frame slots */
+#define OP_FOR_LOCAL_NEXT 0x58
+#define OP_TABLESWITCH 0x59     /* low, n, default, n targets: jump for pop() - low */
+#define OP_LOOKUPSWITCH 0x5A    /* n, default, n (key, target) pairs sorted by key */
 #define OP_OUTPUT 0x60
 #define OP_INPUT 0x61
 #define OP_MAKE_LIST 0x70
@@ -54,6 +81,16 @@
 #define OP_NOP 0xFF
 #define OP_HALT 0x00
 
+/* .numbc v2 container (see vm/compiler/numbc.py); integers little-endian */
+#define NUMBC_MAGIC "NUMB"
+#define NUMBC_VERSION 2
+#define NUMBC_FLAG_UNRESOLVED 0x1  /* Some CALLs still need linking */
+#define NUMBC_FLAG_REGISTER 0x2    /* Three-address register code, not stack code */
+#define NUMBC_HEADER_SIZE 16    /* magic, u16 version, u16 flags, u32 sections, u32 reserved */
+#define NUMBC_SECTION_SIZE 16   /* kind[4], u32 offset, u32 size, u32 count */
+#define NUMBC_CONSTANT_SIZE 16  /* u8 type, pad[3], u32 length, 8-byte payload */
+#define NUMBC_NAME_SIZE 12      /* u32 value, u32 name offset, u32 name length */
+
 /* Value types */
 typedef enum {
     VAL_INTEGER,
@@ -116,6 +153,10 @@ typedef struct {
     uint8_t* memory;
     size_t memory_ptr;
     
+    uint8_t* image;           /* Whole .numbc v2 file; code points into it */
+    size_t image_size;
+    bool image_mapped;        /* image came from mmap rather than malloc */
+    
     bool halted;
     int exit_code;
 } VM;
@@ -124,6 +165,7 @@ typedef struct {
 VM* vm_create();
 void vm_destroy(VM* vm);
 int vm_load_bytecode(VM* vm, const char* filename);
+int vm_load_image(VM* vm, uint8_t* image, size_t size);
 int vm_add_constant(VM* vm, Value value);
 int vm_load_metadata(VM* vm, const char* filename);
 int vm_run(VM* vm);
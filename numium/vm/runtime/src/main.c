@@ -36,11 +36,11 @@ int main(int argc, char* argv[]) {
         return 1;
     }
     
-    // Load metadata (constants) if available
+    // Pre-v2 files keep their constants in a .meta.json sidecar
     char metadata_file[512];
     snprintf(metadata_file, sizeof(metadata_file), "%s", bytecode_file);
     char* dot = strrchr(metadata_file, '.');
-    if (dot) {
+    if (dot && !vm->image) {
         *dot = '\0';
         strcat(metadata_file, ".meta.json");
         vm_load_metadata(vm, metadata_file);
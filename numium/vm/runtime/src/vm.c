@@ -2,9 +2,15 @@
  * Numium Virtual Machine Implementation
  */
 
+/* fileno() and mmap() are POSIX; strict C99 headers hide them otherwise */
+#define _POSIX_C_SOURCE 200809L
+
 #include "../include/vm.h"
 #include <string.h>
 #include <math.h>
+#ifndef _WIN32
+#include <sys/mman.h>
+#endif
 
 /* Value utility functions */
 Value value_int(int64_t i) {
@@ -92,6 +98,10 @@ VM* vm_create() {
     vm->memory = malloc(MEMORY_SIZE);
     vm->memory_ptr = 0;
     
+    vm->image = NULL;
+    vm->image_size = 0;
+    vm->image_mapped = false;
+    
     vm->func_count = 0;
     vm->halted = false;
     vm->exit_code = 0;
@@ -101,7 +111,15 @@ VM* vm_create() {
 
 void vm_destroy(VM* vm) {
     if (vm) {
-        if (vm->code) free(vm->code);
+        if (vm->image) {
+#ifndef _WIN32
+            if (vm->image_mapped) munmap(vm->image, vm->image_size);
+            else
+#endif
+            free(vm->image);
+        } else if (vm->code) {
+            free(vm->code);
+        }
         if (vm->stack) free(vm->stack);
         if (vm->variables) free(vm->variables);
         if (vm->memory) free(vm->memory);
@@ -116,7 +134,134 @@ void vm_destroy(VM* vm) {
     }
 }
 
-/* Load bytecode from file */
+static uint32_t read_u32(const uint8_t* p) {
+    return (uint32_t)p[0] | ((uint32_t)p[1] << 8) | ((uint32_t)p[2] << 16) | ((uint32_t)p[3] << 24);
+}
+
+static uint64_t read_u64(const uint8_t* p) {
+    return (uint64_t)read_u32(p) | ((uint64_t)read_u32(p + 4) << 32);
+}
+
+/* Find a section of a .numbc v2 image; returns its data or NULL */
+static const uint8_t* image_section(VM* vm, const char* kind, uint32_t* size, uint32_t* count) {
+    uint32_t sections = read_u32(vm->image + 8);
+    for (uint32_t i = 0; i < sections; i++) {
+        const uint8_t* entry = vm->image + NUMBC_HEADER_SIZE + i * NUMBC_SECTION_SIZE;
+        if (memcmp(entry, kind, 4) == 0) {
+            *size = read_u32(entry + 8);
+            *count = read_u32(entry + 12);
+            return vm->image + read_u32(entry + 4);
+        }
+    }
+    *size = 0;
+    *count = 0;
+    return NULL;
+}
+
+/* Use a .numbc v2 image: code is used in place, constants and functions are read from their tables */
+int vm_load_image(VM* vm, uint8_t* image, size_t size) {
+    vm->image = image;
+    vm->image_size = size;
+    
+    if (size < NUMBC_HEADER_SIZE || memcmp(image, NUMBC_MAGIC, 4) != 0) {
+        fprintf(stderr, "Error: Not a .numbc v2 file\n");
+        return -1;
+    }
+    uint32_t version = image[4] | (image[5] << 8);
+    if (version != NUMBC_VERSION) {
+        fprintf(stderr, "Error: Unsupported .numbc version %u\n", version);
+        return -1;
+    }
+    uint32_t flags = image[6] | (image[7] << 8);
+    if (flags & NUMBC_FLAG_UNRESOLVED) {
+        fprintf(stderr, "Error: Unlinked .numbc unit; link it with numiac first\n");
+        return -1;
+    }
+    if (flags & NUMBC_FLAG_REGISTER) {
+        fprintf(stderr, "Error: Register bytecode (numiac --target=reg) needs a register VM\n");
+        return -1;
+    }
+    uint32_t sections = read_u32(image + 8);
+    if (NUMBC_HEADER_SIZE + (uint64_t)sections * NUMBC_SECTION_SIZE > size) {
+        fprintf(stderr, "Error: Truncated .numbc section table\n");
+        return -1;
+    }
+    for (uint32_t i = 0; i < sections; i++) {
+        const uint8_t* entry = image + NUMBC_HEADER_SIZE + i * NUMBC_SECTION_SIZE;
+        if ((uint64_t)read_u32(entry + 4) + read_u32(entry + 8) > size) {
+            fprintf(stderr, "Error: Truncated .numbc section %.4s\n", (const char*)entry);
+            return -1;
+        }
+    }
+    
+    uint32_t code_size, count, strings_size, unused;
+    const uint8_t* code = image_section(vm, "CODE", &code_size, &count);
+    const uint8_t* strings = image_section(vm, "STRS", &strings_size, &unused);
+    vm->code = (uint8_t*)code;
+    vm->code_size = code ? code_size : 0;
+    
+    uint32_t table_size;
+    const uint8_t* table = image_section(vm, "CNST", &table_size, &count);
+    if ((uint64_t)count * NUMBC_CONSTANT_SIZE > table_size) {
+        fprintf(stderr, "Error: Truncated .numbc constant table\n");
+        return -1;
+    }
+    for (uint32_t i = 0; i < count; i++) {
+        const uint8_t* entry = table + i * NUMBC_CONSTANT_SIZE;
+        uint32_t length = read_u32(entry + 4);
+        uint64_t payload = read_u64(entry + 8);
+        Value value;
+        switch (entry[0]) {
+            case VAL_INTEGER:
+                value = value_int((int64_t)payload);
+                break;
+            case VAL_FLOAT: {
+                double f;
+                memcpy(&f, &payload, sizeof(f));
+                value = value_float(f);
+                break;
+            }
+            case VAL_STRING: {
+                if (!strings || payload + length > strings_size) {
+                    fprintf(stderr, "Error: .numbc string constant out of range\n");
+                    return -1;
+                }
+                char* text = malloc(length + 1);
+                memcpy(text, strings + payload, length);
+                text[length] = '\0';
+                value.type = VAL_STRING;
+                value.data.s = text;
+                break;
+            }
+            case VAL_BOOL:
+                value = value_bool(payload != 0);
+                break;
+            default:
+                value = value_null();
+        }
+        vm_add_constant(vm, value);
+    }
+    
+    table = image_section(vm, "FUNC", &table_size, &count);
+    for (uint32_t i = 0; i < count && i < MAX_FUNCTIONS && (i + 1) * NUMBC_NAME_SIZE <= table_size; i++) {
+        vm->functions[i].code = vm->code;
+        vm->functions[i].code_size = vm->code_size;
+        vm->functions[i].entry_point = read_u32(table + i * NUMBC_NAME_SIZE);
+        vm->func_count = i + 1;
+    }
+    
+    image_section(vm, "VARS", &table_size, &count);
+    vm->var_count = count < MAX_VARIABLES ? count : MAX_VARIABLES;
+    for (size_t i = 0; i < vm->var_count; i++) {
+        vm->variables[i] = value_null();
+    }
+    
+    printf("Loaded bytecode: %u bytes (.numbc v%u, %zu constants)\n",
+           code_size, version, vm->constants.count);
+    return 0;
+}
+
+/* Load bytecode from file: a .numbc v2 image, or raw code with a .meta.json sidecar */
 int vm_load_bytecode(VM* vm, const char* filename) {
     FILE* file = fopen(filename, "rb");
     if (!file) {
@@ -128,6 +273,32 @@ int vm_load_bytecode(VM* vm, const char* filename) {
     long size = ftell(file);
     fseek(file, 0, SEEK_SET);
     
+    char magic[4] = {0};
+    if (size >= NUMBC_HEADER_SIZE && fread(magic, 1, 4, file) == 4 &&
+        memcmp(magic, NUMBC_MAGIC, 4) == 0) {
+        uint8_t* image = NULL;
+#ifndef _WIN32
+        void* mapped = mmap(NULL, size, PROT_READ, MAP_PRIVATE, fileno(file), 0);
+        if (mapped != MAP_FAILED) {
+            image = mapped;
+            vm->image_mapped = true;
+        }
+#endif
+        if (!image) {
+            image = malloc(size);
+            fseek(file, 0, SEEK_SET);
+            if (fread(image, 1, size, file) != (size_t)size) {
+                fprintf(stderr, "Error: Failed to read bytecode file\n");
+                free(image);
+                fclose(file);
+                return -1;
+            }
+        }
+        fclose(file);
+        return vm_load_image(vm, image, size);
+    }
+    fseek(file, 0, SEEK_SET);
+    
     vm->code = malloc(size);
     vm->code_size = size;
     
@@ -225,6 +396,10 @@ Value vm_div(Value a, Value b) {
 }
 
 Value vm_mod(Value a, Value b) {
+    if (b.type == VAL_INTEGER && b.data.i == 0) {
+        fprintf(stderr, "Error: Division by zero\n");
+        return value_null();
+    }
     if (a.type == VAL_INTEGER && b.type == VAL_INTEGER) {
         return value_int(a.data.i % b.data.i);
     }
@@ -299,19 +474,19 @@ Value vm_ge(Value a, Value b) {
 
 /* Logic operations */
 Value vm_and(Value a, Value b) {
-    bool a_bool = (a.type == VAL_BOOL || (a.type == VAL_INTEGER && a.data.i != 0));
-    bool b_bool = (b.type == VAL_BOOL || (b.type == VAL_INTEGER && b.data.i != 0));
+    bool a_bool = ((a.type == VAL_BOOL || a.type == VAL_INTEGER) && a.data.i != 0);
+    bool b_bool = ((b.type == VAL_BOOL || b.type == VAL_INTEGER) && b.data.i != 0);
     return value_bool(a_bool && b_bool);
 }
 
 Value vm_or(Value a, Value b) {
-    bool a_bool = (a.type == VAL_BOOL || (a.type == VAL_INTEGER && a.data.i != 0));
-    bool b_bool = (b.type == VAL_BOOL || (b.type == VAL_INTEGER && b.data.i != 0));
+    bool a_bool = ((a.type == VAL_BOOL || a.type == VAL_INTEGER) && a.data.i != 0);
+    bool b_bool = ((b.type == VAL_BOOL || b.type == VAL_INTEGER) && b.data.i != 0);
     return value_bool(a_bool || b_bool);
 }
 
 Value vm_not(Value a) {
-    bool a_bool = (a.type == VAL_BOOL || (a.type == VAL_INTEGER && a.data.i != 0));
+    bool a_bool = ((a.type == VAL_BOOL || a.type == VAL_INTEGER) && a.data.i != 0);
     return value_bool(!a_bool);
 }
 
@@ -330,6 +505,18 @@ Value vm_input() {
     return value_null();
 }
 
+/* Typed opcode: the fast path when both operands have the compiler's
+ * expected type, else the generic operation (e.g. a variable still null) */
+#define TYPED_BINARY(opcode, check, result, generic)                     \
+            case opcode: {                                               \
+                Value b = vm_pop(vm);                                    \
+                Value a = vm_pop(vm);                                    \
+                vm_push(vm, (check) ? (result) : generic(a, b));         \
+                break;                                                   \
+            }
+#define BOTH_INT (a.type == VAL_INTEGER && b.type == VAL_INTEGER)
+#define BOTH_FLOAT (a.type == VAL_FLOAT && b.type == VAL_FLOAT)
+
 /* Main VM execution loop */
 int vm_run(VM* vm) {
     if (!vm->code) {
@@ -482,6 +669,26 @@ int vm_run(VM* vm) {
                 break;
             }
             
+            TYPED_BINARY(OP_ADD_INT, BOTH_INT, value_int(a.data.i + b.data.i), vm_add)
+            TYPED_BINARY(OP_SUB_INT, BOTH_INT, value_int(a.data.i - b.data.i), vm_sub)
+            TYPED_BINARY(OP_MUL_INT, BOTH_INT, value_int(a.data.i * b.data.i), vm_mul)
+            TYPED_BINARY(OP_DIV_INT, BOTH_INT && b.data.i != 0, value_int(a.data.i / b.data.i), vm_div)
+            TYPED_BINARY(OP_MOD_INT, BOTH_INT && b.data.i != 0, value_int(a.data.i % b.data.i), vm_mod)
+            TYPED_BINARY(OP_ADD_FLOAT, BOTH_FLOAT, value_float(a.data.f + b.data.f), vm_add)
+            TYPED_BINARY(OP_SUB_FLOAT, BOTH_FLOAT, value_float(a.data.f - b.data.f), vm_sub)
+            TYPED_BINARY(OP_MUL_FLOAT, BOTH_FLOAT, value_float(a.data.f * b.data.f), vm_mul)
+            TYPED_BINARY(OP_DIV_FLOAT, BOTH_FLOAT, value_float(a.data.f / b.data.f), vm_div)
+            TYPED_BINARY(OP_EQ_INT, BOTH_INT, value_bool(a.data.i == b.data.i), vm_eq)
+            TYPED_BINARY(OP_NE_INT, BOTH_INT, value_bool(a.data.i != b.data.i), vm_ne)
+            TYPED_BINARY(OP_LT_INT, BOTH_INT, value_bool(a.data.i < b.data.i), vm_lt)
+            TYPED_BINARY(OP_LE_INT, BOTH_INT, value_bool(a.data.i <= b.data.i), vm_le)
+            TYPED_BINARY(OP_GT_INT, BOTH_INT, value_bool(a.data.i > b.data.i), vm_gt)
+            TYPED_BINARY(OP_GE_INT, BOTH_INT, value_bool(a.data.i >= b.data.i), vm_ge)
+            TYPED_BINARY(OP_LT_FLOAT, BOTH_FLOAT, value_bool(a.data.f < b.data.f), vm_lt)
+            TYPED_BINARY(OP_LE_FLOAT, BOTH_FLOAT, value_bool(a.data.f <= b.data.f), vm_le)
+            TYPED_BINARY(OP_GT_FLOAT, BOTH_FLOAT, value_bool(a.data.f > b.data.f), vm_gt)
+            TYPED_BINARY(OP_GE_FLOAT, BOTH_FLOAT, value_bool(a.data.f >= b.data.f), vm_ge)
+            
             case OP_OUTPUT: {
                 Value v = vm_pop(vm);
                 vm_output(v);